@@ -3,8 +3,9 @@ from flask import Flask
 from sqlalchemy import create_engine
 from flask_cors import CORS
 
-from model import UserDao, TweetDao
-from service import UserService, TweetService
+from model import UserDao, TweetDao, RecentTweets, FollowGraph, ShardRouter, TweetSpool
+from service import UserService, TweetService, BulkImportService, PasswordHasher
+from cache import LRUCache, RedisCache
 from view import create_endpoints
 import boto3
 import botocore
@@ -12,7 +13,37 @@ import botocore
 class Services:
     pass
 
-def create_app(test_config=None):
+# CACHE_TYPE 설정에 따라 캐시 backend 선택 (local: 프로세스 내 LRU, redis: 노드 간 공유)
+# 용도마다 TTL이 다른 캐시를 만들 수 있도록 redis는 prefix로 구분
+def create_cache(app, ttl=None, size=None, prefix='miniter:'):
+    ttl = app.config.get('CACHE_TTL', 60) if ttl is None else ttl
+    if app.config.get('CACHE_TYPE', 'local') == 'redis':
+        return RedisCache(app.config['CACHE_REDIS_URL'], ttl, prefix)
+    return LRUCache(size or app.config.get('CACHE_SIZE', 10000), ttl)
+
+# POST 요청의 Idempotency-Key별 응답 저장소 (IDEMPOTENCY_TTL이 0이면 사용 안 함)
+# key는 처리 중 표시의 TTL(IDEMPOTENCY_LOCK_TTL)로 만들고 응답을 저장할 때 IDEMPOTENCY_TTL로 연장 (view.idempotent)
+def create_idempotency_store(app):
+    if not app.config.get('IDEMPOTENCY_TTL', 86400):
+        return None
+    return create_cache(
+        app,
+        app.config.get('IDEMPOTENCY_LOCK_TTL', 60),
+        app.config.get('IDEMPOTENCY_SIZE', 100000),
+        'miniter:idempotency:'
+    )
+
+# 로그인 시 없는 email을 기억하는 negative 캐시 (LOGIN_MISS_TTL이 0이면 사용 안 함)
+def create_login_miss_cache(app):
+    ttl = app.config.get('LOGIN_MISS_TTL', 0)
+    if not ttl:
+        return None
+    return create_cache(app, ttl, app.config.get('LOGIN_MISS_SIZE', 100000), 'miniter:login-miss:')
+
+# timeline_broker: Twisted로 실행할 때 /timeline/stream 구독자에게 새 tweet을 전달 (setup.py)
+# start_workers: 서버(runserver)로 실행할 때만 background worker(tweet spool)를 시작
+# (관리 명령은 spool 디렉터리를 잠그거나 drain thread를 띄우지 않음)
+def create_app(test_config=None, timeline_broker=None, start_workers=False):
     app = Flask(__name__)
     CORS(app)
 
@@ -21,11 +52,43 @@ def create_app(test_config=None):
     else:
         app.config.update(test_config)
     
-    database = create_engine(app.config['DB_URL'], encoding='utf-8', max_overflow=0)
+    # SHARD_DB_URLS가 있으면 사용자 id로 나눈 여러 DB(shard)를 사용
+    # DB_REPLICA_URLS(shard별로는 SHARD_REPLICA_URLS)가 있으면 읽기는 replica로
+    # 쓰기 후 primary에서 읽을 사용자(pin)는 캐시에 저장 (CACHE_TYPE이 redis면 노드 간 공유)
+    shard_urls = app.config.get('SHARD_DB_URLS') or [app.config['DB_URL']]
+    replica_urls = app.config.get('SHARD_REPLICA_URLS') or [app.config.get('DB_REPLICA_URLS') or []]
+    pin_seconds = app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+    database = ShardRouter(
+        [create_engine(url, encoding='utf-8', max_overflow=0) for url in shard_urls],
+        [[create_engine(url, encoding='utf-8', max_overflow=0) for url in urls] for urls in replica_urls],
+        pin_seconds,
+        create_cache(app, pin_seconds, app.config.get('READ_YOUR_WRITES_SIZE', 100000), 'miniter:pin:')
+    )
+    cache = create_cache(app)
 
     # persistence Layer
-    user_dao = UserDao(database)
-    tweet_dao = TweetDao(database)
+    fanout_threshold = app.config.get('FANOUT_FOLLOWER_THRESHOLD', 10000)
+    follow_graph = None
+    if app.config.get('FOLLOW_GRAPH'):
+        follow_graph = FollowGraph(
+            app.config.get('FOLLOW_GRAPH_PATH'),
+            app.config.get('FOLLOW_GRAPH_SNAPSHOT_INTERVAL', 300)
+        )
+        follow_graph.load(database.engines)
+    user_dao = UserDao(database, cache, fanout_threshold, follow_graph)
+    recent_tweets = RecentTweets(
+        app.config['RECENT_TWEETS_SIZE'],
+        app.config.get('RECENT_TWEETS_AUTHORS', 100000),
+        app.config.get('RECENT_TWEETS_TTL', 60)
+    ) if app.config.get('RECENT_TWEETS_SIZE') else None
+    tweet_dao = TweetDao(
+        database,
+        fanout_threshold,
+        recent_tweets,
+        follow_graph,
+        app.config.get('TWEET_BATCH_SIZE', 1),
+        app.config.get('TWEET_BATCH_DELAY', 0.005)
+    )
 
     #business Layer
     s3_client = boto3.client(
@@ -34,10 +97,42 @@ def create_app(test_config=None):
         aws_secret_access_key = app.config['S3_SECRET_KEY']
     )
     services = Services
-    services.user_service = UserService(user_dao, config, s3_client)
-    services.tweet_service = TweetService(tweet_dao)
+    # bcrypt는 BCRYPT_WORKERS개 thread에서만 실행하고 BCRYPT_QUEUE_SIZE개 넘게 밀리면 503
+    # BCRYPT_ROUNDS와 cost가 다른 저장된 hash는 로그인에 성공할 때 다시 hash
+    password_hasher = PasswordHasher(
+        app.config.get('BCRYPT_WORKERS'),
+        app.config.get('BCRYPT_QUEUE_SIZE'),
+        app.config.get('BCRYPT_ROUNDS', 12)
+    )
+    services.user_service = UserService(
+        user_dao,
+        config,
+        s3_client,
+        cache,
+        timeline_broker,
+        password_hasher,
+        create_login_miss_cache(app)
+    )
+    # TWEET_SPOOL_PATH가 있으면 POST /tweet은 spool에 기록 후 202로 응답 (한 디렉터리는 한 프로세스만 사용)
+    tweet_spool = TweetSpool(
+        app.config['TWEET_SPOOL_PATH'],
+        app.config.get('TWEET_SPOOL_FSYNC_INTERVAL', 0),
+        app.config.get('TWEET_SPOOL_SEGMENT_SIZE', 64 * 1024 * 1024),
+        app.config.get('TWEET_SPOOL_BATCH_SIZE', 100)
+    ) if start_workers and app.config.get('TWEET_SPOOL_PATH') else None
+    services.tweet_service = TweetService(tweet_dao, cache, timeline_broker, tweet_spool)
+    services.bulk_import_service = BulkImportService(user_dao, tweet_dao, password_hasher.rounds)
+    services.idempotency_store = create_idempotency_store(app)
+    # 검증한 access token 캐시 (jwt.decode보다 빨라야 하므로 항상 프로세스 내 LRU, TOKEN_CACHE_SIZE가 0이면 사용 안 함)
+    services.token_cache = LRUCache(
+        app.config.get('TOKEN_CACHE_SIZE', 10000),
+        app.config.get('TOKEN_CACHE_TTL', 300)
+    ) if app.config.get('TOKEN_CACHE_SIZE', 10000) else None
 
     # 엔드포인트들 생성
     create_endpoints(app, services)
 
+    # 관리 명령(setup.py)에서 사용
+    app.services = services
+
     return app
\ No newline at end of file
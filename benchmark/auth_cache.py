@@ -0,0 +1,67 @@
+"""
+login_required의 access token 검증 시간을 token 캐시 사용/미사용으로 비교 (DB 사용 안 함)
+active_users명이 요청을 보내고 일부 사용자가 요청 대부분을 보내는 분포(zipf)로 requests개의 요청을 만들어
+요청 한 개당 인증 시간(ms)과 그 시간으로 core 하나가 처리할 수 있는 초당 요청 수를 출력
+
+    python benchmark/auth_cache.py [active_users] [requests]
+"""
+import sys, random
+from datetime import datetime, timedelta
+
+import jwt
+from common import timed, report
+from flask import Flask, g
+from cache import LRUCache
+from view import login_required
+
+SECRET_KEY = 'benchmark'
+
+class Services:
+    pass
+
+def make_tokens(active_users):
+    return [jwt.encode({
+        'user_id' : user_id,
+        'exp'     : datetime.utcnow() + timedelta(seconds=60*60*24)
+    }, SECRET_KEY, 'HS256') for user_id in range(1, active_users + 1)]
+
+def main(active_users=1000, requests=20000):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET_KEY
+    app.services = Services()
+
+    @login_required
+    def endpoint():
+        return g.user_id
+
+    tokens   = make_tokens(active_users)
+    weights  = [1 / rank for rank in range(1, active_users + 1)]
+    requests = [tokens[i] for i in random.choices(range(active_users), weights, k=requests)]
+
+    # 요청마다 test_request_context를 만들고 login_required로 감싼 함수를 호출
+    def authenticate(token):
+        with app.test_request_context(headers={'Authorization' : token}):
+            endpoint()
+
+    rows = []
+    for name, token_cache in [
+        ('no cache',         None),
+        ('cache size=10000', LRUCache(10000, 300)),
+        ('cache size=100',   LRUCache(100, 300))
+    ]:
+        app.services.token_cache = token_cache
+        per_request = timed(authenticate, [(token,) for token in requests])
+        if token_cache is not None:
+            stats = token_cache.stats()
+            name  = f"{name} hit {stats['hits'] / (stats['hits'] + stats['misses']):.0%}"
+        rows.append((f'{name}, {1000 / per_request:,.0f} req/s', per_request))
+
+    # 인증 없이 request context만 만드는 시간 (위 결과에서 빼면 인증 시간)
+    def baseline(token):
+        with app.test_request_context(headers={'Authorization' : token}):
+            pass
+    rows.append(('request context only', timed(baseline, [(token,) for token in requests])))
+    report(f"login_required: {active_users} active users, {len(requests)} requests", rows)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,104 @@
+import sys, os, time, random
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+import config
+
+from sqlalchemy import create_engine, text
+
+# 벤치마크는 테스트 DB를 사용하며 실행할 때마다 테이블을 비운다.
+database = create_engine(config.test_config['DB_URL'], encoding='utf-8', max_overflow=0)
+
+def reset():
+    database.execute(text("SET FOREIGN_KEY_CHECKS=0"))
+    database.execute(text("TRUNCATE users"))
+    database.execute(text("TRUNCATE tweets"))
+    database.execute(text("TRUNCATE users_follow_list"))
+    database.execute(text("TRUNCATE timelines"))
+    database.execute(text("SET FOREIGN_KEY_CHECKS=1"))
+
+def chunks(rows, size=1000):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def seed_users(count):
+    for chunk in chunks(list(range(1, count + 1))):
+        database.execute(text("""
+            INSERT INTO users (
+                id,
+                name,
+                email,
+                profile,
+                hashed_password
+            ) VALUES (
+                :id,
+                :name,
+                :email,
+                'benchmark',
+                'x'
+            )
+        """), [{
+            'id'    : user_id,
+            'name'  : f'user{user_id}',
+            'email' : f'user{user_id}@bench.com'
+        } for user_id in chunk])
+
+def seed_follows(edges):
+    for chunk in chunks(edges):
+        database.execute(text("""
+            INSERT IGNORE INTO users_follow_list (
+                user_id,
+                follow_user_id
+            ) VALUES (
+                :user_id,
+                :follow_user_id
+            )
+        """), [{
+            'user_id'        : user_id,
+            'follow_user_id' : follow_id
+        } for user_id, follow_id in chunk])
+
+def random_follows(user_count, follow_count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (user_id, follow_id)
+        for user_id in range(1, user_count + 1)
+        for follow_id in rng.sample(range(1, user_count + 1), follow_count)
+        if follow_id != user_id
+    ]
+
+# 인기도가 power-law(Zipf)를 따르는 follow 그래프 (id가 작을수록 팔로워가 많음)
+def power_law_follows(user_count, follow_count, alpha=1.0, seed=0):
+    rng     = random.Random(seed)
+    authors = list(range(1, user_count + 1))
+    weights = [1 / rank ** alpha for rank in authors]
+
+    edges = []
+    for user_id in authors:
+        follows = set(rng.choices(authors, weights, k=follow_count))
+        follows.discard(user_id)
+        edges.extend((user_id, follow_id) for follow_id in follows)
+    return edges
+
+def update_follower_counts():
+    database.execute(text("""
+        UPDATE users u
+        SET follower_count = (
+            SELECT COUNT(*)
+            FROM users_follow_list ufl
+            WHERE ufl.follow_user_id = u.id
+        )
+    """))
+
+def count_rows(table):
+    return database.execute(text(f"SELECT COUNT(*) AS count FROM {table}")).fetchone()['count']
+
+# args_list의 인자로 fn을 실행한 평균 시간(ms)
+def timed(fn, args_list):
+    started = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - started) * 1000 / len(args_list)
+
+def report(title, rows):
+    print(title)
+    for name, value in rows:
+        print(f"  {name:<40} {value:10.3f} ms")
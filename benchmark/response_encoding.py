@@ -0,0 +1,44 @@
+"""
+timeline 응답의 JSON(jsonify + CustomJSONEncoder)과 protobuf(Accept: application/x-protobuf)
+인코딩 시간과 응답 크기 비교 (DB 사용 안 함)
+protobuf 인코딩 시간은 구현(python/cpp/upb)에 따라 크게 다르므로 함께 출력
+
+    python benchmark/response_encoding.py [page_size] [repeat]
+"""
+import sys
+
+from common import timed, report
+from flask import Flask, jsonify
+from google.protobuf.internal import api_implementation
+from view import CustomJSONEncoder
+from view.miniter_pb2 import Timeline
+
+def make_timeline(page_size):
+    return {
+        'user_id'     : 1,
+        'timeline'    : [{
+            'id'      : 1000000 - i,
+            'user_id' : 1 + i % 1000,
+            'tweet'   : f'벤치마크 tweet {i} ' * 5
+        } for i in range(page_size)],
+        'next_cursor' : 1000000 - page_size + 1
+    }
+
+def main(page_size=50, repeat=2000):
+    app = Flask(__name__)
+    app.json_encoder = CustomJSONEncoder
+    data = make_timeline(page_size)
+
+    with app.test_request_context():
+        json_body     = jsonify(data).get_data()
+        protobuf_body = Timeline(**data).SerializeToString()
+
+        report(f"timeline page_size={page_size}: "
+               f"json {len(json_body)} bytes, protobuf {len(protobuf_body)} bytes "
+               f"({len(protobuf_body) / len(json_body):.0%}), protobuf implementation={api_implementation.Type()}", [
+            ('encode: jsonify',                   timed(lambda: jsonify(data).get_data(), [()] * repeat)),
+            ('encode: Timeline.SerializeToString', timed(lambda: Timeline(**data).SerializeToString(), [()] * repeat)),
+        ])
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,58 @@
+"""
+follow 관계를 가져온 뒤의 timelines backfill: 전체 사용자 backfill, 가져온 팔로워만 backfill,
+가져온 follow 관계만 chunk 단위로 backfill(import_data follows) 비교
+user_count명이 tweet_count개의 tweet을 작성한 상태에서 imported명의 follow 관계를 새로 가져왔다고 가정
+
+    python benchmark/timeline_backfill.py [user_count] [follow_count] [tweet_count] [imported]
+"""
+import sys
+import time
+import random
+
+from common import database, reset, seed_users, seed_follows, random_follows, update_follower_counts, chunks
+from model import TweetDao
+from sqlalchemy import text
+
+def seed_tweets(user_count, tweet_count, seed=0):
+    rng = random.Random(seed)
+    for chunk in chunks([rng.randint(1, user_count) for _ in range(tweet_count)]):
+        database.execute(text("""
+            INSERT INTO tweets (
+                user_id,
+                tweet
+            ) VALUES (
+                :user_id,
+                'benchmark tweet'
+            )
+        """), [{'user_id' : user_id} for user_id in chunk])
+
+def backfill(backfill_fn):
+    database.execute(text("TRUNCATE timelines"))
+    started  = time.perf_counter()
+    inserted = backfill_fn()
+    return inserted, time.perf_counter() - started
+
+def main(user_count=10000, follow_count=50, tweet_count=100000, imported=100):
+    tweet_dao = TweetDao(database)
+
+    reset()
+    seed_users(user_count)
+    follows = random_follows(user_count, follow_count)
+    seed_follows(follows)
+    update_follower_counts()
+    seed_tweets(user_count, tweet_count)
+
+    imported_ids = random.Random(1).sample(range(1, user_count + 1), imported)
+    print(f"users={user_count} follows/user={follow_count} tweets={tweet_count} imported followers={imported}")
+    imported_set     = set(imported_ids)
+    imported_follows = [follow for follow in follows if follow[0] in imported_set]
+    for name, backfill_fn in [
+        ('all users',          lambda: tweet_dao.backfill_timelines()),
+        ('imported followers', lambda: tweet_dao.backfill_timelines(user_ids=imported_ids)),
+        ('imported follows',   lambda: sum(tweet_dao.backfill_follow_timelines(chunk) for chunk in chunks(imported_follows)))
+    ]:
+        inserted, elapsed = backfill(backfill_fn)
+        print(f"  {name:<20} {inserted:10d} rows {elapsed:8.3f} s {inserted / elapsed:12,.0f} rows/s")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,70 @@
+"""
+기존 JOIN 방식 timeline과 fan-out-on-write(timelines 테이블) 방식의
+tweet 쓰기 / timeline 읽기 비용 비교
+
+    python benchmark/timeline_fanout.py [user_count] [follow_count] [tweet_count]
+"""
+import sys
+import random
+
+from common import database, reset, seed_users, seed_follows, random_follows, timed, report
+from model import TweetDao
+from sqlalchemy import text
+
+def legacy_insert_tweet(user_id, tweet):
+    return database.execute(text("""
+        INSERT INTO tweets (
+            user_id,
+            tweet
+        ) VALUES (
+            :id,
+            :tweet
+        )
+    """), {
+        'id'    : user_id,
+        'tweet' : tweet
+    }).rowcount
+
+def legacy_get_timeline(user_id):
+    return database.execute(text("""
+        SELECT
+            t.user_id,
+            t.tweet
+        FROM tweets t
+        LEFT JOIN users_follow_list ufl ON ufl.user_id = :user_id
+        WHERE t.user_id = :user_id
+        OR t.user_id = ufl.follow_user_id
+    """), {
+        'user_id' : user_id
+    }).fetchall()
+
+def main(user_count=1000, follow_count=50, tweet_count=5000):
+    tweet_dao = TweetDao(database)
+    rng       = random.Random(0)
+
+    reset()
+    seed_users(user_count)
+    seed_follows(random_follows(user_count, follow_count))
+
+    tweets  = [(rng.randint(1, user_count), 'benchmark tweet') for _ in range(tweet_count)]
+    readers = [(rng.randint(1, user_count),) for _ in range(200)]
+
+    legacy_write = timed(legacy_insert_tweet, tweets)
+    legacy_read  = timed(legacy_get_timeline, readers)
+
+    reset()
+    seed_users(user_count)
+    seed_follows(random_follows(user_count, follow_count))
+
+    fanout_write = timed(tweet_dao.insert_tweet, tweets)
+    fanout_read  = timed(tweet_dao.get_timeline, readers)
+
+    report(f"users={user_count} follows/user={follow_count} tweets={tweet_count}", [
+        ('write: INSERT tweets',              legacy_write),
+        ('write: INSERT tweets + fan-out',    fanout_write),
+        ('read : JOIN users_follow_list',     legacy_read),
+        ('read : timelines range scan',       fanout_read),
+    ])
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,59 @@
+"""
+power-law follow 그래프에서 pure push(fan-out-on-write)와 hybrid push/pull의
+쓰기 증폭(tweet 1개당 timelines row 수), tweet 쓰기 시간, timeline 읽기 시간 비교
+
+    python benchmark/timeline_hybrid.py [user_count] [follow_count] [threshold]
+"""
+import sys
+import random
+
+from common import (database, reset, seed_users, seed_follows, power_law_follows,
+                    update_follower_counts, count_rows, timed, report)
+from model import TweetDao
+
+def run(tweet_dao, user_count, edges, celebrities, tweets, readers):
+    reset()
+    seed_users(user_count)
+    seed_follows(edges)
+    update_follower_counts()
+
+    celebrity_tweets = [(user_id, 'benchmark tweet') for user_id in celebrities]
+    write_celebrity  = timed(tweet_dao.insert_tweet, celebrity_tweets)
+    write_random     = timed(tweet_dao.insert_tweet, tweets)
+    amplification    = count_rows('timelines') / (len(celebrity_tweets) + len(tweets))
+    read             = timed(tweet_dao.get_timeline, readers)
+
+    return write_celebrity, write_random, amplification, read
+
+def main(user_count=5000, follow_count=50, threshold=500):
+    rng   = random.Random(0)
+    edges = power_law_follows(user_count, follow_count)
+
+    followers = {}
+    for _, follow_id in edges:
+        followers[follow_id] = followers.get(follow_id, 0) + 1
+    celebrities = [user_id for user_id, count in followers.items() if count > threshold]
+    if not celebrities:
+        celebrities = [max(followers, key=followers.get)]
+
+    tweets  = [(rng.randint(1, user_count), 'benchmark tweet') for _ in range(2000)]
+    readers = [(rng.randint(1, user_count), 50) for _ in range(500)]
+
+    print(f"users={user_count} follows/user={follow_count} threshold={threshold} "
+          f"authors above threshold={len(celebrities)} max followers={max(followers.values())}")
+
+    for name, tweet_dao in [
+        ('push',   TweetDao(database, fanout_threshold=user_count)),
+        ('hybrid', TweetDao(database, fanout_threshold=threshold)),
+    ]:
+        write_celebrity, write_random, amplification, read = run(
+            tweet_dao, user_count, edges, celebrities * 10, tweets, readers
+        )
+        report(f"{name}: {amplification:.1f} timeline rows per tweet", [
+            ('write: tweet by author above threshold', write_celebrity),
+            ('write: tweet by random author',          write_random),
+            ('read : get_timeline(limit=50)',          read),
+        ])
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,45 @@
+"""
+동시 요청의 tweet 저장을 batch로 모아 commit 하는 write-behind 모드(TweetDao batch_size)의
+batch 크기별 처리량 비교 (batch_size=1은 요청마다 commit)
+
+    python benchmark/tweet_batching.py [user_count] [follow_count] [writers] [tweets_per_writer]
+"""
+import sys
+import time
+import random
+import threading
+
+from common import database, reset, seed_users, seed_follows, random_follows, count_rows
+from model import TweetDao
+
+def run(tweet_dao, writers, tweets_per_writer, user_count):
+    def write(seed):
+        rng = random.Random(seed)
+        for _ in range(tweets_per_writer):
+            tweet_dao.insert_tweet(rng.randint(1, user_count), 'benchmark tweet')
+
+    threads = [threading.Thread(target=write, args=(seed,)) for seed in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return writers * tweets_per_writer / (time.perf_counter() - started)
+
+def main(user_count=1000, follow_count=20, writers=32, tweets_per_writer=100):
+    edges = random_follows(user_count, follow_count)
+    print(f"users={user_count} follows/user={follow_count} writers={writers} tweets/writer={tweets_per_writer}")
+
+    for batch_size in [1, 8, 32, 128]:
+        reset()
+        seed_users(user_count)
+        seed_follows(edges)
+
+        # app과 같은 connection pool(5개)을 쓰므로 batch_size=1은 connection 대기 시간도 포함
+        tweet_dao  = TweetDao(database, batch_size=batch_size)
+        throughput = run(tweet_dao, writers, tweets_per_writer, user_count)
+        print(f"  batch_size={batch_size:<4} {throughput:10.1f} tweets/s "
+              f"({count_rows('timelines') / (writers * tweets_per_writer):.1f} timeline rows per tweet)")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
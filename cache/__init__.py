@@ -0,0 +1,7 @@
+from .lru_cache import LRUCache
+from .redis_cache import RedisCache
+
+__all__ = [
+    'LRUCache',
+    'RedisCache'
+]
\ No newline at end of file
@@ -0,0 +1,94 @@
+import time
+import threading
+from collections import OrderedDict
+
+# 프로세스 내 LRU + TTL 캐시
+# key마다 field -> value hash를 저장하고 만료/삭제/eviction은 key 단위로 처리
+class LRUCache:
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size  = max_size
+        self.ttl       = ttl
+        self.entries   = OrderedDict()
+        self.lock      = threading.Lock()
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def get(self, key, field):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+
+            if entry is None or field not in entry[1]:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1][field]
+
+    # 여러 key의 같은 field를 한 번에 조회해서 keys 순서대로 반환 (없으면 None)
+    def get_many(self, keys, field):
+        return [self.get(key, field) for key in keys]
+
+    def set(self, key, field, value):
+        with self.lock:
+            self.store(key, field, value)
+
+    # field가 없을 때만 저장하고 저장했는지 반환
+    def add(self, key, field, value):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic() and field in entry[1]:
+                return False
+            self.store(key, field, value)
+            return True
+
+    # values({key: value}) 중 field가 없는 key에만 저장하고 {key: 저장되어 있는 값}을 반환
+    def add_many(self, field, values):
+        stored = {}
+        with self.lock:
+            for key, value in values.items():
+                entry = self.entries.get(key)
+                if entry is None or entry[0] <= time.monotonic() or field not in entry[1]:
+                    self.store(key, field, value)
+                    entry = self.entries.get(key)
+                stored[key] = entry[1][field] if entry is not None else value
+        return stored
+
+    # lock을 잡은 상태에서 호출
+    def store(self, key, field, value):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            entry = (time.monotonic() + self.ttl, {})
+            self.entries[key] = entry
+
+        entry[1][field] = value
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # key의 만료 시간을 지금부터 ttl초 후로 변경 (key가 없으면 무시)
+    def expire(self, key, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries[key] = (time.monotonic() + ttl, entry[1])
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size'      : len(self.entries),
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'evictions' : self.evictions
+            }
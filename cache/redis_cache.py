@@ -0,0 +1,100 @@
+import json
+import threading
+import redis
+
+# field를 저장하고 key에 TTL이 없을 때만 만료 시간을 설정 (첫 field 기준으로 만료)
+HSET_WITH_TTL = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+"""
+
+# field가 없을 때만 저장 (HSET_WITH_TTL과 같은 방식으로 만료 시간 설정), 저장했으면 1
+HSETNX_WITH_TTL = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+# HSETNX_WITH_TTL과 같지만 저장되어 있는 값(이미 있던 값 또는 새로 저장한 값)을 반환
+HSETNX_GET_WITH_TTL = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 1 and redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return redis.call('HGET', KEYS[1], ARGV[1])
+"""
+
+# 여러 app 노드가 공유하는 Redis 캐시 (LRUCache와 같은 인터페이스)
+# 크기 제한/eviction은 Redis 서버의 maxmemory 설정을 따른다.
+class RedisCache:
+    def __init__(self, url, ttl=60, prefix='miniter:'):
+        self.client     = redis.Redis.from_url(url)
+        self.ttl        = ttl
+        self.prefix     = prefix
+        self.hset       = self.client.register_script(HSET_WITH_TTL)
+        self.hsetnx     = self.client.register_script(HSETNX_WITH_TTL)
+        self.hsetnx_get = self.client.register_script(HSETNX_GET_WITH_TTL)
+        self.lock       = threading.Lock()
+        self.hits       = 0
+        self.misses     = 0
+
+    def get(self, key, field):
+        value = self.client.hget(self.prefix + key, field)
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    # pipeline으로 Redis 왕복 한 번
+    def get_many(self, keys, field):
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hget(self.prefix + key, field)
+        values = pipeline.execute() if keys else []
+
+        with self.lock:
+            self.hits   += sum(value is not None for value in values)
+            self.misses += sum(value is None for value in values)
+        return [json.loads(value) if value is not None else None for value in values]
+
+    def set(self, key, field, value):
+        self.hset(keys=[self.prefix + key], args=[field, json.dumps(value), self.ttl])
+
+    def add(self, key, field, value):
+        return self.hsetnx(keys=[self.prefix + key], args=[field, json.dumps(value), self.ttl]) == 1
+
+    def add_many(self, field, values):
+        if not values:
+            return {}
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in values.items():
+            self.hsetnx_get(keys=[self.prefix + key], args=[field, json.dumps(value), self.ttl], client=pipeline)
+        return {key : json.loads(value) for key, value in zip(values, pipeline.execute())}
+
+    def expire(self, key, ttl):
+        self.client.expire(self.prefix + key, ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    # Redis는 prefix별 key 수를 알려면 전체 key를 SCAN 해야 하므로 size는 제공하지 않음
+    # evictions는 Redis 서버 전체의 값 (같은 서버의 다른 prefix 캐시 포함)
+    def stats(self):
+        info = self.client.info('stats')
+
+        with self.lock:
+            return {
+                'size'      : None,
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'evictions' : info['evicted_keys']
+            }
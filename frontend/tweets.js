@@ -42,6 +42,19 @@ $(document).ready(function() {
         })
       }
     });
+
+    // 새 tweet 실시간 수신 (Server-Sent Events)
+    // tweet 내용은 HTML로 해석되지 않도록 text로 넣음
+    var source = new EventSource('http://localhost:5000/timeline/stream?access_token=' + encodeURIComponent(accessToken));
+    source.onmessage = function (event) {
+      var item = JSON.parse(event.data);
+
+      $('.timeline-container')
+        .prepend($('<div class="card">').append(
+          $('<div class="card-body">').append(
+            $('<h5 class="card-title">').text(item.user_id),
+            $('<p class="card-text">').text(item.tweet))))
+    };
   } else {
     alert('로그인이 필요합니다.');
     window.location.href = './login.html';
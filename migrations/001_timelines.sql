@@ -0,0 +1,10 @@
+-- 사용자별 home timeline (fan-out-on-write)
+-- insert_tweet 시 작성자 본인과 팔로워들의 timeline에 tweet id를 push 한다.
+CREATE TABLE timelines (
+    user_id INT NOT NULL,
+    tweet_id INT NOT NULL,
+    PRIMARY KEY (user_id, tweet_id)
+);
+
+-- fan-out 대상(팔로워) 조회용
+CREATE INDEX users_follow_list_follow_user_id ON users_follow_list (follow_user_id, user_id);
@@ -0,0 +1,3 @@
+-- 작성자별 최신 tweet 조회(follow 시 timeline 채우기, 작성자별 index seek)용
+-- InnoDB secondary index는 PK(id)를 포함하므로 (user_id, id) 순서로 정렬된 covering index가 된다.
+CREATE INDEX tweets_user_id_id ON tweets (user_id, id);
@@ -0,0 +1,9 @@
+-- hybrid push/pull timeline: 팔로워 수가 FANOUT_FOLLOWER_THRESHOLD 보다 많은 작성자는 pull
+ALTER TABLE users ADD COLUMN follower_count INT NOT NULL DEFAULT 0;
+
+UPDATE users u
+SET follower_count = (
+    SELECT COUNT(*)
+    FROM users_follow_list ufl
+    WHERE ufl.follow_user_id = u.id
+);
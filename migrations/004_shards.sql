@@ -0,0 +1,7 @@
+-- shard가 여러 개인 경우(SHARD_DB_URLS)에만 각 shard에 적용
+-- follow 관계는 팔로우 하는 사용자의 shard에 저장되므로 follow_user_id가 같은 shard의 users에 없을 수 있다.
+ALTER TABLE users_follow_list DROP FOREIGN KEY users_follow_list_follow_user_id_fkey;
+
+-- shard 간 timeline은 (created_at, id) 순서로 합치므로 작성자별 (created_at, id) 순서 index seek용
+-- InnoDB secondary index는 PK(id)를 포함하므로 (user_id, created_at, id) 순서가 된다.
+CREATE INDEX tweets_user_id_created_at ON tweets (user_id, created_at);
@@ -0,0 +1,5 @@
+-- TWEET_SPOOL_PATH(비동기 tweet)를 사용하는 경우
+-- spool record마다 고유한 key를 저장해서 spool을 다시 처리해도 tweet이 한 번만 저장되도록 한다.
+-- (NULL은 unique index에서 중복으로 보지 않으므로 spool을 거치지 않은 tweet은 NULL)
+ALTER TABLE tweets ADD COLUMN spool_key CHAR(32) NULL;
+CREATE UNIQUE INDEX tweets_spool_key ON tweets (spool_key);
@@ -1,7 +1,17 @@
 from .tweet_dao import TweetDao
 from .user_dao import UserDao
+from .recent_tweets import RecentTweets
+from .follow_graph import FollowGraph
+from .shard_router import ShardRouter
+from .tweet_spool import TweetSpool
+from .tweet_batcher import PartialInsertError
 
 __all__ = [
     'UserDao', 
-    'TweetDao'
+    'TweetDao',
+    'RecentTweets',
+    'FollowGraph',
+    'ShardRouter',
+    'TweetSpool',
+    'PartialInsertError'
 ]
\ No newline at end of file
@@ -0,0 +1,258 @@
+import os
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+from sqlalchemy import text
+
+# 행(user_id)별로 정렬된 id 목록을 indptr/indices 두 배열로 담는 CSR 인접 행렬
+class CSR:
+    def __init__(self, indptr, indices):
+        self.indptr  = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_edges(cls, rows, columns):
+        order   = np.lexsort((columns, rows))
+        size    = int(rows.max()) + 1 if len(rows) else 0
+        indptr  = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+        return cls(indptr, np.ascontiguousarray(columns[order], dtype=np.int64))
+
+    def row(self, i):
+        if i < 0 or i + 1 >= len(self.indptr):
+            return self.indices[:0]
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def contains(self, i, j):
+        row      = self.row(i)
+        position = np.searchsorted(row, j)
+        return position < len(row) and row[position] == j
+
+    def edges(self):
+        rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        return rows, np.asarray(self.indices)
+
+# users_follow_list 전체를 메모리에 올린 follow 그래프
+# CSR(followees: 사용자 -> 팔로우 중인 id, followers: 사용자 -> 팔로워 id)은 바꾸지 않고
+# 이후의 follow/unfollow는 added/removed에 모아 두었다가 snapshot 할 때 CSR을 다시 만든다.
+# path가 있으면 snapshot을 path/<generation>/*.npy 로 저장하고 mmap으로 읽으며,
+# snapshot 이후의 변경은 같은 디렉터리의 journal에 기록(fsync)해 재시작할 때 다시 적용한다.
+# snapshot_interval마다 snapshot은 별도 thread에서 만들고 lock은 edge 복사와 교체할 때만 잡는다.
+# 이 노드의 insert_follow/insert_unfollow만 반영되므로 쓰기가 한 노드에서만 일어날 때 사용한다.
+class FollowGraph:
+    def __init__(self, path=None, snapshot_interval=300):
+        self.path              = path
+        self.snapshot_interval = snapshot_interval
+        self.lock              = threading.Lock()
+        self.snapshotting      = False
+        self.changes           = None # snapshot을 만드는 동안의 변경 [(op, user_id, follow_id)]
+        self.journal           = None
+        self.reset(CSR.from_edges(*empty_edges()), CSR.from_edges(*empty_edges()))
+
+    def reset(self, followees, followers, generation=0):
+        if self.journal is not None:
+            self.journal.close()
+        self.followees    = followees
+        self.followers    = followers
+        self.added        = {} # user_id -> 스냅샷 이후 팔로우한 id 집합
+        self.added_by     = {} # user_id -> 스냅샷 이후 생긴 팔로워 id 집합
+        self.removed      = set() # 스냅샷 이후 unfollow 한 CSR의 (user_id, follow_id)
+        self.generation   = generation
+        self.snapshot_at  = time.monotonic()
+        self.journal      = None
+        if self.path is not None and generation:
+            self.journal = open(os.path.join(self.path, str(generation), 'journal'), 'a')
+
+    # snapshot이 있으면 mmap으로 읽고 journal을 적용, 없으면 (모든 shard의) 테이블 전체를 읽고 snapshot 생성
+    def load(self, engines):
+        generation = self.current_generation()
+        if generation is None:
+            return self.load_table(engines)
+
+        directory = os.path.join(self.path, str(generation))
+        arrays    = {
+            name : np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            for name in ['followees_indptr', 'followees_indices', 'followers_indptr', 'followers_indices']
+        }
+        with self.lock:
+            self.reset(
+                CSR(arrays['followees_indptr'], arrays['followees_indices']),
+                CSR(arrays['followers_indptr'], arrays['followers_indices']),
+                generation
+            )
+            with open(os.path.join(directory, 'journal')) as journal:
+                for line in journal:
+                    op, user_id, follow_id = line.split()
+                    self.apply(op, int(user_id), int(follow_id))
+
+    def load_table(self, engines):
+        edges = np.array([(row['user_id'], row['follow_user_id']) for engine in engines for row in engine.execute(text("""
+            SELECT user_id, follow_user_id
+            FROM users_follow_list
+        """))], dtype=np.int64).reshape(-1, 2)
+
+        with self.lock:
+            self.build(edges[:, 0], edges[:, 1])
+
+    def follow(self, user_id, follow_id):
+        self.write('+', user_id, follow_id)
+
+    def unfollow(self, user_id, unfollow_id):
+        self.write('-', user_id, unfollow_id)
+
+    def write(self, op, user_id, follow_id):
+        with self.lock:
+            self.apply(op, user_id, follow_id)
+            if self.changes is not None:
+                self.changes.append((op, user_id, follow_id))
+            if self.journal is None:
+                return
+
+            # DB에 commit 된 follow가 전원이 꺼져도 남도록 fsync
+            self.journal.write(f'{op} {user_id} {follow_id}\n')
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+            due = not self.snapshotting and time.monotonic() - self.snapshot_at >= self.snapshot_interval
+            if due:
+                self.snapshotting = True
+
+        if due:
+            threading.Thread(target=self.build_snapshot, daemon=True).start()
+
+    def apply(self, op, user_id, follow_id):
+        in_csr = self.followees.contains(user_id, follow_id)
+        if op == '+':
+            if in_csr:
+                self.removed.discard((user_id, follow_id))
+            else:
+                self.added.setdefault(user_id, set()).add(follow_id)
+                self.added_by.setdefault(follow_id, set()).add(user_id)
+        else:
+            if in_csr:
+                self.removed.add((user_id, follow_id))
+            else:
+                self.added.get(user_id, set()).discard(follow_id)
+                self.added_by.get(follow_id, set()).discard(user_id)
+
+    def get_followee_ids(self, user_id):
+        with self.lock:
+            return [
+                follow_id for follow_id in self.followees.row(user_id).tolist()
+                if (user_id, follow_id) not in self.removed
+            ] + list(self.added.get(user_id, ()))
+
+    def get_follower_ids(self, user_id):
+        with self.lock:
+            return [
+                follower_id for follower_id in self.followers.row(user_id).tolist()
+                if (follower_id, user_id) not in self.removed
+            ] + list(self.added_by.get(user_id, ()))
+
+    # CSR과 변경분을 합친 전체 (user_id, follow_id) 배열
+    def edges(self):
+        rows, columns = self.followees.edges()
+        if self.removed:
+            removed = np.array([edge_key(*edge) for edge in self.removed], dtype=np.int64)
+            kept    = ~np.isin(edge_key(rows, columns), removed)
+            rows, columns = rows[kept], columns[kept]
+
+        added = np.array([
+            (user_id, follow_id) for user_id, ids in self.added.items() for follow_id in ids
+        ], dtype=np.int64).reshape(-1, 2)
+        return np.concatenate([rows, added[:, 0]]), np.concatenate([columns, added[:, 1]])
+
+    # 새 CSR을 만들고 path가 있으면 새 generation으로 snapshot (load할 때, lock을 잡은 상태에서 호출)
+    def build(self, rows, columns):
+        followees = CSR.from_edges(rows, columns)
+        followers = CSR.from_edges(columns, rows)
+        if self.path is None:
+            return self.reset(followees, followers)
+        self.switch(followees, followers, self.save(followees, followers))
+
+    def snapshot(self):
+        with self.lock:
+            if self.snapshotting:
+                return
+            self.snapshotting = True
+        self.build_snapshot()
+
+    # edge 복사만 lock 안에서 하고 CSR 생성과 저장은 lock 밖에서
+    # 그동안의 follow/unfollow는 changes에 모았다가 새 CSR과 새 journal에 다시 적용
+    def build_snapshot(self):
+        try:
+            with self.lock:
+                rows, columns = self.edges()
+                self.changes  = []
+
+            followees  = CSR.from_edges(rows, columns)
+            followers  = CSR.from_edges(columns, rows)
+            generation = self.save(followees, followers) if self.path is not None else None
+
+            with self.lock:
+                changes = self.changes
+                if generation is None:
+                    self.reset(followees, followers)
+                else:
+                    with open(os.path.join(self.path, str(generation), 'journal'), 'a') as journal:
+                        journal.writelines(f'{op} {user_id} {follow_id}\n' for op, user_id, follow_id in changes)
+                        journal.flush()
+                        os.fsync(journal.fileno())
+                    self.switch(followees, followers, generation)
+                for change in changes:
+                    self.apply(*change)
+        except Exception:
+            logging.exception('failed to snapshot follow graph')
+        finally:
+            with self.lock:
+                self.changes      = None
+                self.snapshotting = False
+                self.snapshot_at  = time.monotonic()
+
+    # 새 generation 디렉터리에 CSR 배열과 빈 journal을 저장(fsync)하고 generation 반환
+    def save(self, followees, followers):
+        generation = (self.current_generation() or 0) + 1
+        directory  = os.path.join(self.path, str(generation))
+        os.makedirs(directory, exist_ok=True)
+        for name, array in [
+            ('followees_indptr',  followees.indptr),
+            ('followees_indices', followees.indices),
+            ('followers_indptr',  followers.indptr),
+            ('followers_indices', followers.indices)
+        ]:
+            with open(os.path.join(directory, f'{name}.npy'), 'wb') as f:
+                np.save(f, array)
+                f.flush()
+                os.fsync(f.fileno())
+        open(os.path.join(directory, 'journal'), 'w').close()
+        return generation
+
+    # CURRENT 파일 교체로 snapshot 전환 (중간에 종료되어도 이전 snapshot + journal이 남음, lock을 잡은 상태에서 호출)
+    def switch(self, followees, followers, generation):
+        previous = self.current_generation()
+        with open(os.path.join(self.path, 'CURRENT.tmp'), 'w') as current:
+            current.write(str(generation))
+            current.flush()
+            os.fsync(current.fileno())
+        os.replace(os.path.join(self.path, 'CURRENT.tmp'), os.path.join(self.path, 'CURRENT'))
+
+        self.reset(followees, followers, generation)
+        if previous is not None:
+            shutil.rmtree(os.path.join(self.path, str(previous)), ignore_errors=True)
+
+    def current_generation(self):
+        if self.path is None:
+            return None
+        try:
+            with open(os.path.join(self.path, 'CURRENT')) as current:
+                return int(current.read())
+        except FileNotFoundError:
+            return None
+
+def edge_key(user_id, follow_id):
+    return (user_id << 32) | follow_id
+
+def empty_edges():
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
@@ -0,0 +1,116 @@
+import time
+import heapq
+import threading
+from array import array
+from collections import OrderedDict
+
+# 작성자 한 명의 최근 tweet id/작성 시각을 담는 고정 크기 ring buffer
+class AuthorRing:
+    def __init__(self, capacity, complete):
+        self.ids        = array('q', bytes(8 * capacity))
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.head       = 0 # 다음에 쓸 위치
+        self.count      = 0
+        # 작성자의 tweet이 모두 buffer 안에 있는지 (오래된 tweet을 SQL로 읽을 필요가 없는지)
+        self.complete   = complete
+        self.loaded_at  = time.monotonic()
+
+    def append(self, tweet_id, timestamp):
+        capacity = len(self.ids)
+        if self.count == capacity:
+            self.complete = False
+        else:
+            self.count += 1
+
+        self.ids[self.head]        = tweet_id
+        self.timestamps[self.head] = timestamp
+        self.head = (self.head + 1) % capacity
+
+    # 최신 tweet부터 (tweet_id, timestamp)
+    def newest_first(self):
+        capacity = len(self.ids)
+        for i in range(1, self.count + 1):
+            position = (self.head - i) % capacity
+            yield self.ids[position], self.timestamps[position]
+
+# 활성 작성자들의 AuthorRing을 LRU로 관리
+# 다른 app 노드에서 작성된 tweet은 보이지 않으므로 ttl이 지난 buffer는 다시 읽어 온다.
+class RecentTweets:
+    def __init__(self, capacity=100, max_authors=100000, ttl=60):
+        self.capacity    = capacity
+        self.max_authors = max_authors
+        self.ttl         = ttl
+        self.rings       = OrderedDict()
+        self.lock        = threading.Lock()
+
+    # SQL에서 읽어 온 작성자의 최신 tweet들(최신순)로 buffer를 채움
+    def load(self, author_id, tweets):
+        ring = AuthorRing(self.capacity, complete=len(tweets) < self.capacity)
+        for tweet_id, timestamp in reversed(tweets[:self.capacity]):
+            ring.append(tweet_id, timestamp)
+
+        with self.lock:
+            self.rings[author_id] = ring
+            self.rings.move_to_end(author_id)
+            while len(self.rings) > self.max_authors:
+                self.rings.popitem(last=False)
+
+    # buffer가 있는 작성자에게만 추가 (없으면 다음에 읽을 때 SQL에서 채움)
+    def append(self, author_id, tweet_id, timestamp):
+        with self.lock:
+            ring = self.rings.get(author_id)
+            if ring is None:
+                return
+            # 동시에 작성된 tweet이 순서가 바뀌어 들어오면 buffer를 버리고 다시 읽음
+            if ring.count and tweet_id < next(ring.newest_first())[0]:
+                del self.rings[author_id]
+            else:
+                ring.append(tweet_id, timestamp)
+
+    def discard(self, *author_ids):
+        with self.lock:
+            for author_id in author_ids:
+                self.rings.pop(author_id, None)
+
+    # buffer가 없거나 ttl이 지난 작성자들
+    def missing(self, author_ids):
+        now = time.monotonic()
+        with self.lock:
+            return [
+                author_id for author_id in author_ids
+                if author_id not in self.rings or now - self.rings[author_id].loaded_at >= self.ttl
+            ]
+
+    # 작성자들의 buffer를 k-way heap merge 해서 before보다 오래되고 since보다 새로운 tweet을 최신순으로 limit개
+    # buffer만으로 구간을 채울 수 없으면 None (SQL로 읽어야 함)
+    def merge(self, author_ids, limit=None, before=None, since=None):
+        with self.lock:
+            heap = []
+            for author_id in author_ids:
+                ring = self.rings.get(author_id)
+                if ring is None:
+                    return None
+                if not push_next(heap, author_id, ring, ring.newest_first(), before, since) and not ring.complete:
+                    return None
+                self.rings.move_to_end(author_id)
+
+            merged = []
+            while heap and (limit is None or len(merged) < limit):
+                negative_id, timestamp, author_id, ring, tweets = heapq.heappop(heap)
+                merged.append((-negative_id, author_id, timestamp))
+                if not push_next(heap, author_id, ring, tweets, before, since) and not ring.complete:
+                    # 이 작성자의 buffer보다 오래된 tweet이 더 있을 수 있음
+                    if limit is None or len(merged) < limit:
+                        return None
+            return merged
+
+# 작성자의 다음 tweet(before보다 오래된)을 heap에 추가
+# since 이하에 도달하면 더 읽을 필요가 없으므로 True, buffer를 다 읽었으면 False
+def push_next(heap, author_id, ring, tweets, before, since=None):
+    for tweet_id, timestamp in tweets:
+        if since is not None and tweet_id <= since:
+            return True
+        if before is None or tweet_id < before:
+            heapq.heappush(heap, (-tweet_id, timestamp, author_id, ring, tweets))
+            return True
+    return False
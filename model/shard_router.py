@@ -0,0 +1,94 @@
+import time
+import heapq
+import random
+import threading
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+
+# user_id로 DB engine(shard)을 선택
+# shard i의 auto_increment는 offset i + 1, increment len(engines)로 설정해서
+# 새 사용자/tweet id가 shard 간에 겹치지 않고 (id - 1) % len(engines) == i 가 되도록 한다.
+# replicas(shard별 replica engine 목록)가 있으면 읽기는 replica로 보내되,
+# 쓰기를 한 사용자의 읽기는 pin_seconds 동안 primary로 보내서 자기가 쓴 내용이 바로 보이게 한다.
+# pins(TTL이 pin_seconds인 캐시)가 있으면 pin을 캐시에 저장해서 다른 app 노드로 간 요청에도 적용되고,
+# 없으면 이 프로세스 안에서만 적용된다.
+class ShardRouter:
+    def __init__(self, engines, replicas=None, pin_seconds=5, pins=None):
+        self.engines     = list(engines)
+        self.replicas    = {
+            engine : list(shard_replicas) for engine, shard_replicas in zip(self.engines, replicas or []) if shard_replicas
+        }
+        self.pin_seconds = pin_seconds
+        self.pins        = pins
+        self.pinned      = {} # pins가 없을 때: user_id -> primary에서 읽어야 하는 시각(monotonic)까지
+        self.expiries    = [] # pinned의 (만료 시각, user_id) heap
+        self.next        = count()
+        self.lock        = threading.Lock()
+        self.executor    = ThreadPoolExecutor(max_workers=len(self.engines)) if len(self.engines) > 1 else None
+
+    def __len__(self):
+        return len(self.engines)
+
+    # 쓰기용 (primary)
+    def engine(self, user_id):
+        return self.engines[(user_id - 1) % len(self.engines)]
+
+    # user_id의 shard에서 읽기용
+    def read_engine(self, user_id):
+        return self.reader(self.engine(user_id), user_id)
+
+    # primary engine의 shard에서 읽기용: user_ids 중 최근에 쓴 사용자가 있으면 primary, 아니면 replica 중 하나
+    def reader(self, engine, *user_ids):
+        replicas = self.replicas.get(engine)
+        if not replicas:
+            return engine
+
+        if any(self.is_pinned(user_id) for user_id in user_ids):
+            return engine
+        return random.choice(replicas)
+
+    def is_pinned(self, user_id):
+        if self.pins is not None:
+            return self.pins.get(str(user_id), 'pinned') is not None
+        return self.pinned.get(user_id, 0) > time.monotonic()
+
+    # user_id가 쓰기를 했으므로 당분간 primary에서 읽음
+    def pin(self, user_id):
+        if not self.replicas:
+            return
+
+        # 캐시의 TTL은 key를 처음 저장할 때 정해지므로 다시 pin 하면 삭제 후 저장해서 TTL을 새로 시작
+        if self.pins is not None:
+            self.pins.delete(str(user_id))
+            self.pins.set(str(user_id), 'pinned', 1)
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            self.pinned[user_id] = now + self.pin_seconds
+            heapq.heappush(self.expiries, (now + self.pin_seconds, user_id))
+
+            # 만료된 pin 정리 (다시 pin 해서 만료 시각이 바뀐 사용자는 남겨 둠)
+            while self.expiries and self.expiries[0][0] <= now:
+                until, expired_id = heapq.heappop(self.expiries)
+                if self.pinned.get(expired_id) == until:
+                    del self.pinned[expired_id]
+
+    # 새 사용자를 저장할 shard (순서대로 돌아가며)
+    def new_user_engine(self):
+        with self.lock:
+            return self.engines[next(self.next) % len(self.engines)]
+
+    # user_id들을 shard별로 묶음 {engine: [user_id, ...]}
+    def group(self, user_ids):
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(self.engine(user_id), []).append(user_id)
+        return groups
+
+    # shard별 조회를 병렬로 실행하고 결과를 순서대로 반환
+    def map(self, fn, items):
+        items = list(items)
+        if self.executor is None or len(items) < 2:
+            return [fn(item) for item in items]
+        return list(self.executor.map(fn, items))
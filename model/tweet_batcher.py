@@ -0,0 +1,69 @@
+import time
+import threading
+from concurrent.futures import Future
+
+# shard가 여러 개일 때 insert_tweets의 일부 shard만 실패 (나머지 shard의 tweet은 commit 됨)
+# tweet_ids는 입력 순서대로 저장된 tweet id, 실패한 shard의 tweet은 None
+class PartialInsertError(Exception):
+    def __init__(self, tweet_ids, error):
+        super().__init__(f'{tweet_ids.count(None)} of {len(tweet_ids)} tweets failed: {error!r}')
+        self.tweet_ids = tweet_ids
+        self.error     = error
+
+# 동시에 들어온 tweet 저장 요청을 모아 batch로 저장 (write-behind)
+# batch_size개가 모이거나 첫 요청 후 max_delay초가 지나면 insert_tweets로 한 번에 commit 하고,
+# 각 요청은 자기 tweet이 들어간 batch가 commit 된 뒤에 tweet id를 받는다.
+class TweetBatcher:
+    def __init__(self, insert_tweets, batch_size=100, max_delay=0.005):
+        self.insert_tweets = insert_tweets
+        self.batch_size    = batch_size
+        self.max_delay     = max_delay
+        self.pending       = [] # (user_id, tweet, Future)
+        self.condition     = threading.Condition()
+        self.thread        = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, user_id, tweet):
+        future = Future()
+        with self.condition:
+            self.pending.append((user_id, tweet, future))
+            self.condition.notify()
+        return future.result()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+
+                deadline = time.monotonic() + self.max_delay
+                while len(self.pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch        = self.pending[:self.batch_size]
+                self.pending = self.pending[self.batch_size:]
+
+            self.flush(batch)
+
+    def flush(self, batch):
+        try:
+            tweet_ids = self.insert_tweets([(user_id, tweet) for user_id, tweet, _ in batch])
+        except PartialInsertError as e:
+            # commit 된 shard의 tweet은 그대로 응답하고 실패한 shard의 tweet만 다시 저장 (중복 저장 방지)
+            for (_, _, future), tweet_id in zip(batch, e.tweet_ids):
+                if tweet_id is not None:
+                    future.set_result(tweet_id)
+            return self.flush([item for item, tweet_id in zip(batch, e.tweet_ids) if tweet_id is None])
+        except Exception as e:
+            # batch 중 하나 때문에 실패했을 수 있으므로 하나씩 다시 저장해서 실패한 요청에만 오류 전달
+            if len(batch) == 1:
+                return batch[0][2].set_exception(e)
+            for item in batch:
+                self.flush([item])
+            return
+
+        for (_, _, future), tweet_id in zip(batch, tweet_ids):
+            future.set_result(tweet_id)
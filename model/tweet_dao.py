@@ -1,37 +1,681 @@
-from sqlalchemy import text
+import time
+import heapq
+import logging
+from itertools import islice
+from sqlalchemy import text, bindparam
+from .shard_router import ShardRouter
+from .tweet_batcher import TweetBatcher, PartialInsertError
 
 class TweetDao:
-    def __init__(self, database):
-        self.db = database
+    # 팔로워 수가 fanout_threshold 보다 많은 작성자의 tweet은 팔로워 timeline에 push 하지 않고
+    # 읽을 때 pull 해서 합친다.
+    # recent_tweets(RecentTweets)가 있으면 timeline을 작성자별 최근 tweet buffer에서 먼저 조립한다.
+    # follow_graph(FollowGraph)가 있으면 팔로워/팔로우 목록을 SQL 대신 그래프에서 읽는다.
+    # database가 ShardRouter이고 shard가 여러 개면 tweet은 작성자의 shard에 저장하고
+    # timeline은 timelines 없이 작성자들의 shard에서 병렬로 pull 해서 합친다.
+    # batch_size가 1보다 크면 동시에 들어온 insert_tweet을 모아 batch로 commit 한다. (TweetBatcher)
+    def __init__(self, database, fanout_threshold=10000, recent_tweets=None, follow_graph=None,
+                 batch_size=1, batch_delay=0.005):
+        self.shards = database if isinstance(database, ShardRouter) else ShardRouter([database])
+        self.db = self.shards.engines[0] # shard가 하나일 때의 engine
+        self.fanout_threshold = fanout_threshold
+        self.recent_tweets = recent_tweets
+        self.follow_graph = follow_graph
+        self.batcher = TweetBatcher(self.insert_tweets, batch_size, batch_delay) if batch_size > 1 else None
 
+    # tweet 저장 후 작성자 본인과 (push 대상인 경우) 팔로워들의 timeline에 push, 새 tweet id 반환
     def insert_tweet(self, user_id, tweet):
-        return self.db.execute(text("""
-            INSERT INTO tweets (
+        if self.batcher is not None:
+            return self.batcher.submit(user_id, tweet)
+
+        with self.shards.engine(user_id).begin() as conn:
+            result = conn.execute(text("""
+                INSERT INTO tweets (
+                    user_id,
+                    tweet
+                ) VALUES (
+                    :id,
+                    :tweet
+                )
+            """), {
+                'id'    : user_id,
+                'tweet' : tweet
+            })
+
+            if len(self.shards) == 1:
+                conn.execute(text("""
+                    INSERT INTO timelines (
+                        user_id,
+                        tweet_id
+                    )
+                    SELECT :id, :tweet_id
+                    UNION
+                    SELECT user_id, :tweet_id
+                    FROM users_follow_list
+                    WHERE follow_user_id = :id
+                    AND (SELECT follower_count FROM users WHERE id = :id) <= :threshold
+                """), {
+                    'id'        : user_id,
+                    'tweet_id'  : result.lastrowid,
+                    'threshold' : self.fanout_threshold
+                })
+
+        self.inserted(user_id, result.lastrowid, time.time())
+        return result.lastrowid
+
+    # commit 한 뒤의 처리 (read-your-writes pin, 최근 tweet buffer)
+    # tweet은 이미 저장되었으므로 pin(CACHE_TYPE이 redis면 Redis)이 실패해도 예외를 올리지 않음
+    # (호출자/TweetBatcher가 같은 tweet을 다시 저장하지 않도록, pin이 없으면 잠시 replica에서 읽을 뿐)
+    def inserted(self, user_id, tweet_id, timestamp):
+        try:
+            self.shards.pin(user_id)
+        except Exception:
+            logging.exception('failed to pin user %s', user_id)
+
+        # (RecentTweets는 프로세스 내 buffer라서 실패하지 않음)
+        if self.recent_tweets is not None:
+            self.recent_tweets.append(user_id, tweet_id, timestamp)
+
+    # 여러 tweet을 shard마다 multi-row INSERT 한 번과 fan-out 한 번으로 저장, 입력 순서대로 tweet id 반환
+    # InnoDB는 row 수가 정해진 INSERT 문(simple insert)의 row들에 연속된 auto_increment 값을 할당하므로
+    # 첫 id(lastrowid)부터 auto_increment_increment(shard 수) 간격으로 id가 매겨진다.
+    # shard마다 따로 commit 하므로 일부 shard만 실패하면 PartialInsertError (commit 된 tweet을 다시 저장하지 않도록)
+    # keys(tweet마다 고유한 spool record key)가 있으면 tweets.spool_key로 저장하고, 이미 저장된 key의 tweet은
+    # 다시 저장하지 않고 저장된 id를 반환 (spool을 다시 처리해도 한 번만 저장)
+    # INSERT IGNORE는 건너뛴 row 때문에 lastrowid로 id를 계산할 수 없으므로 먼저 저장된 key를 조회한다.
+    def insert_tweets(self, tweets, keys=None):
+        groups = {}
+        for i, (user_id, _) in enumerate(tweets):
+            groups.setdefault(self.shards.engine(user_id), []).append(i)
+
+        def insert(group):
+            try:
+                return insert_group(*group)
+            except Exception as e:
+                return e
+
+        def insert_group(engine, indexes):
+            with engine.begin() as conn:
+                saved = {}
+                if keys is not None:
+                    saved = {row['spool_key'] : row['id'] for row in conn.execute(text("""
+                        SELECT id, spool_key
+                        FROM tweets
+                        WHERE spool_key IN :keys
+                    """).bindparams(bindparam('keys', expanding=True)), {
+                        'keys' : [keys[i] for i in indexes]
+                    }).fetchall()}
+
+                new    = [i for i in indexes if keys is None or keys[i] not in saved]
+                result = {i : (saved[keys[i]], False) for i in indexes if i not in new}
+                if not new:
+                    return [result[i] for i in indexes]
+
+                params = {}
+                values = []
+                for n, i in enumerate(new):
+                    params[f'user_{n}'], params[f'tweet_{n}'] = tweets[i]
+                    if keys is not None:
+                        params[f'key_{n}'] = keys[i]
+                    values.append(f"(:user_{n}, :tweet_{n}{f', :key_{n}' if keys is not None else ''})")
+
+                first_id = conn.execute(text(f"""
+                    INSERT INTO tweets (
+                        user_id,
+                        tweet
+                        {", spool_key" if keys is not None else ""}
+                    ) VALUES {", ".join(values)}
+                """), params).lastrowid
+                tweet_ids = [first_id + n * len(self.shards) for n in range(len(new))]
+                result.update({i : (tweet_id, True) for i, tweet_id in zip(new, tweet_ids)})
+
+                if len(self.shards) == 1:
+                    conn.execute(text("""
+                        INSERT INTO timelines (
+                            user_id,
+                            tweet_id
+                        )
+                        SELECT user_id, id
+                        FROM tweets
+                        WHERE id BETWEEN :first_id AND :last_id
+                        UNION
+                        SELECT ufl.user_id, t.id
+                        FROM tweets t
+                        JOIN users u ON u.id = t.user_id
+                        JOIN users_follow_list ufl ON ufl.follow_user_id = t.user_id
+                        WHERE t.id BETWEEN :first_id AND :last_id
+                        AND u.follower_count <= :threshold
+                    """), {
+                        'first_id'  : tweet_ids[0],
+                        'last_id'   : tweet_ids[-1],
+                        'threshold' : self.fanout_threshold
+                    })
+            return [result[i] for i in indexes]
+
+        tweet_ids = [None] * len(tweets)
+        inserted  = [False] * len(tweets) # 이번에 저장한 tweet (이미 저장되어 있던 tweet은 False)
+        errors    = []
+        for (_, indexes), ids in zip(groups.items(), self.shards.map(insert, groups.items())):
+            if isinstance(ids, Exception):
+                errors.append(ids)
+                continue
+            for i, (tweet_id, new) in zip(indexes, ids):
+                tweet_ids[i], inserted[i] = tweet_id, new
+
+        now = time.time()
+        for (user_id, _), tweet_id, new in zip(tweets, tweet_ids, inserted):
+            if new:
+                self.inserted(user_id, tweet_id, now)
+
+        if errors and len(errors) == len(groups):
+            raise errors[0]
+        if errors:
+            raise PartialInsertError(tweet_ids, errors[0])
+        return tweet_ids
+
+    # tweet 작성 시 timeline에 push 되는 팔로워 목록 (pull 대상 작성자는 빈 목록)
+    # shard가 여러 개면 모든 팔로워의 timeline이 바뀌므로 팔로워 전체
+    def get_push_follower_ids(self, user_id):
+        if len(self.shards) > 1:
+            return self.get_follower_ids(user_id)
+        if self.follow_graph is not None:
+            follower_ids = self.follow_graph.get_follower_ids(user_id)
+            return follower_ids if len(follower_ids) <= self.fanout_threshold else []
+
+        rows = self.shards.read_engine(user_id).execute(text("""
+            SELECT user_id
+            FROM users_follow_list
+            WHERE follow_user_id = :user_id
+            AND (SELECT follower_count FROM users WHERE id = :user_id) <= :threshold
+        """), {
+            'user_id'   : user_id,
+            'threshold' : self.fanout_threshold
+        }).fetchall()
+
+        return [row['user_id'] for row in rows]
+
+    # (user_id, tweet_id) 순서의 keyset 페이지네이션: before보다 오래되고 since보다 새로운 tweet을 최신순으로 limit개
+    # push 받은 timelines와 pull 대상 작성자의 tweet을 합쳐서 반환
+    def get_timeline(self, user_id, limit=None, before=None, since=None):
+        if len(self.shards) > 1:
+            return self.get_sharded_timeline(user_id, limit, before, since)
+
+        if self.recent_tweets is not None:
+            timeline = self.get_buffered_timeline(user_id, limit, before, since)
+            if timeline is not None:
+                return timeline
+
+        pushed = self.get_pushed_timeline(user_id, limit, before, since)
+        pulled = self.get_pulled_timeline(user_id, limit, before, since)
+        if not pulled:
+            return pushed
+        return list(merge_timelines(pushed, pulled, limit))
+
+    # get_timeline과 같은 결과를 page_size개씩 keyset page(before=마지막 id)로 나눠 읽어 반환 (응답 streaming용)
+    # mysqlconnector에는 server-side cursor가 없으므로 page 단위로 조회해서 메모리 사용량을 page 크기로 제한하고,
+    # connection은 page를 읽는 동안만 사용 (느린 클라이언트에게 응답하는 동안 pool을 점유하지 않음)
+    def iter_timeline(self, user_id, limit=None, before=None, since=None, page_size=500):
+        while limit is None or limit > 0:
+            size = page_size if limit is None else min(page_size, limit)
+            page = self.get_timeline(user_id, size, before, since)
+            yield from page
+
+            if len(page) < size:
+                return
+            before = page[-1]['id']
+            if limit is not None:
+                limit -= len(page)
+
+    # 본인과 팔로우 중인 작성자들의 최근 tweet buffer를 heap merge (buffer로 부족하면 None)
+    # buffer는 primary에 commit 한 직후 채워지므로 replica에 아직 없는 tweet은 primary에서 다시 읽고,
+    # 그래도 없으면 (짧은 page를 끝으로 보지 않도록) None을 반환해서 SQL로 조회
+    def get_buffered_timeline(self, user_id, limit=None, before=None, since=None):
+        author_ids = {user_id, *self.get_followee_ids(user_id)}
+        missing = self.recent_tweets.missing(author_ids)
+        if missing:
+            self.load_recent_tweets(missing)
+
+        merged = self.recent_tweets.merge(author_ids, limit, before, since)
+        if not merged:
+            return merged
+
+        tweet_ids = [tweet_id for tweet_id, _, _ in merged]
+        engine    = self.shards.read_engine(user_id)
+        tweets    = self.get_tweets(engine, tweet_ids)
+        if len(tweets) < len(tweet_ids) and engine is not self.db:
+            tweets.update(self.get_tweets(self.db, [tweet_id for tweet_id in tweet_ids if tweet_id not in tweets]))
+        if len(tweets) < len(tweet_ids):
+            return None
+
+        return [{
+            'id'      : tweet_id,
+            'user_id' : tweets[tweet_id]['user_id'],
+            'tweet'   : tweets[tweet_id]['tweet']
+        } for tweet_id in tweet_ids]
+
+    # {tweet id: row}
+    def get_tweets(self, engine, tweet_ids):
+        rows = engine.execute(text("""
+            SELECT
+                id,
                 user_id,
                 tweet
-            ) VALUES (
-                :id,
-                :tweet
-            )
+            FROM tweets
+            WHERE id IN :ids
+        """).bindparams(bindparam('ids', expanding=True)), {
+            'ids' : tweet_ids
+        }).fetchall()
+        return {row['id'] : row for row in rows}
+
+    # 작성자들의 shard별로 (user_id, created_at) index seek을 병렬로 실행해서 합침
+    # shard마다 auto_increment가 따로 증가하므로 id는 shard 간에 작성 순서가 아님
+    # → (created_at, id) 순서로 합치고, cursor(before/since tweet id)는 그 tweet의 (created_at, id)로 바꿔서 비교
+    def get_sharded_timeline(self, user_id, limit=None, before=None, since=None):
+        author_ids = {user_id, *self.get_followee_ids(user_id)}
+        cursors    = self.created_at_cursors(before, since)
+        if cursors is None:
+            return [] # 없는 tweet id
+
+        def fetch(group):
+            engine, ids   = group
+            seeks, params = created_at_seeks(ids, limit, *cursors)
+            return self.shards.reader(engine, user_id).execute(text(f"""
+                {seeks}
+                ORDER BY created_at DESC, id DESC
+                {"LIMIT :limit" if limit is not None else ""}
+            """), params).fetchall()
+
+        timelines = self.shards.map(fetch, self.shards.group(author_ids).items())
+        return [{
+            'id'      : tweet['id'],
+            'user_id' : tweet['user_id'],
+            'tweet'   : tweet['tweet']
+        } for tweet in islice(heapq.merge(*timelines, key=lambda tweet: (tweet['created_at'], tweet['id']), reverse=True), limit)]
+
+    # 여러 사용자의 sharded timeline을 사용자 수와 무관하게 shard마다 query 2번으로 읽어 {user_id: timeline}으로 반환
+    # (팔로우 목록은 팔로워의 shard에서, tweet은 작성자의 shard에서, 여러 사용자가 함께 팔로우하는 작성자는 한 번만)
+    def get_sharded_timelines(self, user_ids, limit=None, before=None, since=None):
+        cursors = self.created_at_cursors(before, since)
+        if cursors is None or not user_ids:
+            return {user_id : [] for user_id in user_ids}
+
+        author_ids = {
+            user_id : {user_id, *followee_ids} for user_id, followee_ids in self.get_followee_ids_by_user(user_ids).items()
+        }
+        pinned = [user_id for user_id in author_ids if self.shards.is_pinned(user_id)]
+
+        def fetch(group):
+            engine, ids   = group
+            seeks, params = created_at_seeks(ids, limit, *cursors)
+            return self.shards.reader(engine, *pinned).execute(text(seeks), params).fetchall()
+
+        tweets = {author_id : [] for ids in author_ids.values() for author_id in ids}
+        for rows in self.shards.map(fetch, self.shards.group(tweets).items()):
+            for tweet in rows:
+                tweets[tweet['user_id']].append(tweet)
+        for author_tweets in tweets.values():
+            author_tweets.sort(key=lambda tweet: (tweet['created_at'], tweet['id']), reverse=True)
+
+        return {user_id : [{
+            'id'      : tweet['id'],
+            'user_id' : tweet['user_id'],
+            'tweet'   : tweet['tweet']
+        } for tweet in islice(heapq.merge(
+            *[tweets[author_id] for author_id in ids], key=lambda tweet: (tweet['created_at'], tweet['id']), reverse=True
+        ), limit)] for user_id, ids in author_ids.items()}
+
+    # before/since tweet id를 [(created_at, id) 또는 None] 두 개로 바꿈, 없는 tweet id가 있으면 None
+    def created_at_cursors(self, before=None, since=None):
+        cursors = []
+        for tweet_id in [before, since]:
+            created_at = self.get_created_at(tweet_id) if tweet_id is not None else None
+            if tweet_id is not None and created_at is None:
+                return None
+            cursors.append((created_at, tweet_id) if tweet_id is not None else None)
+        return cursors
+
+    # tweet의 작성 시각 (어느 shard에 있는지 모르므로 모든 shard를 병렬로 조회), 없으면 None
+    def get_created_at(self, tweet_id):
+        rows = self.shards.map(lambda engine: engine.execute(text("""
+            SELECT created_at
+            FROM tweets
+            WHERE id = :id
         """), {
-            'id'    : user_id,
-            'tweet' : tweet
-        }).rowcount
+            'id' : tweet_id
+        }).fetchone(), self.shards.engines)
 
-    def get_timeline(self, user_id):
-        timeline = self.db.execute(text("""
-            SELECT 
+        return next((row['created_at'] for row in rows if row is not None), None)
+
+    # 팔로우 중인 사용자 목록 (follow 관계는 팔로우 하는 사용자의 shard에 저장)
+    def get_followee_ids(self, user_id):
+        if self.follow_graph is not None:
+            return self.follow_graph.get_followee_ids(user_id)
+
+        return [row['follow_user_id'] for row in self.shards.read_engine(user_id).execute(text("""
+            SELECT follow_user_id
+            FROM users_follow_list
+            WHERE user_id = :user_id
+        """), {
+            'user_id' : user_id
+        }).fetchall()]
+
+    # 여러 사용자의 팔로우 목록 {user_id: [팔로우 중인 사용자 id]} (shard마다 query 한 번, 병렬로)
+    def get_followee_ids_by_user(self, user_ids):
+        if self.follow_graph is not None:
+            return {user_id : self.follow_graph.get_followee_ids(user_id) for user_id in user_ids}
+
+        followee_ids = {user_id : [] for user_id in user_ids}
+        rows = self.shards.map(lambda group: self.shards.reader(group[0], *group[1]).execute(text("""
+            SELECT user_id, follow_user_id
+            FROM users_follow_list
+            WHERE user_id IN :user_ids
+        """).bindparams(bindparam('user_ids', expanding=True)), {
+            'user_ids' : group[1]
+        }).fetchall(), self.shards.group(followee_ids).items())
+
+        for row in (row for shard_rows in rows for row in shard_rows):
+            followee_ids[row['user_id']].append(row['follow_user_id'])
+        return followee_ids
+
+    # 팔로워 목록 (팔로워들의 shard에 흩어져 있으므로 모든 shard를 병렬로 조회)
+    def get_follower_ids(self, user_id):
+        if self.follow_graph is not None:
+            return self.follow_graph.get_follower_ids(user_id)
+
+        rows = self.shards.map(lambda engine: self.shards.reader(engine, user_id).execute(text("""
+            SELECT user_id
+            FROM users_follow_list
+            WHERE follow_user_id = :user_id
+        """), {
+            'user_id' : user_id
+        }).fetchall(), self.shards.engines)
+
+        return [row['user_id'] for shard_rows in rows for row in shard_rows]
+
+    # 작성자별 최신 tweet을 (user_id, id) index seek으로 읽어 buffer를 채움
+    # buffer는 ttl 동안 재사용되므로 replica 지연이 남지 않도록 primary에서 읽음
+    def load_recent_tweets(self, author_ids):
+        params = {'capacity' : self.recent_tweets.capacity}
+        seeks  = []
+        for i, author_id in enumerate(author_ids):
+            params[f'author_{i}'] = author_id
+            seeks.append(f"""(
+                SELECT id, user_id, UNIX_TIMESTAMP(created_at) AS created_at
+                FROM tweets
+                WHERE user_id = :author_{i}
+                ORDER BY id DESC
+                LIMIT :capacity
+            )""")
+
+        recent = {author_id : [] for author_id in author_ids}
+        for row in self.db.execute(text(" UNION ALL ".join(seeks)), params).fetchall():
+            recent[row['user_id']].append((row['id'], float(row['created_at'])))
+
+        for author_id, tweets in recent.items():
+            tweets.sort(reverse=True)
+            self.recent_tweets.load(author_id, tweets)
+
+    def get_pushed_timeline(self, user_id, limit=None, before=None, since=None):
+        return self.fetch_timeline(*self.pushed_timeline_query(user_id, limit, before, since), self.shards.read_engine(user_id))
+
+    def get_pulled_timeline(self, user_id, limit=None, before=None, since=None):
+        query = self.pulled_timeline_query(user_id, limit, before, since)
+        return self.fetch_timeline(*query, self.shards.read_engine(user_id)) if query is not None else []
+
+    def pushed_timeline_query(self, user_id, limit=None, before=None, since=None):
+        return text(f"""
+            SELECT
+                t.id,
                 t.user_id,
                 t.tweet
-            FROM tweets t
-            LEFT JOIN users_follow_list ufl ON ufl.user_id = :user_id
-            WHERE t.user_id = :user_id 
-            OR t.user_id = ufl.follow_user_id
+            FROM timelines tl
+            JOIN tweets t ON t.id = tl.tweet_id
+            WHERE tl.user_id = :user_id
+            {"AND tl.tweet_id < :before" if before is not None else ""}
+            {"AND tl.tweet_id > :since" if since is not None else ""}
+            ORDER BY tl.tweet_id DESC
+            {"LIMIT :limit" if limit is not None else ""}
         """), {
-            'user_id' : user_id 
-        }).fetchall()
+            'user_id' : user_id,
+            'before'  : before,
+            'since'   : since,
+            'limit'   : limit
+        }
+
+    # 팔로우 중인 pull 대상 작성자들의 tweet (작성자별 (user_id, id) index seek을 UNION ALL)
+    # pull 대상 작성자가 없으면 None
+    def pulled_timeline_query(self, user_id, limit=None, before=None, since=None):
+        author_ids = self.get_pull_author_ids(user_id)
+        if not author_ids:
+            return None
+
+        seeks, params = author_seeks(author_ids, limit, before, since)
+        return text(f"""
+            {seeks}
+            ORDER BY id DESC
+            {"LIMIT :limit" if limit is not None else ""}
+        """), params
+
+    # 팔로우 중인 pull 대상(팔로워가 fanout_threshold보다 많은) 작성자 id
+    # shard가 여러 개면 push 하지 않고 모든 팔로워의 timeline이 바뀌므로 빈 목록
+    def get_pull_author_ids(self, user_id):
+        return self.get_pull_author_ids_by_user([user_id])[user_id]
+
+    # 여러 사용자의 pull 대상 작성자 id를 query 한 번으로 읽어 {user_id: [작성자 id]}로 반환
+    def get_pull_author_ids_by_user(self, user_ids):
+        pull_ids = {user_id : [] for user_id in user_ids}
+        if len(self.shards) > 1 or not pull_ids:
+            return pull_ids
+
+        for row in self.shards.reader(self.db, *pull_ids).execute(text("""
+            SELECT ufl.user_id, ufl.follow_user_id
+            FROM users_follow_list ufl
+            JOIN users u ON u.id = ufl.follow_user_id
+            WHERE ufl.user_id IN :user_ids
+            AND ufl.follow_user_id <> ufl.user_id
+            AND u.follower_count > :threshold
+        """).bindparams(bindparam('user_ids', expanding=True)), {
+            'user_ids'  : list(pull_ids),
+            'threshold' : self.fanout_threshold
+        }).fetchall():
+            pull_ids[row['user_id']].append(row['follow_user_id'])
+        return pull_ids
+
+    # 여러 사용자의 timeline을 사용자 수와 무관하게 query 3번으로 읽어 {user_id: timeline}으로 반환
+    # (push 받은 timelines, pull 대상 팔로우 목록, pull 대상 작성자들의 tweet)
+    # shard가 여러 개면 shard마다 query 2번 (get_sharded_timelines, cursor가 있으면 created_at 조회 추가)
+    def get_timelines(self, user_ids, limit=None, before=None, since=None):
+        if len(self.shards) > 1:
+            return self.get_sharded_timelines(user_ids, limit, before, since)
+
+        timelines = {user_id : [] for user_id in user_ids}
+        if not timelines:
+            return timelines
+
+        engine = self.shards.reader(self.db, *timelines)
+        params = {'before' : before, 'since' : since, 'limit' : limit}
+        seeks  = []
+        for i, user_id in enumerate(timelines):
+            params[f'user_{i}'] = user_id
+            seeks.append(f"""(
+                SELECT tl.user_id AS owner_id, t.id, t.user_id, t.tweet
+                FROM timelines tl
+                JOIN tweets t ON t.id = tl.tweet_id
+                WHERE tl.user_id = :user_{i}
+                {"AND tl.tweet_id < :before" if before is not None else ""}
+                {"AND tl.tweet_id > :since" if since is not None else ""}
+                ORDER BY tl.tweet_id DESC
+                {"LIMIT :limit" if limit is not None else ""}
+            )""")
 
+        for tweet in engine.execute(text(f"""
+            {" UNION ALL ".join(seeks)}
+            ORDER BY owner_id, id DESC
+        """), params).fetchall():
+            timelines[tweet['owner_id']].append({
+                'id'      : tweet['id'],
+                'user_id' : tweet['user_id'],
+                'tweet'   : tweet['tweet']
+            })
+
+        pull_ids = {user_id : ids for user_id, ids in self.get_pull_author_ids_by_user(list(timelines)).items() if ids}
+        if not pull_ids:
+            return timelines
+
+        # 여러 사용자가 함께 팔로우하는 작성자의 tweet은 한 번만 읽음
+        author_ids = {author_id for ids in pull_ids.values() for author_id in ids}
+        seeks, params = author_seeks(author_ids, limit, before, since)
+        pulled = {author_id : [] for author_id in author_ids}
+        for tweet in engine.execute(text(f"""
+            {seeks}
+            ORDER BY id DESC
+        """), params).fetchall():
+            pulled[tweet['user_id']].append({
+                'id'      : tweet['id'],
+                'user_id' : tweet['user_id'],
+                'tweet'   : tweet['tweet']
+            })
+
+        for user_id, ids in pull_ids.items():
+            tweets = heapq.merge(*[pulled[author_id] for author_id in ids], key=lambda tweet: -tweet['id'])
+            timelines[user_id] = list(merge_timelines(timelines[user_id], tweets, limit))
+        return timelines
+
+    def fetch_timeline(self, query, params, engine=None):
         return [{
+            'id'      : tweet['id'],
             'user_id' : tweet['user_id'],
             'tweet'   : tweet['tweet']
-        } for tweet in timeline]
\ No newline at end of file
+        } for tweet in (engine or self.db).execute(query, params).fetchall()]
+
+    # 기존 tweets/users_follow_list 데이터로 timelines 재구성 (batch_size명 단위)
+    # user_ids가 있으면 그 사용자들의 timeline만 (follow 관계를 가져온 팔로워들)
+    # shard가 여러 개면 timelines를 쓰지 않으므로 0
+    def backfill_timelines(self, batch_size=1000, user_ids=None):
+        if len(self.shards) > 1:
+            return 0
+
+        if user_ids is not None:
+            user_ids = sorted(set(user_ids))
+            return sum(
+                self.backfill_user_timelines(user_ids[i:i + batch_size]) for i in range(0, len(user_ids), batch_size)
+            )
+
+        inserted = 0
+        last_id  = 0
+
+        while True:
+            user_ids = [row['id'] for row in self.db.execute(text("""
+                SELECT id
+                FROM users
+                WHERE id > :last_id
+                ORDER BY id
+                LIMIT :limit
+            """), {
+                'last_id' : last_id,
+                'limit'   : batch_size
+            }).fetchall()]
+
+            if not user_ids:
+                return inserted
+
+            inserted += self.backfill_user_timelines(user_ids)
+            last_id = user_ids[-1]
+
+    def backfill_user_timelines(self, user_ids):
+        return self.db.execute(text("""
+            INSERT IGNORE INTO timelines (
+                user_id,
+                tweet_id
+            )
+            SELECT user_id, id
+            FROM tweets
+            WHERE user_id IN :user_ids
+            UNION
+            SELECT ufl.user_id, t.id
+            FROM users_follow_list ufl
+            JOIN users u ON u.id = ufl.follow_user_id
+            JOIN tweets t ON t.user_id = ufl.follow_user_id
+            WHERE ufl.user_id IN :user_ids
+            AND u.follower_count <= :threshold
+        """).bindparams(bindparam('user_ids', expanding=True)), {
+            'user_ids'  : user_ids,
+            'threshold' : self.fanout_threshold
+        }).rowcount
+
+    # 새로 가져온 follow 관계 [(user_id, follow_user_id)]의 팔로우 대상 tweet을 팔로워 timeline에 push
+    # (bulk import의 chunk마다 호출, 그 chunk의 follow 관계만 읽으므로 파일 전체의 팔로워를 모아둘 필요 없음)
+    def backfill_follow_timelines(self, follows):
+        if len(self.shards) > 1 or not follows:
+            return 0
+
+        params = {'threshold' : self.fanout_threshold}
+        pairs  = []
+        for i, (user_id, follow_user_id) in enumerate(follows):
+            params[f'user_{i}'], params[f'follow_{i}'] = user_id, follow_user_id
+            pairs.append(f"SELECT :user_{i} AS user_id, :follow_{i} AS follow_user_id")
+
+        return self.db.execute(text(f"""
+            INSERT IGNORE INTO timelines (
+                user_id,
+                tweet_id
+            )
+            SELECT f.user_id, t.id
+            FROM ({" UNION ".join(pairs)}) f
+            JOIN users u ON u.id = f.follow_user_id
+            JOIN tweets t ON t.user_id = f.follow_user_id
+            WHERE u.follower_count <= :threshold
+        """), params).rowcount
+
+# 작성자별 최신 tweet을 (user_id, id) index seek으로 읽는 query들의 UNION ALL
+def author_seeks(author_ids, limit=None, before=None, since=None):
+    params = {'before' : before, 'since' : since, 'limit' : limit}
+    seeks  = []
+    for i, author_id in enumerate(author_ids):
+        params[f'author_{i}'] = author_id
+        seeks.append(f"""(
+            SELECT id, user_id, tweet
+            FROM tweets
+            WHERE user_id = :author_{i}
+            {"AND id < :before" if before is not None else ""}
+            {"AND id > :since" if since is not None else ""}
+            ORDER BY id DESC
+            {"LIMIT :limit" if limit is not None else ""}
+        )""")
+    return " UNION ALL ".join(seeks), params
+
+# 작성자별 최신 tweet을 (user_id, created_at) index seek으로 읽는 query들의 UNION ALL (shard가 여러 개일 때)
+# before/since는 (created_at, id)
+def created_at_seeks(author_ids, limit=None, before=None, since=None):
+    params = {'limit' : limit}
+    if before is not None:
+        params['before_at'], params['before'] = before
+    if since is not None:
+        params['since_at'], params['since'] = since
+
+    seeks = []
+    for i, author_id in enumerate(author_ids):
+        params[f'author_{i}'] = author_id
+        seeks.append(f"""(
+            SELECT id, user_id, tweet, created_at
+            FROM tweets
+            WHERE user_id = :author_{i}
+            {"AND (created_at < :before_at OR (created_at = :before_at AND id < :before))" if before is not None else ""}
+            {"AND (created_at > :since_at OR (created_at = :since_at AND id > :since))" if since is not None else ""}
+            ORDER BY created_at DESC, id DESC
+            {"LIMIT :limit" if limit is not None else ""}
+        )""")
+    return " UNION ALL ".join(seeks), params
+
+# 최신순으로 정렬된 두 timeline을 합침
+# 작성자가 pull 대상이 되기 전에 push 된 tweet은 양쪽에 모두 있을 수 있으므로 id로 중복 제거
+def merge_timelines(pushed, pulled, limit=None):
+    count   = 0
+    last_id = None
+    for tweet in heapq.merge(pushed, pulled, key=lambda tweet: -tweet['id']):
+        if limit is not None and count == limit:
+            return
+        if tweet['id'] != last_id:
+            yield tweet
+            count  += 1
+            last_id = tweet['id']
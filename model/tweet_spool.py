@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import fcntl
+import struct
+import logging
+import threading
+
+HEADER = struct.Struct('>II') # payload 길이, crc32
+
+# POST /tweet 비동기 모드의 로컬 write-ahead spool
+# tweet을 segment 파일(spool-<번호>.log)에 append 하고, drain thread가 순서대로 읽어 handler(DB 저장)에 넘긴다.
+# fsync_interval이 0이면 append가 fsync 될 때까지 기다리고(동시 요청은 fsync 한 번에 함께 commit),
+# 0보다 크면 그 주기로 fsync 한다. (그 사이에 서버가 죽으면 마지막 주기의 tweet을 잃을 수 있음)
+# 처리한 위치는 offset 파일에 저장하므로 재시작하면 처리하지 못한 tweet부터 다시 넘긴다.
+# handler가 성공한 뒤 offset을 저장하기 전에 죽으면 마지막 batch가 한 번 더 넘어가므로
+# record마다 고유한 key를 함께 넘겨서 handler가 중복 저장을 막을 수 있게 한다.
+# handler가 계속 실패하는 record는 max_attempts번 시도한 뒤 dead-letter.log로 옮기고 다음 record를 처리한다.
+class TweetSpool:
+    def __init__(self, path, fsync_interval=0, segment_size=64 * 1024 * 1024, batch_size=100):
+        self.path           = path
+        self.fsync_interval = fsync_interval
+        self.segment_size   = segment_size
+        self.batch_size     = batch_size
+        self.lock           = threading.Lock()
+        self.condition      = threading.Condition(self.lock)
+        self.closed         = False
+        self.threads        = []
+
+        # 한 spool 디렉터리는 한 프로세스만 사용
+        os.makedirs(path, exist_ok=True)
+        self.lock_file = open(os.path.join(path, 'LOCK'), 'w')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            raise RuntimeError(f'spool {path} is used by another process')
+
+        self.read_segment, self.read_position = self.load_offset()
+        segments = self.segments()
+        for segment in segments:
+            if segment < self.read_segment:
+                os.remove(self.segment_path(segment))
+
+        # 마지막 segment 끝의 불완전한 record(쓰는 도중 종료)는 잘라냄
+        self.segment = max(segments + [self.read_segment])
+        self.size    = valid_size(self.segment_path(self.segment))
+        self.fd      = os.open(self.segment_path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        os.ftruncate(self.fd, self.size)
+        self.appended = 0 # append 된 record 수
+        self.synced   = 0 # fsync 된 record 수
+
+    def segments(self):
+        return sorted(
+            int(name[len('spool-'):-len('.log')]) for name in os.listdir(self.path)
+            if name.startswith('spool-') and name.endswith('.log')
+        )
+
+    def segment_path(self, segment):
+        return os.path.join(self.path, f'spool-{segment:010d}.log')
+
+    def load_offset(self):
+        try:
+            with open(os.path.join(self.path, 'offset')) as f:
+                segment, position = f.read().split()
+                return int(segment), int(position)
+        except FileNotFoundError:
+            return 0, 0
+
+    def save_offset(self, segment, position):
+        offset_path = os.path.join(self.path, 'offset')
+        with open(offset_path + '.tmp', 'w') as f:
+            f.write(f'{segment} {position}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(offset_path + '.tmp', offset_path)
+
+    def append(self, user_id, tweet):
+        record = frame({'key' : uuid.uuid4().hex, 'user_id' : user_id, 'tweet' : tweet})
+
+        with self.lock:
+            if self.size >= self.segment_size:
+                self.rotate()
+            os.write(self.fd, record)
+            self.size     += len(record)
+            self.appended += 1
+            ticket         = self.appended
+            self.condition.notify_all()
+
+        # group commit: 먼저 lock을 잡은 요청의 fsync가 그때까지 append 된 record를 모두 commit
+        if self.fsync_interval == 0:
+            with self.lock:
+                if self.synced < ticket:
+                    self.sync()
+
+    # lock을 잡은 상태에서 호출
+    def sync(self):
+        os.fsync(self.fd)
+        self.synced = self.appended
+
+    # lock을 잡은 상태에서 호출
+    def rotate(self):
+        self.sync()
+        os.close(self.fd)
+        self.segment += 1
+        self.size     = 0
+        self.fd       = os.open(self.segment_path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+
+    # handler([(key, user_id, tweet), ...])에 spool의 tweet을 순서대로 batch_size개씩 넘기는 thread 시작
+    # 실패하면 retry_delay초부터 2배씩(최대 60초) 기다렸다가 다시 시도
+    def start(self, handler, retry_delay=1, max_attempts=10):
+        self.threads.append(threading.Thread(target=self.drain, args=(handler, retry_delay, max_attempts), daemon=True))
+        if self.fsync_interval > 0:
+            self.threads.append(threading.Thread(target=self.sync_periodically, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def sync_periodically(self):
+        while not self.closed:
+            time.sleep(self.fsync_interval)
+            with self.lock:
+                if not self.closed and self.synced < self.appended:
+                    self.sync()
+
+    def drain(self, handler, retry_delay, max_attempts):
+        attempts = 0 # 지금 위치의 record를 처리하지 못한 횟수
+        while True:
+            with self.condition:
+                while not self.closed and (self.read_segment, self.read_position) == (self.segment, self.size):
+                    self.condition.wait()
+                if self.closed:
+                    return
+                segment, end = self.segment, self.size
+
+            # 이전 segment는 끝까지, 현재 segment는 append 된 곳까지 읽음
+            # 실패한 뒤에는 실패하는 record를 찾도록 하나씩 처리
+            if self.read_segment < segment:
+                end = os.path.getsize(self.segment_path(self.read_segment))
+            records, position = read_records(
+                self.segment_path(self.read_segment), self.read_position, end, 1 if attempts else self.batch_size
+            )
+
+            # end까지는 완전히 기록된 record이므로 읽지 못했으면 segment 중간이 손상된 것
+            if not records and position < end:
+                logging.error('corrupt record in tweet spool segment %d at %d, skipping the rest of the segment',
+                              self.read_segment, position)
+                self.skip_segment()
+                continue
+
+            if records:
+                try:
+                    handler([(record.get('key'), record['user_id'], record['tweet']) for record in records])
+                    attempts = 0
+                except Exception:
+                    attempts += 1
+                    logging.exception('failed to drain tweet spool (attempt %d)', attempts)
+                    if len(records) > 1 or attempts < max_attempts:
+                        time.sleep(min(retry_delay * 2 ** (attempts - 1), 60))
+                        continue
+                    logging.error('moving tweet %s to dead letter after %d attempts', records[0].get('key'), attempts)
+                    self.dead_letter(records[0])
+                    attempts = 0
+
+            # 다음 segment로 넘어간 offset을 먼저 저장하고 처리한 segment 삭제
+            # (삭제 후 offset 저장 전에 종료되면 재시작할 때 없는 segment를 읽게 됨)
+            if position == end and self.read_segment < segment:
+                self.save_offset(self.read_segment + 1, 0)
+                os.remove(self.segment_path(self.read_segment))
+                self.read_segment, self.read_position = self.read_segment + 1, 0
+            else:
+                self.read_position = position
+                self.save_offset(self.read_segment, self.read_position)
+
+    # 손상된 segment의 나머지를 건너뜀 (조사할 수 있도록 .corrupt로 이름을 바꿔 남겨 둠)
+    def skip_segment(self):
+        with self.lock:
+            if self.closed:
+                return
+            if self.read_segment == self.segment:
+                self.rotate()
+
+        path = self.segment_path(self.read_segment)
+        self.save_offset(self.read_segment + 1, 0)
+        os.replace(path, path + '.corrupt')
+        self.read_segment, self.read_position = self.read_segment + 1, 0
+
+    # 저장하지 못한 record를 dead-letter.log에 같은 형식으로 기록
+    def dead_letter(self, record):
+        with open(os.path.join(self.path, 'dead-letter.log'), 'ab') as f:
+            f.write(frame(record))
+            f.flush()
+            os.fsync(f.fileno())
+
+    # 아직 DB에 저장되지 않은 tweet 수
+    def pending(self):
+        with self.lock:
+            count = 0
+            for segment in range(self.read_segment, self.segment + 1):
+                start = self.read_position if segment == self.read_segment else 0
+                count += len(read_records(self.segment_path(segment), start, None, None)[0])
+            return count
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.sync()
+            os.close(self.fd)
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.lock_file.close()
+
+def frame(record):
+    payload = json.dumps(record, ensure_ascii=False).encode('utf-8')
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+# start부터 end(None이면 파일 끝)까지 완전한 record를 최대 limit개 읽음, (records, 다음 위치)
+def read_records(path, start, end, limit):
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+
+    position = 0
+    while limit is None or len(records) < limit:
+        if position + HEADER.size > len(data):
+            break
+        length, crc = HEADER.unpack_from(data, position)
+        payload     = data[position + HEADER.size:position + HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(json.loads(payload))
+        position += HEADER.size + length
+    return records, start + position
+
+def valid_size(path):
+    if not os.path.exists(path):
+        return 0
+    return read_records(path, 0, None, None)[1]
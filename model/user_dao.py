@@ -1,12 +1,19 @@
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
+from .shard_router import ShardRouter
 
 class UserDao:
-    def __init__(self, database):
-        self.db = database
+    # follow_graph(FollowGraph)가 있으면 follow/unfollow를 반영하고 팔로우 목록을 그래프에서 읽는다.
+    # database가 ShardRouter면 사용자 id로 shard를 선택 (follow 관계는 팔로우 하는 사용자의 shard에 저장)
+    def __init__(self, database, cache=None, fanout_threshold=10000, follow_graph=None):
+        self.shards = database if isinstance(database, ShardRouter) else ShardRouter([database])
+        self.db = self.shards.engines[0] # shard가 하나일 때의 engine
+        self.cache = cache
+        self.fanout_threshold = fanout_threshold
+        self.follow_graph = follow_graph
         
-    #  ߰
+    # 사용자 추가
     def insert_user(self, user):
-        return self.db.execute(text("""
+        user_id = self.shards.new_user_engine().execute(text("""
             INSERT INTO users (
                 name,
                 email,
@@ -20,50 +27,382 @@ class UserDao:
             )
         """), user).lastrowid
 
-    #  
+        self.shards.pin(user_id)
+        return user_id
+
+    # 여러 사용자를 multi-row INSERT로 추가 (bulk import), id가 없는 사용자는 새 id를 받음
+    def insert_users(self, users):
+        groups = {}
+        for user in users:
+            engine = self.shards.engine(int(user['id'])) if user.get('id') else None
+            groups.setdefault(engine, []).append(user)
+
+        inserted = 0
+        for engine, rows in groups.items():
+            inserted += (engine or self.shards.new_user_engine()).execute(text("""
+                INSERT INTO users (
+                    id,
+                    name,
+                    email,
+                    profile,
+                    hashed_password
+                ) VALUES (
+                    :id,
+                    :name,
+                    :email,
+                    :profile,
+                    :hashed_password
+                )
+            """), [{
+                'id'              : user.get('id') or None,
+                'name'            : user['name'],
+                'email'           : user['email'],
+                'profile'         : user['profile'],
+                'hashed_password' : user['hashed_password']
+            } for user in rows]).rowcount
+        return inserted
+
+    # 사용자 인증 (email로는 shard를 알 수 없으므로 모든 shard를 병렬로 조회)
+    # 가입 직후라 replica에 아직 없을 수 있으므로 replica에서 못 찾으면 primary에서 다시 조회
     def get_user_id_and_password(self, email):
-        row = self.db.execute(text("""
-            SELECT
-                id,
-                hashed_password
-            FROM users
-            WHERE email = :email
-        """), {'email' : email}).fetchone()
+        row = self.find_user(email, self.shards.reader)
+        if row is None and self.shards.replicas:
+            row = self.find_user(email, lambda engine: engine)
 
         return {
             'id' : row['id'],
             'hashed_password' : row['hashed_password']
         } if row else None
     
-    # follow
-    def insert_follow(self, user_id, follow_id):
-        return self.db.execute(text("""
-            INSERT INTO users_follow_list (
-                user_id,
-                follow_user_id
-            ) VALUES (
-                :id,
-                :follow
-            )
+    # 비밀번호 hash 교체 (그 사이 비밀번호가 바뀌었으면 변경하지 않음)
+    def update_hashed_password(self, user_id, hashed_password, new_hashed_password):
+        rowcount = self.shards.engine(user_id).execute(text("""
+            UPDATE users
+            SET hashed_password = :new_hashed_password
+            WHERE id = :user_id
+            AND hashed_password = :hashed_password
         """), {
-            'id'     : user_id,
-            'follow' : follow_id
+            'user_id'             : user_id,
+            'hashed_password'     : hashed_password,
+            'new_hashed_password' : new_hashed_password
         }).rowcount
+        self.shards.pin(user_id)
+        return rowcount
+
+    def find_user(self, email, reader):
+        rows = self.shards.map(lambda engine: reader(engine).execute(text("""
+            SELECT
+                id,
+                hashed_password
+            FROM users
+            WHERE email = :email
+        """), {'email' : email}).fetchone(), self.shards.engines)
+        return next((row for row in rows if row), None)
+
+    # follow (push 대상 사용자면 기존 tweet을 timeline에 추가)
+    # shard가 여러 개면 timelines를 쓰지 않고, follower_count는 팔로우 대상의 shard에서 따로 갱신
+    def insert_follow(self, user_id, follow_id):
+        with self.shards.engine(user_id).begin() as conn:
+            rowcount = conn.execute(text("""
+                INSERT INTO users_follow_list (
+                    user_id,
+                    follow_user_id
+                ) VALUES (
+                    :id,
+                    :follow
+                )
+            """), {
+                'id'     : user_id,
+                'follow' : follow_id
+            }).rowcount
+
+            if len(self.shards) == 1:
+                self.update_follower_count(conn, follow_id, rowcount)
+                conn.execute(text("""
+                    INSERT IGNORE INTO timelines (
+                        user_id,
+                        tweet_id
+                    )
+                    SELECT :id, id
+                    FROM tweets
+                    WHERE user_id = :follow
+                    AND (SELECT follower_count FROM users WHERE id = :follow) <= :threshold
+                """), {
+                    'id'        : user_id,
+                    'follow'    : follow_id,
+                    'threshold' : self.fanout_threshold
+                })
+
+        if len(self.shards) > 1:
+            self.update_follower_count(self.shards.engine(follow_id), follow_id, rowcount)
+        self.shards.pin(user_id)
+        if rowcount and self.follow_graph is not None:
+            self.follow_graph.follow(user_id, follow_id)
+        return rowcount
+
+    # 팔로우 중인 사용자 목록
+    def get_follow_ids(self, user_id):
+        if self.follow_graph is not None:
+            return self.follow_graph.get_followee_ids(user_id)
+
+        rows = self.shards.read_engine(user_id).execute(text("""
+            SELECT follow_user_id
+            FROM users_follow_list
+            WHERE user_id = :user_id
+        """), {
+            'user_id' : user_id
+        }).fetchall()
 
-    # unfollow
+        return [row['follow_user_id'] for row in rows]
+
+    # unfollow (언팔로우한 사용자의 tweet을 timeline에서 제거)
     def insert_unfollow(self, user_id, unfollow_id):
-        return self.db.execute(text("""
-            DELETE FROM users_follow_list
+        with self.shards.engine(user_id).begin() as conn:
+            rowcount = conn.execute(text("""
+                DELETE FROM users_follow_list
+                WHERE user_id = :id
+                AND follow_user_id = :unfollow
+            """), {
+                'id' : user_id,
+                'unfollow' : unfollow_id
+            }).rowcount
+
+            if len(self.shards) == 1:
+                self.update_follower_count(conn, unfollow_id, -rowcount)
+                conn.execute(text("""
+                    DELETE tl
+                    FROM timelines tl
+                    JOIN tweets t ON t.id = tl.tweet_id
+                    WHERE tl.user_id = :id
+                    AND t.user_id = :unfollow
+                    AND t.user_id <> tl.user_id
+                """), {
+                    'id' : user_id,
+                    'unfollow' : unfollow_id
+                })
+
+            # pull 대상에서 push 대상으로 바뀐 경우 pull 되던 tweet을 남은 팔로워들에게 push
+            if len(self.shards) == 1 and rowcount:
+                conn.execute(text("""
+                    INSERT IGNORE INTO timelines (
+                        user_id,
+                        tweet_id
+                    )
+                    SELECT ufl.user_id, t.id
+                    FROM users_follow_list ufl
+                    JOIN tweets t ON t.user_id = ufl.follow_user_id
+                    WHERE ufl.follow_user_id = :unfollow
+                    AND (SELECT follower_count FROM users WHERE id = :unfollow) = :threshold
+                """), {
+                    'unfollow'  : unfollow_id,
+                    'threshold' : self.fanout_threshold
+                })
+
+        if len(self.shards) > 1:
+            self.update_follower_count(self.shards.engine(unfollow_id), unfollow_id, -rowcount)
+        self.shards.pin(user_id)
+        if rowcount and self.follow_graph is not None:
+            self.follow_graph.unfollow(user_id, unfollow_id)
+        return rowcount
+
+    # follow_ids 전체를 한 번에 팔로우 (이미 팔로우 중인 id는 무시), 새로 팔로우 한 id 목록 반환
+    def insert_follow_many(self, user_id, follow_ids):
+        follow_ids = list(dict.fromkeys(int(follow_id) for follow_id in follow_ids))
+        if not follow_ids:
+            return []
+
+        with self.shards.engine(user_id).begin() as conn:
+            followed = self.select_follow_ids(conn, user_id, follow_ids)
+            new_ids  = [follow_id for follow_id in follow_ids if follow_id not in followed]
+            if new_ids:
+                params = {'id' : user_id}
+                values = []
+                for n, follow_id in enumerate(new_ids):
+                    params[f'follow_{n}'] = follow_id
+                    values.append(f"(:id, :follow_{n})")
+                rowcount = conn.execute(text(f"""
+                    INSERT IGNORE INTO users_follow_list (
+                        user_id,
+                        follow_user_id
+                    ) VALUES {", ".join(values)}
+                """), params).rowcount
+
+                # 없는 사용자 등으로 무시된 row가 있으면 실제로 추가된 id만 남김
+                if rowcount != len(new_ids):
+                    inserted = self.select_follow_ids(conn, user_id, new_ids)
+                    new_ids  = [follow_id for follow_id in new_ids if follow_id in inserted]
+
+            if len(self.shards) == 1 and new_ids:
+                self.update_follower_counts(conn, new_ids, 1)
+                conn.execute(text("""
+                    INSERT IGNORE INTO timelines (
+                        user_id,
+                        tweet_id
+                    )
+                    SELECT :id, t.id
+                    FROM tweets t
+                    JOIN users u ON u.id = t.user_id
+                    WHERE t.user_id IN :follow_ids
+                    AND u.follower_count <= :threshold
+                """).bindparams(bindparam('follow_ids', expanding=True)), {
+                    'id'         : user_id,
+                    'follow_ids' : new_ids,
+                    'threshold'  : self.fanout_threshold
+                })
+
+        if len(self.shards) > 1:
+            for engine, ids in self.shards.group(new_ids).items():
+                self.update_follower_counts(engine, ids, 1)
+        self.shards.pin(user_id)
+        if self.follow_graph is not None:
+            for follow_id in new_ids:
+                self.follow_graph.follow(user_id, follow_id)
+        return new_ids
+
+    # unfollow_ids 전체를 한 번에 unfollow (팔로우 중이 아닌 id는 무시), 실제로 unfollow 한 id 목록 반환
+    def insert_unfollow_many(self, user_id, unfollow_ids):
+        unfollow_ids = list(dict.fromkeys(int(unfollow_id) for unfollow_id in unfollow_ids))
+        if not unfollow_ids:
+            return []
+
+        with self.shards.engine(user_id).begin() as conn:
+            followed    = self.select_follow_ids(conn, user_id, unfollow_ids)
+            deleted_ids = [unfollow_id for unfollow_id in unfollow_ids if unfollow_id in followed]
+            if deleted_ids:
+                conn.execute(text("""
+                    DELETE FROM users_follow_list
+                    WHERE user_id = :id
+                    AND follow_user_id IN :unfollow_ids
+                """).bindparams(bindparam('unfollow_ids', expanding=True)), {
+                    'id'           : user_id,
+                    'unfollow_ids' : deleted_ids
+                })
+
+            if len(self.shards) == 1 and deleted_ids:
+                self.update_follower_counts(conn, deleted_ids, -1)
+                conn.execute(text("""
+                    DELETE tl
+                    FROM timelines tl
+                    JOIN tweets t ON t.id = tl.tweet_id
+                    WHERE tl.user_id = :id
+                    AND t.user_id IN :unfollow_ids
+                    AND t.user_id <> tl.user_id
+                """).bindparams(bindparam('unfollow_ids', expanding=True)), {
+                    'id'           : user_id,
+                    'unfollow_ids' : deleted_ids
+                })
+
+                # pull 대상에서 push 대상으로 바뀐 작성자의 tweet을 남은 팔로워들에게 push
+                conn.execute(text("""
+                    INSERT IGNORE INTO timelines (
+                        user_id,
+                        tweet_id
+                    )
+                    SELECT ufl.user_id, t.id
+                    FROM users_follow_list ufl
+                    JOIN users u ON u.id = ufl.follow_user_id
+                    JOIN tweets t ON t.user_id = ufl.follow_user_id
+                    WHERE ufl.follow_user_id IN :unfollow_ids
+                    AND u.follower_count = :threshold
+                """).bindparams(bindparam('unfollow_ids', expanding=True)), {
+                    'unfollow_ids' : deleted_ids,
+                    'threshold'    : self.fanout_threshold
+                })
+
+        if len(self.shards) > 1:
+            for engine, ids in self.shards.group(deleted_ids).items():
+                self.update_follower_counts(engine, ids, -1)
+        self.shards.pin(user_id)
+        if self.follow_graph is not None:
+            for unfollow_id in deleted_ids:
+                self.follow_graph.unfollow(user_id, unfollow_id)
+        return deleted_ids
+
+    # follow_ids 중 user_id가 팔로우 중인 id (갱신할 row를 잠금)
+    def select_follow_ids(self, conn, user_id, follow_ids):
+        return {row['follow_user_id'] for row in conn.execute(text("""
+            SELECT follow_user_id
+            FROM users_follow_list
             WHERE user_id = :id
-            AND follow_user_id = :unfollow
+            AND follow_user_id IN :follow_ids
+            FOR UPDATE
+        """).bindparams(bindparam('follow_ids', expanding=True)), {
+            'id'         : user_id,
+            'follow_ids' : follow_ids
+        })}
+
+    # 여러 follow 관계를 multi-row INSERT로 추가하고 팔로우 대상들의 follower_count를 다시 계산 (bulk import)
+    # timelines는 채우지 않으므로 tweet이 이미 있으면 이후 backfill_timelines 필요
+    def insert_follows(self, follows):
+        follows  = [(int(user_id), int(follow_id)) for user_id, follow_id in follows]
+        inserted = 0
+        for engine, user_ids in self.shards.group({user_id for user_id, _ in follows}).items():
+            user_ids  = set(user_ids)
+            inserted += engine.execute(text("""
+                INSERT IGNORE INTO users_follow_list (
+                    user_id,
+                    follow_user_id
+                ) VALUES (
+                    :user_id,
+                    :follow_user_id
+                )
+            """), [{
+                'user_id'        : user_id,
+                'follow_user_id' : follow_id
+            } for user_id, follow_id in follows if user_id in user_ids]).rowcount
+
+        # follow 관계는 팔로워들의 shard에 흩어져 있으므로 모든 shard에서 세어 합침
+        follow_ids = list({follow_id for _, follow_id in follows})
+        counts     = dict.fromkeys(follow_ids, 0)
+        for rows in self.shards.map(lambda engine: engine.execute(text("""
+            SELECT follow_user_id, COUNT(*) AS count
+            FROM users_follow_list
+            WHERE follow_user_id IN :follow_ids
+            GROUP BY follow_user_id
+        """).bindparams(bindparam('follow_ids', expanding=True)), {
+            'follow_ids' : follow_ids
+        }).fetchall(), self.shards.engines):
+            for row in rows:
+                counts[row['follow_user_id']] += row['count']
+
+        for engine, user_ids in self.shards.group(follow_ids).items():
+            engine.execute(text("""
+                UPDATE users
+                SET follower_count = :count
+                WHERE id = :user_id
+            """), [{
+                'count'   : counts[user_id],
+                'user_id' : user_id
+            } for user_id in user_ids])
+
+        if self.follow_graph is not None:
+            for user_id, follow_id in follows:
+                self.follow_graph.follow(user_id, follow_id)
+        return inserted
+
+    def update_follower_count(self, conn, user_id, delta):
+        conn.execute(text("""
+            UPDATE users
+            SET follower_count = follower_count + :delta
+            WHERE id = :user_id
         """), {
-            'id' : user_id,
-            'unfollow' : unfollow_id
-        }).rowcount
+            'delta'   : delta,
+            'user_id' : user_id
+        })
     
-    # profile picture 
+    def update_follower_counts(self, conn, user_ids, delta):
+        conn.execute(text("""
+            UPDATE users
+            SET follower_count = follower_count + :delta
+            WHERE id IN :user_ids
+        """).bindparams(bindparam('user_ids', expanding=True)), {
+            'delta'    : delta,
+            'user_ids' : user_ids
+        })
+
+    # profile picture 저장
     def save_profile_picture(self, profile_pic_path, user_id):
-        return self.db.execute(text("""
+        rowcount = self.shards.engine(user_id).execute(text("""
             UPDATE users 
             SET profile_picture = :profile_pic_path
             WHERE id = :user_id
@@ -71,10 +410,20 @@ class UserDao:
             'user_id' : user_id,
             'profile_pic_path' : profile_pic_path
         }).rowcount
+        self.shards.pin(user_id)
+
+        if self.cache is not None:
+            self.cache.delete(f'user:{user_id}')
+        return rowcount
     
-    # profile picture ȸ
+    # profile picture 조회
     def get_profile_picture(self, user_id):
-        row = self.db.execute(text("""
+        if self.cache is not None:
+            profile_picture = self.cache.get(f'user:{user_id}', 'profile_picture')
+            if profile_picture is not None:
+                return profile_picture
+
+        row = self.shards.read_engine(user_id).execute(text("""
             SELECT profile_picture
             FROM users
             WHERE id = :user_id
@@ -82,4 +431,7 @@ class UserDao:
             'user_id' : user_id
         }).fetchone()
 
-        return row['profile_picture'] if row else None
\ No newline at end of file
+        profile_picture = row['profile_picture'] if row else None
+        if self.cache is not None and profile_picture is not None:
+            self.cache.set(f'user:{user_id}', 'profile_picture', profile_picture)
+        return profile_picture
\ No newline at end of file
@@ -1,7 +1,12 @@
 from .tweet_service import TweetService
 from .user_service import UserService
+from .bulk_import import BulkImportService
+from .password_hasher import PasswordHasher, PasswordHasherBusy
 
 __all__ = [
     'UserService',
-    'TweetService'
+    'TweetService',
+    'BulkImportService',
+    'PasswordHasher',
+    'PasswordHasherBusy'
 ]
\ No newline at end of file
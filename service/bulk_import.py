@@ -0,0 +1,66 @@
+import csv
+import json
+import time
+import bcrypt
+from itertools import islice
+
+# NDJSON(한 줄에 JSON 하나) 또는 CSV(.csv, 첫 줄은 header) 파일을 한 줄씩 읽음
+def read_records(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def chunked(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+# 사용자/tweet/follow 관계를 chunk_size개씩 multi-row INSERT로 가져옴 (메모리 사용량은 chunk 크기만큼)
+# users    : name, email, profile, hashed_password 또는 password, (id)
+# tweets   : user_id, tweet
+# follows  : user_id, follow_user_id (chunk마다 팔로우 대상의 기존 tweet을 팔로워 timeline에 backfill)
+class BulkImportService:
+    def __init__(self, user_dao, tweet_dao, bcrypt_rounds=12):
+        self.user_dao      = user_dao
+        self.tweet_dao     = tweet_dao
+        self.bcrypt_rounds = bcrypt_rounds
+        self.backfilled    = 0 # follows를 가져오며 backfill 한 timeline row 수
+
+    # progress(가져온 row 수, 초당 row 수)는 chunk마다 호출
+    def import_records(self, kind, records, chunk_size=1000, progress=None):
+        insert = {
+            'users'   : self.import_users,
+            'tweets'  : self.import_tweets,
+            'follows' : self.import_follows
+        }[kind]
+
+        imported = 0
+        started  = time.perf_counter()
+        for chunk in chunked(records, chunk_size):
+            insert(chunk)
+            imported += len(chunk)
+            if progress is not None:
+                progress(imported, imported / (time.perf_counter() - started))
+        return imported
+
+    def import_users(self, users):
+        for user in users:
+            if not user.get('hashed_password'):
+                user['hashed_password'] = bcrypt.hashpw(user['password'].encode('UTF-8'), bcrypt.gensalt(self.bcrypt_rounds))
+        return self.user_dao.insert_users(users)
+
+    def import_tweets(self, tweets):
+        return self.tweet_dao.insert_tweets([(int(tweet['user_id']), tweet['tweet']) for tweet in tweets])
+
+    def import_follows(self, follows):
+        follows  = [(int(follow['user_id']), int(follow['follow_user_id'])) for follow in follows]
+        inserted = self.user_dao.insert_follows(follows)
+        self.backfilled += self.tweet_dao.backfill_follow_timelines(follows)
+        return inserted
@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+import bcrypt
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class PasswordHasherBusy(Exception):
+    pass
+
+# bcrypt hash/check를 전용 thread pool(workers개)에서 실행
+# 실행 중 + 대기 중인 요청이 workers + queue_size개를 넘으면 기다리지 않고 PasswordHasherBusy (503)
+# 그래서 로그인이 몰려도 bcrypt를 기다리며 막히는 WSGI thread는 최대 workers + queue_size개
+# rounds는 새로 만드는 hash의 bcrypt cost (1 늘 때마다 hash/check 시간이 2배)
+class PasswordHasher:
+    def __init__(self, workers=None, queue_size=None, rounds=12):
+        self.rounds     = rounds
+        self.workers    = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 2 if queue_size is None else queue_size
+        self.executor   = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        self.lock       = threading.Lock()
+        self.in_flight  = 0 # 실행 중 + 대기 중
+        self.active     = 0 # 실행 중
+        self.completed  = 0
+        self.rejected   = 0
+        self.latencies  = deque(maxlen=1000) # 최근 (대기 시간, 실행 시간)
+
+    # 실행 중 + 대기 중인 요청을 max_in_flight개 이하로 줄임 (시작할 때 호출)
+    # bcrypt를 기다리는 동안 요청 thread를 잡고 있으므로 요청 thread pool보다 작아야 다른 요청을 처리할 thread가 남음
+    def limit(self, max_in_flight):
+        with self.lock:
+            workers         = max(1, min(self.workers, max_in_flight))
+            self.queue_size = max(0, min(self.queue_size, max_in_flight - workers))
+            if workers != self.workers:
+                self.workers = workers
+                self.executor.shutdown()
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+
+    def hash(self, password):
+        return self.run(bcrypt.hashpw, password.encode('UTF-8'), bcrypt.gensalt(self.rounds))
+
+    # 쉬는 worker가 있을 때만 background에서 hash 한 뒤 callback(hash)을 호출하고 Future 반환, 없으면 None
+    # (결과를 기다리지 않으므로 요청 thread를 잡지 않고, 로그인 요청의 bcrypt보다 먼저 worker를 차지하지 않음)
+    def hash_in_background(self, password, callback):
+        with self.lock:
+            if self.in_flight >= self.workers:
+                return None
+            self.in_flight += 1
+
+        def run(submitted):
+            try:
+                callback(self.timed(bcrypt.hashpw, submitted, password.encode('UTF-8'), bcrypt.gensalt(self.rounds)))
+            except Exception:
+                logging.exception('background password hash failed')
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+        return self.executor.submit(run, time.perf_counter())
+
+    def check(self, password, hashed_password):
+        return self.run(bcrypt.checkpw, password.encode('UTF-8'), hashed_password.encode('UTF-8'))
+
+    # 저장된 hash($2b$<cost>$...)의 cost가 rounds와 다르면 다시 hash 해야 함
+    def needs_rehash(self, hashed_password):
+        return int(hashed_password.split('$')[2]) != self.rounds
+
+    def run(self, fn, *args):
+        with self.lock:
+            if self.in_flight >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.in_flight += 1
+
+        try:
+            return self.executor.submit(self.timed, fn, time.perf_counter(), *args).result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def timed(self, fn, submitted, *args):
+        started = time.perf_counter()
+        with self.lock:
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            with self.lock:
+                self.active    -= 1
+                self.completed += 1
+                self.latencies.append((started - submitted, finished - started))
+
+    def stats(self):
+        with self.lock:
+            waits = sorted(wait for wait, _ in self.latencies)
+            runs  = sorted(run for _, run in self.latencies)
+            return {
+                'workers'    : self.workers,
+                'queue_size' : self.queue_size,
+                'active'     : self.active,
+                'queued'     : self.in_flight - self.active,
+                'completed'  : self.completed,
+                'rejected'   : self.rejected,
+                'wait_ms'    : percentiles(waits),
+                'run_ms'     : percentiles(runs)
+            }
+
+def percentiles(values):
+    if not values:
+        return None
+    return {
+        f'p{p}' : round(values[min(len(values) - 1, len(values) * p // 100)] * 1000, 3)
+        for p in [50, 90, 99]
+    }
+
+# 이 머신에서 cost별 bcrypt hash 시간(ms, samples번 중 중간값)을 재서 [(rounds, ms)]와
+# target_ms 안에 끝나는 가장 큰 cost를 반환 (cost마다 2배씩 느려지므로 target_ms를 넘으면 중단)
+def calibrate(target_ms, samples=3, min_rounds=4, max_rounds=16):
+    results = []
+    for rounds in range(min_rounds, max_rounds + 1):
+        salt  = bcrypt.gensalt(rounds)
+        times = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.hashpw(b'calibration', salt)
+            times.append((time.perf_counter() - started) * 1000)
+
+        results.append((rounds, sorted(times)[len(times) // 2]))
+        if results[-1][1] > target_ms:
+            break
+
+    fitting = [rounds for rounds, ms in results if ms <= target_ms]
+    return results, max(fitting) if fitting else min_rounds
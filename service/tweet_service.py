@@ -1,11 +1,155 @@
+import uuid
+import hashlib
+import logging
+
+def timeline_cache_key(user_id):
+    return f'timeline:{user_id}'
+
+# 작성자가 tweet 할 때마다 바뀌는 버전 (pull 대상 작성자를 팔로우 하는 사용자의 timeline 캐시 확인용)
+def author_cache_key(user_id):
+    return f'author:{user_id}'
+
+# 캐시 key가 삭제(무효화)되거나 만료되면 새로 만들어지는 버전 값 (ETag로 사용)
+def new_version():
+    return uuid.uuid4().hex
+
 class TweetService:
-    def __init__(self, tweet_dao):      
+    # broker(TimelineBroker)가 있으면 새 tweet을 /timeline/stream 구독자에게 전달
+    # spool(TweetSpool)이 있으면 enqueue_tweet으로 받은 tweet을 spool에 기록하고 background에서 저장
+    def __init__(self, tweet_dao, cache=None, broker=None, spool=None):      
         self.tweet_dao = tweet_dao
+        self.cache     = cache
+        self.broker    = broker
+        self.spool     = spool
+        if spool is not None:
+            spool.start(self.save_tweets)
 
     def tweet(self, user_id, tweet):
         if len(tweet) > 300:
             return None
-        return self.tweet_dao.insert_tweet(user_id, tweet)
+        tweet_id = self.tweet_dao.insert_tweet(user_id, tweet)
+        self.published(user_id, tweet_id, tweet)
+        return tweet_id
+
+    # spool에 기록만 하고 반환 (DB 저장은 spool drain thread가 save_tweets로)
+    def enqueue_tweet(self, user_id, tweet):
+        if len(tweet) > 300:
+            return None
+        self.spool.append(user_id, tweet)
+        return True
+
+    # spool drain thread가 [(key, user_id, tweet)]로 호출, key로 같은 record는 한 번만 저장
+    # 저장한 뒤의 캐시 무효화/전달이 실패해도 spool이 같은 batch를 다시 처리하지 않도록 오류는 기록만 함
+    def save_tweets(self, tweets):
+        tweet_ids = self.tweet_dao.insert_tweets(
+            [(user_id, tweet) for _, user_id, tweet in tweets],
+            [key for key, _, _ in tweets]
+        )
+        for (_, user_id, tweet), tweet_id in zip(tweets, tweet_ids):
+            try:
+                self.published(user_id, tweet_id, tweet)
+            except Exception:
+                logging.exception('failed to publish tweet %s', tweet_id)
+        return tweet_ids
+
+    def published(self, user_id, tweet_id, tweet):
+        # 작성자와 push 받은 팔로워들의 timeline 캐시 무효화
+        # pull 대상 작성자의 팔로워 캐시는 작성자 버전을 바꿔서 읽을 때 무효화 (validate_timeline_cache)
+        if self.cache is not None:
+            user_ids = [user_id] + self.tweet_dao.get_push_follower_ids(user_id)
+            self.cache.delete(*[timeline_cache_key(id) for id in user_ids], author_cache_key(user_id))
+
+        if self.broker is not None:
+            self.broker.publish(user_id, {
+                'id'      : tweet_id,
+                'user_id' : user_id,
+                'tweet'   : tweet
+            })
+
+    # 첫 page(limit별)만 캐시
+    # before/since(클라이언트가 보낸 cursor)는 값마다 field가 늘어나서 한 key가 TTL 동안 계속 커지므로 캐시하지 않음
+    def get_timeline(self, user_id, limit=None, before=None, since=None):
+        if self.cache is None or before is not None or since is not None:
+            return self.tweet_dao.get_timeline(user_id, limit, before, since)
+
+        self.validate_timeline_cache(user_id)
+        key      = timeline_cache_key(user_id)
+        page     = f'page:{limit}'
+        timeline = self.cache.get(key, page)
+        if timeline is None:
+            timeline = self.tweet_dao.get_timeline(user_id, limit, before)
+            self.cache.set(key, page, timeline)
+        return timeline
+
+    # 여러 사용자의 timeline을 한 번에 조회: 캐시에 없는 사용자들만 모아서 DAO에서 일괄 조회
+    def get_timelines(self, user_ids, limit=None, before=None, since=None):
+        if self.cache is None or before is not None or since is not None:
+            return self.tweet_dao.get_timelines(user_ids, limit, before, since)
+
+        self.validate_timeline_caches(user_ids)
+        page      = f'page:{limit}'
+        timelines = dict(zip(user_ids, self.cache.get_many([timeline_cache_key(user_id) for user_id in user_ids], page)))
+        missing   = [user_id for user_id, timeline in timelines.items() if timeline is None]
+        if missing:
+            for user_id, timeline in self.tweet_dao.get_timelines(missing, limit, before).items():
+                self.cache.set(timeline_cache_key(user_id), page, timeline)
+                timelines[user_id] = timeline
+        return timelines
+
+    # timeline이 바뀔 때(tweet, follow, unfollow) 함께 바뀌는 버전 (캐시가 없으면 None)
+    def get_timeline_version(self, user_id):
+        if self.cache is None:
+            return None
+
+        self.validate_timeline_cache(user_id)
+        key     = timeline_cache_key(user_id)
+        version = self.cache.get(key, 'version')
+        if version is None:
+            version = new_version()
+            self.cache.set(key, 'version', version)
+        return version
+
+    # pull 대상 작성자의 tweet은 팔로워 캐시를 지우지 않으므로, timeline 캐시에 그 작성자들의 버전을 함께 저장하고
+    # 읽을 때 작성자 버전이 바뀌었으면(새 tweet) timeline 캐시(page와 ETag 버전)를 삭제
+    def validate_timeline_cache(self, user_id):
+        self.validate_timeline_caches([user_id])
+
+    # 사용자 수와 무관하게 캐시 조회 몇 번과 (다시 만들 캐시가 있으면) pull 대상 작성자 query 한 번
+    def validate_timeline_caches(self, user_ids):
+        keys          = [timeline_cache_key(user_id) for user_id in user_ids]
+        pull_versions = self.cache.get_many(keys, 'pull_versions')
+        pull_authors  = self.cache.get_many(keys, 'pull_authors')
+        cached        = {
+            user_id : (versions, author_ids)
+            for user_id, versions, author_ids in zip(user_ids, pull_versions, pull_authors)
+            if versions is not None and author_ids is not None
+        }
+        current = self.get_pull_versions({user_id : author_ids for user_id, (_, author_ids) in cached.items()})
+        stale   = [user_id for user_id in user_ids if user_id not in cached or cached[user_id][0] != current[user_id]]
+        if not stale:
+            return
+        self.cache.delete(*[timeline_cache_key(user_id) for user_id in stale])
+
+        # 캐시를 다시 만들기 전에 작성자 버전을 먼저 기록 (그 사이의 tweet은 다음 읽기에서 무효화)
+        author_ids = self.tweet_dao.get_pull_author_ids_by_user(stale)
+        versions   = self.get_pull_versions(author_ids)
+        for user_id in stale:
+            self.cache.set(timeline_cache_key(user_id), 'pull_authors', author_ids[user_id])
+            self.cache.set(timeline_cache_key(user_id), 'pull_versions', versions[user_id])
+
+    # {user_id: pull 대상 작성자 id} -> {user_id: 작성자 버전들의 hash}, 작성자 버전은 모든 사용자를 합쳐 한 번에 조회
+    # (버전이 없는 작성자는 새 버전을 저장하고 사용)
+    def get_pull_versions(self, author_ids):
+        keys     = {author_cache_key(author_id) for ids in author_ids.values() for author_id in ids}
+        versions = self.cache.add_many('version', {key : new_version() for key in keys})
+        return {
+            user_id : hashlib.sha1(':'.join(versions[author_cache_key(author_id)] for author_id in ids).encode('utf-8')).hexdigest()
+            for user_id, ids in author_ids.items()
+        }
+
+    # 큰 timeline 응답 streaming용 (캐시를 거치지 않음)
+    def iter_timeline(self, user_id, limit=None, before=None, since=None):
+        return self.tweet_dao.iter_timeline(user_id, limit, before, since)
 
-    def get_timeline(self, user_id):
-        return self.tweet_dao.get_timeline(user_id)
\ No newline at end of file
+    def backfill_timelines(self):
+        return self.tweet_dao.backfill_timelines()
\ No newline at end of file
@@ -1,31 +1,65 @@
 import jwt
-import bcrypt
 import os
 from datetime import datetime, timedelta
+from .tweet_service import timeline_cache_key, new_version
+from .password_hasher import PasswordHasher
+
+def login_miss_key(email):
+    return f'login-miss:{email.lower()}'
 
 class UserService:
-    def __init__(self, user_dao, config, s3_client):
+    # password_hasher(PasswordHasher)가 bcrypt를 전용 thread pool에서 실행 (가득 차면 PasswordHasherBusy)
+    def __init__(self, user_dao, config, s3_client, cache=None, broker=None, password_hasher=None, login_misses=None):
         self.user_dao = user_dao
         self.config = config
         self.s3 = s3_client
+        self.cache = cache
+        self.broker = broker
+        self.password_hasher = password_hasher or PasswordHasher()
+        self.login_misses = login_misses
     
     def create_new_user(self, new_user):
-        new_user['password'] = bcrypt.hashpw(
-            new_user['password'].encode('UTF-8'),
-            bcrypt.gensalt()
-        )
+        new_user['password'] = self.password_hasher.hash(new_user['password'])
 
         new_user_id = self.user_dao.insert_user(new_user)
+        if self.login_misses is not None:
+            self.login_misses.delete(login_miss_key(new_user['email']))
         return new_user_id
     
+    # 사용자 조회 한 번으로 인증하고 {'user_id', 'access_token'} 반환, 실패하면 None
+    # login_misses(캐시)가 있으면 없는 email을 잠시 기억해서 같은 email의 재시도는 DB를 조회하지 않음
     def login(self, credential):
         email = credential['email']
         password = credential['password']
+        miss_key = login_miss_key(email)
+        if self.login_misses is not None and self.login_misses.get(miss_key, 'miss'):
+            return None
+
         user_credential = self.user_dao.get_user_id_and_password(email)
+        if user_credential is None:
+            if self.login_misses is not None:
+                self.login_misses.set(miss_key, 'miss', True)
+            return None
+
+        if not self.password_hasher.check(password, user_credential['hashed_password']):
+            return None
 
-        authorized = user_credential and bcrypt.checkpw(password.encode('UTF-8'), user_credential['hashed_password'].encode('UTF-8'))
-        return authorized
+        user_id = user_credential['id']
+        if self.password_hasher.needs_rehash(user_credential['hashed_password']):
+            self.rehash_password(user_id, password, user_credential['hashed_password'])
+        return {
+            'user_id' : user_id,
+            'access_token' : self.generate_access_token(user_id).decode('utf-8')
+        }
     
+    # 로그인에 성공한 비밀번호를 현재 BCRYPT_ROUNDS로 background에서 다시 hash 해서 저장 (로그인 응답은 기다리지 않음)
+    # 쉬는 bcrypt worker가 없으면 이번에는 건너뛰고 다음 로그인에서 (BCRYPT_ROUNDS를 바꾼 직후 로그인 bcrypt가 2배가 되지 않도록)
+    def rehash_password(self, user_id, password, hashed_password):
+        return self.password_hasher.hash_in_background(
+            password,
+            lambda new_hashed_password: self.user_dao.update_hashed_password(user_id, hashed_password, new_hashed_password)
+        )
+
     def generate_access_token(self, user_id):
         payload = {
             'user_id' : user_id,
@@ -35,10 +69,42 @@ class UserService:
         return token.encode('UTF-8')
     
     def follow(self, user_id, follow_id):
-        return self.user_dao.insert_follow(user_id, follow_id)
+        result = self.user_dao.insert_follow(user_id, follow_id)
+        if self.cache is not None:
+            self.cache.delete(timeline_cache_key(user_id))
+        if self.broker is not None:
+            self.broker.follow(user_id, follow_id)
+        return result
     
     def unfollow(self, user_id, unfollow_id):
-        return self.user_dao.insert_unfollow(user_id, unfollow_id)
+        result = self.user_dao.insert_unfollow(user_id, unfollow_id)
+        if self.cache is not None:
+            self.cache.delete(timeline_cache_key(user_id))
+        if self.broker is not None:
+            self.broker.unfollow(user_id, unfollow_id)
+        return result
+
+    # 여러 사용자를 한 번에 follow/unfollow, 실제로 바뀐 id 목록 반환
+    def follow_many(self, user_id, follow_ids):
+        followed = self.user_dao.insert_follow_many(user_id, follow_ids)
+        if self.cache is not None and followed:
+            self.cache.delete(timeline_cache_key(user_id))
+        if self.broker is not None:
+            for follow_id in followed:
+                self.broker.follow(user_id, follow_id)
+        return followed
+
+    def unfollow_many(self, user_id, unfollow_ids):
+        unfollowed = self.user_dao.insert_unfollow_many(user_id, unfollow_ids)
+        if self.cache is not None and unfollowed:
+            self.cache.delete(timeline_cache_key(user_id))
+        if self.broker is not None:
+            for unfollow_id in unfollowed:
+                self.broker.unfollow(user_id, unfollow_id)
+        return unfollowed
+
+    def get_follow_ids(self, user_id):
+        return self.user_dao.get_follow_ids(user_id)
     
     def get_user_id_and_password(self, email):
         return self.user_dao.get_user_id_and_password(email)
@@ -50,7 +116,22 @@ class UserService:
         
         img_url = f"{self.config.S3_BUCKET_URL}{filename}"
 
-        return self.user_dao.save_profile_picture(img_url, user_id)
+        result = self.user_dao.save_profile_picture(img_url, user_id)
+        if self.cache is not None:
+            self.cache.delete(f'profile-picture:{user_id}')
+        return result
     
     def get_profile_picture(self, user_id):
-        return self.user_dao.get_profile_picture(user_id)
\ No newline at end of file
+        return self.user_dao.get_profile_picture(user_id)
+
+    # profile picture가 바뀔 때 함께 바뀌는 버전 (캐시가 없으면 None)
+    def get_profile_picture_version(self, user_id):
+        if self.cache is None:
+            return None
+
+        key     = f'profile-picture:{user_id}'
+        version = self.cache.get(key, 'version')
+        if version is None:
+            version = new_version()
+            self.cache.set(key, 'version', version)
+        return version
\ No newline at end of file
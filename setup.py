@@ -1,15 +1,74 @@
 import sys
-from flask_script import Manager
-from app import create_app
-from flask_twisted import Twisted
-from twisted.python import log
+import argparse
+from service.password_hasher import calibrate
+
+# 이 머신에서 로그인 한 번의 bcrypt 시간이 target_ms 안에 끝나는 BCRYPT_ROUNDS 추천
+def calibrate_bcrypt(target_ms):
+    results, recommended = calibrate(target_ms)
+    for rounds, ms in results:
+        print(f"rounds {rounds:2d}: {ms:8.1f} ms ({1000 / ms:,.1f} logins/s per core)")
+    print(f"Recommended BCRYPT_ROUNDS = {recommended} (target {target_ms:.0f} ms)")
 
 if __name__ == '__main__':
-    app = create_app()
+    # python setup.py calibrate_bcrypt --target-ms 250
+    # 배포할 머신에서 config.py, DB 없이 실행할 수 있도록 create_app() 전에 처리
+    if sys.argv[1:2] == ['calibrate_bcrypt']:
+        parser = argparse.ArgumentParser(prog='setup.py calibrate_bcrypt')
+        parser.add_argument('-t', '--target-ms', dest='target_ms', type=float, default=250)
+        calibrate_bcrypt(parser.parse_args(sys.argv[2:]).target_ms)
+        sys.exit()
+
+    # app.py는 import 할 때 config.py가 필요하므로 calibrate_bcrypt 처리 뒤에 import
+    from flask_script import Manager
+    from app import create_app
+    from flask_twisted import Twisted
+    from twisted.python import log
+    from twisted.internet import reactor
+    from twisted.web.server import Site
+    from view.timeline_stream import TimelineBroker, TimelineStreamResource, TimelineResource, redacted_log_formatter
+    from service.bulk_import import read_records
+
+    broker = TimelineBroker()
+    app = create_app(timeline_broker=broker, start_workers=sys.argv[1:2] == ['runserver'])
+    # 로그인(bcrypt)을 기다리는 요청이 WSGI thread pool(reactor thread pool)의 절반을 넘지 않도록
+    hasher = app.services.user_service.password_hasher
+    hasher.limit(reactor.getThreadPool().max // 2)
     twisted = Twisted(app)
+    # access log에 /timeline/stream?access_token= 의 token을 남기지 않음
+    twisted.create_site = lambda resource, **options: Site(resource, logFormatter=redacted_log_formatter)
+    # /timeline/stream (Server-Sent Events)은 WSGI thread 없이 reactor에서 처리
+    twisted.add_resource(b'timeline', TimelineResource(
+        app,
+        TimelineStreamResource(app, app.services.user_service, broker)
+    ))
     log.startLogging(sys.stdout)
 
     app.logger.info(f"Running the app...")
 
     manager = Manager(app)
+
+    # 기존 데이터로 timelines 테이블 채우기
+    @manager.command
+    def backfill_timelines():
+        inserted = app.services.tweet_service.backfill_timelines()
+        print(f"Backfilled {inserted} timeline rows")
+
+    # NDJSON/CSV 파일로 사용자, tweet, follow 관계 가져오기
+    # python setup.py import_data users users.ndjson (users -> follows -> tweets 순서 권장)
+    # (Flask-Script는 아래쪽 option부터 등록하므로 위치 인자는 역순으로 적음)
+    @manager.option('-c', '--chunk-size', dest='chunk_size', type=int, default=1000)
+    @manager.option('path')
+    @manager.option('kind', choices=['users', 'tweets', 'follows'])
+    def import_data(kind, path, chunk_size):
+        def progress(imported, rate):
+            print(f"\r{kind}: {imported} rows ({rate:.0f} rows/s)", end='', flush=True)
+
+        bulk_import_service = app.services.bulk_import_service
+        imported = bulk_import_service.import_records(kind, read_records(path), chunk_size, progress)
+        print(f"\nImported {imported} {kind}")
+
+        # follows는 chunk마다 이미 있던 tweet을 팔로워 timeline에 채움
+        if kind == 'follows':
+            print(f"Backfilled {bulk_import_service.backfilled} timeline rows")
+
     manager.run()
\ No newline at end of file
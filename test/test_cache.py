@@ -0,0 +1,152 @@
+import sys, os, time, uuid
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+from cache import LRUCache, RedisCache
+import pytest
+from unittest import mock
+
+def test_get_and_set():
+    cache = LRUCache(max_size=10, ttl=60)
+
+    assert cache.get('timeline:1', 'page') is None
+    cache.set('timeline:1', 'page', [1, 2, 3])
+    assert cache.get('timeline:1', 'page') == [1, 2, 3]
+    assert cache.get('timeline:1', 'other') is None
+
+    assert cache.stats() == {
+        'size'      : 1,
+        'hits'      : 1,
+        'misses'    : 2,
+        'evictions' : 0
+    }
+
+def test_delete():
+    cache = LRUCache()
+    cache.set('timeline:1', 'page', [1])
+    cache.set('timeline:2', 'page', [2])
+
+    cache.delete('timeline:1', 'timeline:3')
+
+    assert cache.get('timeline:1', 'page') is None
+    assert cache.get('timeline:2', 'page') == [2]
+
+def test_add():
+    cache = LRUCache()
+
+    # field가 없을 때만 저장
+    assert cache.add('request:1', 'fingerprint', 'a')
+    assert not cache.add('request:1', 'fingerprint', 'b')
+    assert cache.get('request:1', 'fingerprint') == 'a'
+    assert cache.add('request:1', 'response', 'ok')
+
+def test_get_and_add_many():
+    cache = LRUCache()
+    cache.set('author:1', 'version', 'a')
+
+    assert cache.get_many(['author:1', 'author:2'], 'version') == ['a', None]
+    # 없는 key에만 저장하고 저장되어 있는 값을 반환
+    assert cache.add_many('version', {'author:1' : 'b', 'author:2' : 'c'}) == {'author:1' : 'a', 'author:2' : 'c'}
+    assert cache.get_many(['author:1', 'author:2'], 'version') == ['a', 'c']
+
+def test_lru_eviction():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 'page', 1)
+    cache.set('b', 'page', 2)
+    # a를 최근에 사용했으므로 b가 eviction 대상
+    cache.get('a', 'page')
+    cache.set('c', 'page', 3)
+
+    assert cache.get('b', 'page') is None
+    assert cache.get('a', 'page') == 1
+    assert cache.get('c', 'page') == 3
+    assert cache.stats()['evictions'] == 1
+
+@mock.patch('cache.lru_cache.time')
+def test_ttl(mock_time):
+    mock_time.monotonic.return_value = 100
+    cache = LRUCache(ttl=60)
+    cache.set('a', 'page', 1)
+
+    mock_time.monotonic.return_value = 159
+    assert cache.get('a', 'page') == 1
+
+    mock_time.monotonic.return_value = 160
+    assert cache.get('a', 'page') is None
+    assert cache.stats()['size'] == 0
+
+    # expire는 만료 시간을 지금부터 ttl초 후로 변경
+    cache.set('a', 'page', 1)
+    cache.expire('a', 600)
+    mock_time.monotonic.return_value = 759
+    assert cache.get('a', 'page') == 1
+
+
+@mock.patch('cache.redis_cache.redis')
+def test_redis_cache(mock_redis):
+    client = mock_redis.Redis.from_url.return_value
+    cache  = RedisCache('redis://localhost:6379/0', ttl=30)
+
+    client.hget.return_value = None
+    assert cache.get('timeline:1', 'page') is None
+    client.hget.assert_called_with('miniter:timeline:1', 'page')
+
+    cache.set('timeline:1', 'page', [{'id' : 1}])
+    client.register_script.return_value.assert_called_with(
+        keys = ['miniter:timeline:1'],
+        args = ['page', '[{"id": 1}]', 30]
+    )
+
+    client.hget.return_value = b'[{"id": 1}]'
+    assert cache.get('timeline:1', 'page') == [{'id' : 1}]
+
+    cache.delete('timeline:1', 'timeline:2')
+    client.delete.assert_called_with('miniter:timeline:1', 'miniter:timeline:2')
+
+    cache.expire('timeline:1', 600)
+    client.expire.assert_called_with('miniter:timeline:1', 600)
+
+    # 여러 key는 pipeline으로 한 번에
+    pipeline = client.pipeline.return_value
+    pipeline.execute.return_value = [b'"a"', None]
+    assert cache.get_many(['author:1', 'author:2'], 'version') == ['a', None]
+    pipeline.hget.assert_called_with('miniter:author:2', 'version')
+
+    pipeline.execute.return_value = [b'"a"', b'"c"']
+    assert cache.add_many('version', {'author:1' : 'b', 'author:2' : 'c'}) == {'author:1' : 'a', 'author:2' : 'c'}
+    client.register_script.return_value.assert_called_with(
+        keys   = ['miniter:author:2'],
+        args   = ['version', '"c"', 30],
+        client = pipeline
+    )
+
+    assert cache.stats()['size'] is None
+
+# 실제 Redis 서버 테스트 (CACHE_REDIS_URL 환경 변수가 있을 때만 실행, 테스트마다 새 prefix 사용)
+@pytest.mark.skipif(not os.environ.get('CACHE_REDIS_URL'), reason='CACHE_REDIS_URL 설정 없음')
+def test_redis_server():
+    cache = RedisCache(os.environ['CACHE_REDIS_URL'], ttl=1, prefix=f'miniter-test:{uuid.uuid4().hex}:')
+    try:
+        assert cache.get('timeline:1', 'page') is None
+        cache.set('timeline:1', 'page', [{'id' : 1}])
+        cache.set('timeline:1', 'version', 'a')
+        assert cache.get('timeline:1', 'page') == [{'id' : 1}]
+
+        assert not cache.add('timeline:1', 'version', 'b')
+        assert cache.add('timeline:2', 'version', 'b')
+        assert cache.get('timeline:2', 'version') == 'b'
+
+        assert cache.add_many('version', {'timeline:2' : 'c', 'timeline:3' : 'c'}) == {'timeline:2' : 'b', 'timeline:3' : 'c'}
+        assert cache.get_many(['timeline:2', 'timeline:4'], 'version') == ['b', None]
+
+        cache.delete('timeline:1')
+        assert cache.get('timeline:1', 'page') is None
+
+        # 첫 field를 저장한 시점부터 ttl 후 만료
+        time.sleep(1.5)
+        assert cache.get('timeline:2', 'version') is None
+
+        stats = cache.stats()
+        assert stats['hits'] == 3
+        assert stats['misses'] == 4
+    finally:
+        cache.delete('timeline:1', 'timeline:2', 'timeline:3')
@@ -0,0 +1,80 @@
+import sys, os, time
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+import numpy as np
+from model import FollowGraph
+from model.follow_graph import CSR
+
+def test_csr():
+    csr = CSR.from_edges(np.array([2, 1, 2, 4]), np.array([3, 2, 1, 1]))
+
+    assert csr.row(1).tolist() == [2]
+    assert csr.row(2).tolist() == [1, 3]
+    assert csr.row(3).tolist() == []
+    assert csr.row(10).tolist() == []
+    assert csr.contains(2, 3)
+    assert not csr.contains(3, 2)
+    assert [edge.tolist() for edge in csr.edges()] == [[1, 2, 2, 4], [2, 1, 3, 1]]
+
+def test_follow_unfollow():
+    follow_graph = FollowGraph()
+    follow_graph.build(np.array([1, 1, 2]), np.array([2, 3, 3]))
+
+    follow_graph.follow(3, 1)
+    follow_graph.unfollow(1, 2)
+
+    assert sorted(follow_graph.get_followee_ids(1)) == [3]
+    assert sorted(follow_graph.get_followee_ids(3)) == [1]
+    assert sorted(follow_graph.get_follower_ids(1)) == [3]
+    assert sorted(follow_graph.get_follower_ids(2)) == []
+    assert sorted(follow_graph.get_follower_ids(3)) == [1, 2]
+
+    # 다시 follow 하면 CSR의 edge가 그대로 살아남
+    follow_graph.follow(1, 2)
+    assert sorted(follow_graph.get_followee_ids(1)) == [2, 3]
+
+def test_snapshot(tmp_path):
+    follow_graph = FollowGraph(str(tmp_path))
+    follow_graph.build(np.array([1, 1, 2]), np.array([2, 3, 3]))
+    follow_graph.follow(3, 1)
+    follow_graph.unfollow(1, 2)
+
+    # 재시작: snapshot(mmap) + journal로 복구 (테이블을 읽지 않음)
+    restarted = FollowGraph(str(tmp_path))
+    restarted.load(engines=[])
+    assert isinstance(restarted.followees.indices, np.memmap)
+    for user_id in [1, 2, 3]:
+        assert sorted(restarted.get_followee_ids(user_id)) == sorted(follow_graph.get_followee_ids(user_id))
+        assert sorted(restarted.get_follower_ids(user_id)) == sorted(follow_graph.get_follower_ids(user_id))
+
+    # snapshot 하면 변경분이 CSR에 합쳐지고 journal은 비워짐
+    restarted.snapshot()
+    assert restarted.added == {} and restarted.removed == set()
+    assert restarted.followees.row(1).tolist() == [3]
+    assert sorted(os.listdir(tmp_path)) == ['2', 'CURRENT']
+    assert open(os.path.join(tmp_path, '2', 'journal')).read() == ''
+
+def test_background_snapshot(tmp_path):
+    follow_graph = FollowGraph(str(tmp_path), snapshot_interval=0)
+    follow_graph.build(np.array([1]), np.array([2]))
+
+    # snapshot을 만드는 동안(lock 밖)의 follow는 새 CSR과 새 journal에 다시 적용
+    save = follow_graph.save
+    def save_while_following(followees, followers):
+        follow_graph.follow(3, 1)
+        return save(followees, followers)
+    follow_graph.save = save_while_following
+
+    follow_graph.follow(2, 1)
+    deadline = time.monotonic() + 5
+    while follow_graph.generation != 2 or follow_graph.snapshotting:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert follow_graph.followees.row(2).tolist() == [1]
+    assert follow_graph.added == {3 : {1}}
+    assert open(os.path.join(tmp_path, '2', 'journal')).read() == '+ 3 1\n'
+
+    restarted = FollowGraph(str(tmp_path))
+    restarted.load(engines=[])
+    assert sorted(restarted.get_follower_ids(1)) == [2, 3]
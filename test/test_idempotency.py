@@ -0,0 +1,105 @@
+import sys, os, time, json, hashlib
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+import pytest
+from flask import Flask, request, jsonify, g
+from cache import LRUCache
+from view import idempotent
+
+class Services:
+    pass
+
+@pytest.fixture
+def api():
+    app = Flask(__name__)
+    app.services = Services()
+    app.services.idempotency_store = LRUCache()
+    app.calls = []
+
+    # login_required 대신 X-User-Id 헤더의 사용자로 (없으면 로그인 없는 요청)
+    @app.before_request
+    def login():
+        if 'X-User-Id' in request.headers:
+            g.user_id = int(request.headers['X-User-Id'])
+
+    @app.route('/tweet', methods=['POST'])
+    @idempotent
+    def tweet():
+        app.calls.append(request.json)
+        if request.json['tweet'] == 'error':
+            return '', 500
+        return jsonify({'id' : len(app.calls)})
+
+    app.testing = True
+    api = app.test_client()
+    api.app = app
+    return api
+
+def post(api, tweet, key, user_id=1):
+    headers = {'Idempotency-Key' : key} if key else {}
+    if user_id is not None:
+        headers['X-User-Id'] = str(user_id)
+    return api.post(
+        '/tweet',
+        data         = json.dumps({'tweet' : tweet}),
+        content_type = 'application/json',
+        headers      = headers
+    )
+
+def test_replay(api):
+    # 같은 key로 재시도하면 처리하지 않고 첫 응답을 그대로 응답
+    first = post(api, 'hello', 'key-1')
+    retry = post(api, 'hello', 'key-1')
+    assert retry.status_code == 200
+    assert retry.data == first.data == b'{"id":1}\n'
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert len(api.app.calls) == 1
+
+    # key가 다르거나 없으면 새 요청
+    assert json.loads(post(api, 'hello', 'key-2').data) == {'id' : 2}
+    assert json.loads(post(api, 'hello', None).data) == {'id' : 3}
+
+def test_key_reuse(api):
+    post(api, 'hello', 'key-1')
+    assert post(api, 'other', 'key-1').status_code == 422
+    assert len(api.app.calls) == 1
+
+def test_in_progress(api):
+    # 첫 요청이 아직 응답을 저장하지 않았으면 409
+    fingerprint = hashlib.sha256(json.dumps({'tweet' : 'hello'}).encode()).hexdigest()
+    api.app.services.idempotency_store.add('1:/tweet:key-1', 'fingerprint', fingerprint)
+    resp = post(api, 'hello', 'key-1')
+    assert resp.status_code == 409
+    assert resp.headers['Retry-After'] == '1'
+
+def test_in_progress_expires(api):
+    # 처리 중에 종료되어 응답이 저장되지 않으면 처리 중 표시는 저장소의 짧은 TTL로 만료
+    api.app.services.idempotency_store = LRUCache(ttl=0.1)
+    fingerprint = hashlib.sha256(json.dumps({'tweet' : 'hello'}).encode()).hexdigest()
+    api.app.services.idempotency_store.add('1:/tweet:key-1', 'fingerprint', fingerprint)
+    assert post(api, 'hello', 'key-1').status_code == 409
+
+    time.sleep(0.1)
+    assert post(api, 'hello', 'key-1').status_code == 200
+
+    # 저장한 응답은 IDEMPOTENCY_TTL(기본 1일)까지 연장
+    time.sleep(0.1)
+    assert post(api, 'hello', 'key-1').headers['Idempotent-Replayed'] == 'true'
+    assert len(api.app.calls) == 1
+
+def test_users(api):
+    # 같은 key라도 사용자가 다르면 다른 요청
+    post(api, 'hello', 'key-1', user_id=1)
+    assert post(api, 'hello', 'key-1', user_id=2).headers.get('Idempotent-Replayed') is None
+
+    # 로그인 없는 요청은 요청 본문별로 구분 (다른 클라이언트의 같은 key와 섞이지 않음)
+    assert post(api, 'first', 'key-1', user_id=None).status_code == 200
+    assert post(api, 'second', 'key-1', user_id=None).status_code == 200
+    assert post(api, 'first', 'key-1', user_id=None).headers['Idempotent-Replayed'] == 'true'
+    assert len(api.app.calls) == 4
+
+def test_server_error(api):
+    # 5xx 응답은 저장하지 않으므로 재시도하면 다시 처리
+    assert post(api, 'error', 'key-1').status_code == 500
+    assert post(api, 'error', 'key-1').status_code == 500
+    assert len(api.app.calls) == 2
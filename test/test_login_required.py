@@ -0,0 +1,53 @@
+import sys, os, jwt
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+import pytest
+from datetime import datetime, timedelta
+from flask import Flask, g
+from cache import LRUCache
+from view import login_required
+from unittest import mock
+
+class Services:
+    pass
+
+@pytest.fixture
+def api():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test'
+    app.services = Services()
+    app.services.token_cache = LRUCache()
+
+    @app.route('/me')
+    @login_required
+    def me():
+        return str(g.user_id)
+
+    api = app.test_client()
+    api.app = app
+    return api
+
+def token(user_id, seconds=60, secret='test'):
+    return jwt.encode({'user_id' : user_id, 'exp' : datetime.utcnow() + timedelta(seconds=seconds)}, secret, 'HS256')
+
+def test_token_cache(api):
+    access_token = token(1)
+    with mock.patch('view.jwt.decode', wraps=jwt.decode) as decode:
+        # 두 번째 요청부터는 검증한 결과를 사용
+        assert api.get('/me', headers={'Authorization' : access_token}).data == b'1'
+        assert api.get('/me', headers={'Authorization' : access_token}).data == b'1'
+        assert decode.call_count == 1
+
+    # 잘못된 token은 캐시하지 않음
+    assert api.get('/me', headers={'Authorization' : token(1, secret='wrong')}).status_code == 401
+    assert api.get('/me').status_code == 401
+
+def test_token_expired(api):
+    access_token = token(1, seconds=1)
+    assert api.get('/me', headers={'Authorization' : access_token}).status_code == 200
+
+    # exp가 지나면 캐시에 있어도 다시 검증해서 401
+    with mock.patch('view.time.time', return_value=(datetime.utcnow() + timedelta(seconds=5)).timestamp()), \
+         mock.patch('view.jwt.decode', side_effect=jwt.ExpiredSignatureError) as decode:
+        assert api.get('/me', headers={'Authorization' : access_token}).status_code == 401
+        assert decode.call_count == 1
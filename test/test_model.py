@@ -1,11 +1,12 @@
 import bcrypt
 import pytest
-import sys, os
+import sys, os, threading
 sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 import config
 
-from model import UserDao, TweetDao
-from sqlalchemy import create_engine, text
+from model import UserDao, TweetDao, RecentTweets, FollowGraph, ShardRouter
+from cache import LRUCache
+from sqlalchemy import create_engine, event, text
 from unittest import mock
 
 database = create_engine(config.test_config['DB_URL'], encoding='utf-8', max_overflow=0)
@@ -66,6 +67,15 @@ def setup_function():
                             "user2 test tweet"
                         )"""
                     ))
+    database.execute(text("""
+        INSERT INTO timelines (
+            user_id,
+            tweet_id
+        ) VALUES (
+            2,
+            1
+        )
+    """))
 
 # test 실행 후 
 def teardown_function():
@@ -73,6 +83,7 @@ def teardown_function():
     database.execute(text("TRUNCATE users"))
     database.execute(text("TRUNCATE tweets"))
     database.execute(text("TRUNCATE users_follow_list"))
+    database.execute(text("TRUNCATE timelines"))
     database.execute(text("SET FOREIGN_KEY_CHECKS=1"))
 
 # 사용자 생성 확인
@@ -150,12 +161,39 @@ def test_insert_unfollow(user_dao):
 
     assert folow_list == []
 
+def get_follower_count(user_id):
+    return database.execute(text("""
+        SELECT follower_count
+        FROM users
+        WHERE id = :user_id
+    """), {
+        'user_id' : user_id
+    }).scalar()
+
+def test_insert_follow_many(user_dao, tweet_dao):
+    # 이미 팔로우 중인 id, 없는 사용자, 중복 id는 무시하고 실제로 팔로우 한 id만 반환
+    user_dao.insert_follow(1, 2)
+    assert user_dao.insert_follow_many(1, [2, 2, 999]) == []
+    assert get_follow_list(1) == [2]
+    assert get_follower_count(2) == 1
+
+    assert user_dao.insert_unfollow_many(1, [2, 999]) == [2]
+    assert user_dao.insert_unfollow_many(1, [2]) == []
+    assert get_follower_count(2) == 0
+    assert tweet_dao.get_timeline(1) == []
+
+    assert user_dao.insert_follow_many(1, [2, 999]) == [2]
+    assert get_follow_list(1) == [2]
+    assert get_follower_count(2) == 1
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1)] == [1]
+
 def test_insert_tweet(tweet_dao):
     tweet_dao.insert_tweet(1, 'tweet test')
     timeline = tweet_dao.get_timeline(1)
 
     assert timeline == [
         {
+            'id' : 2,
             'user_id' : 1,
             'tweet' : 'tweet test'
         }  
@@ -170,17 +208,20 @@ def test_timeline(user_dao, tweet_dao):
 
     assert timeline == [
         {
+            'id': 3,
             'user_id': 2, 
-            'tweet': 'user2 test tweet'
-         }, 
+            'tweet': 'second tweet test'
+        }, 
         {
+            'id': 2,
             'user_id': 1, 
             'tweet': 'first tweet test'
         }, 
         {
+            'id': 1,
             'user_id': 2, 
-            'tweet': 'second tweet test'
-        }
+            'tweet': 'user2 test tweet'
+         }
     ]
 
 def test_save_and_get_profile_picture(user_dao):
@@ -194,4 +235,327 @@ def test_save_and_get_profile_picture(user_dao):
 
     # 조회
     actual_profile_picture = user_dao.get_profile_picture(user_id)
-    assert expected_profile_picture == actual_profile_picture
\ No newline at end of file
+    assert expected_profile_picture == actual_profile_picture
+
+def test_timeline_fan_out(user_dao, tweet_dao):
+    # follow 이후 작성된 tweet이 팔로워의 timeline에 push 되는지 확인
+    user_dao.insert_follow(1, 2)
+    tweet_dao.insert_tweet(2, 'fan out tweet')
+
+    assert tweet_dao.get_timeline(1) == [
+        {
+            'id'      : 2,
+            'user_id' : 2,
+            'tweet'   : 'fan out tweet'
+        },
+        {
+            'id'      : 1,
+            'user_id' : 2,
+            'tweet'   : 'user2 test tweet'
+        }
+    ]
+
+    # unfollow 하면 timeline에서 제거
+    user_dao.insert_unfollow(1, 2)
+    assert tweet_dao.get_timeline(1) == []
+
+def test_backfill_timelines(user_dao, tweet_dao):
+    tweet_dao.insert_tweet(1, 'first tweet test')
+    user_dao.insert_follow(1, 2)
+    expected = tweet_dao.get_timeline(1)
+
+    database.execute(text("TRUNCATE timelines"))
+    assert tweet_dao.get_timeline(1) == []
+
+    tweet_dao.backfill_timelines(batch_size=1)
+    assert tweet_dao.get_timeline(1) == expected
+
+    # 지정한 사용자의 timeline만 backfill
+    database.execute(text("TRUNCATE timelines"))
+    tweet_dao.backfill_timelines(user_ids=[2])
+    assert tweet_dao.get_timeline(1) == []
+
+    tweet_dao.backfill_timelines(user_ids=[1, 1])
+    assert tweet_dao.get_timeline(1) == expected
+
+def test_timeline_pagination(tweet_dao):
+    for i in range(5):
+        tweet_dao.insert_tweet(2, f'tweet {i}')
+
+    # 최신순으로 2개씩, 마지막 tweet id를 cursor로 사용
+    first_page = tweet_dao.get_timeline(2, limit=2)
+    assert [tweet['id'] for tweet in first_page] == [6, 5]
+
+    second_page = tweet_dao.get_timeline(2, limit=2, before=first_page[-1]['id'])
+    assert [tweet['id'] for tweet in second_page] == [4, 3]
+
+    last_page = tweet_dao.get_timeline(2, limit=2, before=2)
+    assert [tweet['id'] for tweet in last_page] == [1]
+
+
+# fn이 실행한 SQL을 EXPLAIN 해서 full table scan(type=ALL)이 없는지 확인
+def assert_no_full_scan(fn, *args):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(database, 'before_cursor_execute', capture)
+    try:
+        fn(*args)
+    finally:
+        event.remove(database, 'before_cursor_execute', capture)
+
+    with database.connect() as conn:
+        for statement, parameters in statements:
+            for row in conn.exec_driver_sql('EXPLAIN ' + statement, parameters):
+                # INSERT 대상 테이블과 UNION 임시 테이블은 scan 대상이 아님
+                if row['table'] is None or row['table'].startswith('<') or row['select_type'] == 'INSERT':
+                    continue
+                assert row['type'] != 'ALL', f"full scan on {row['table']}: {statement}"
+
+def test_timeline_query_plans(user_dao, tweet_dao):
+    database.execute(text("""
+        INSERT INTO tweets (
+            user_id,
+            tweet
+        ) VALUES (
+            :user_id,
+            'plan test'
+        )
+    """), [{'user_id' : 1 + i % 2} for i in range(200)])
+    tweet_dao.backfill_timelines()
+
+    assert_no_full_scan(tweet_dao.insert_tweet, 2, 'plan test')
+    assert_no_full_scan(user_dao.insert_follow, 1, 2)
+    assert_no_full_scan(tweet_dao.get_timeline, 1, 20, 100)
+    assert_no_full_scan(user_dao.insert_unfollow, 1, 2)
+
+
+def test_profile_picture_cache():
+    cache    = LRUCache()
+    user_dao = UserDao(database, cache)
+
+    user_dao.save_profile_picture("https://s3.test.amazonaws.com/test/first.png", 1)
+    assert user_dao.get_profile_picture(1) == "https://s3.test.amazonaws.com/test/first.png"
+    assert user_dao.get_profile_picture(1) == "https://s3.test.amazonaws.com/test/first.png"
+    assert cache.stats()['hits'] == 1
+
+    # 저장하면 캐시 무효화
+    user_dao.save_profile_picture("https://s3.test.amazonaws.com/test/second.png", 1)
+    assert user_dao.get_profile_picture(1) == "https://s3.test.amazonaws.com/test/second.png"
+
+
+def test_hybrid_timeline():
+    # 팔로워가 1명보다 많으면 pull 대상
+    user_dao  = UserDao(database, fanout_threshold=1)
+    tweet_dao = TweetDao(database, fanout_threshold=1)
+
+    user_dao.insert_follow(1, 2)
+    new_user_id = user_dao.insert_user({
+        'name'     : 'third',
+        'email'    : 'third@test.com',
+        'profile'  : 'third profile',
+        'password' : '1234'
+    })
+    user_dao.insert_follow(new_user_id, 2)
+
+    tweet_dao.insert_tweet(2, 'pulled tweet')
+    tweet_dao.insert_tweet(1, 'pushed tweet')
+
+    # user2의 새 tweet은 팔로워 timeline에 push 되지 않고 읽을 때 합쳐짐
+    assert [tweet['id'] for tweet in tweet_dao.get_pushed_timeline(1)] == [3, 1]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1)] == [3, 2, 1]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, limit=2)] == [3, 2]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, limit=2, before=2)] == [1]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(new_user_id)] == [2, 1]
+
+    # 팔로워가 줄어 push 대상이 되면 pull 되던 tweet을 남은 팔로워에게 push
+    user_dao.insert_unfollow(new_user_id, 2)
+    assert [tweet['id'] for tweet in tweet_dao.get_pushed_timeline(1)] == [3, 2, 1]
+
+def test_buffered_timeline(user_dao):
+    tweet_dao = TweetDao(database, recent_tweets=RecentTweets(capacity=2))
+
+    user_dao.insert_follow(1, 2)
+    for i in range(3):
+        tweet_dao.insert_tweet(1 + i % 2, f'tweet {i}')
+
+    # buffer로 채울 수 있는 구간과 SQL로 읽어야 하는 구간 모두 timelines와 같아야 함
+    for limit, before in [(2, None), (3, None), (2, 3), (None, None)]:
+        assert tweet_dao.get_timeline(1, limit, before) == tweet_dao.get_pushed_timeline(1, limit, before)
+
+def test_iter_timeline(user_dao):
+    tweet_dao = TweetDao(database, fanout_threshold=0)
+    user_dao.insert_follow(1, 2)
+    tweet_dao.insert_tweet(1, 'pushed tweet')
+    tweet_dao.insert_tweet(2, 'pulled tweet')
+
+    for limit, before in [(None, None), (2, None), (1, 3)]:
+        assert list(tweet_dao.iter_timeline(1, limit, before)) == tweet_dao.get_timeline(1, limit, before)
+        # 여러 page로 나눠 읽어도 같은 결과
+        assert list(tweet_dao.iter_timeline(1, limit, before, page_size=1)) == tweet_dao.get_timeline(1, limit, before)
+
+def test_timeline_since(user_dao):
+    tweet_dao = TweetDao(database, fanout_threshold=0)
+    user_dao.insert_follow(1, 2)
+    tweet_dao.insert_tweet(1, 'pushed tweet')
+    tweet_dao.insert_tweet(2, 'pulled tweet')
+
+    # 클라이언트가 이미 가진 tweet(id 1) 이후의 tweet만 반환
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, since=1)] == [3, 2]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, since=3)] == []
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, limit=1, since=1)] == [3]
+
+def test_get_timelines():
+    user_dao  = UserDao(database, fanout_threshold=1)
+    tweet_dao = TweetDao(database, fanout_threshold=1)
+
+    user_dao.insert_follow(1, 2)
+    new_user_id = user_dao.insert_user({
+        'name'     : 'third',
+        'email'    : 'third@test.com',
+        'profile'  : 'third profile',
+        'password' : '1234'
+    })
+    user_dao.insert_follow(new_user_id, 2)
+
+    tweet_dao.insert_tweet(2, 'pulled tweet')
+    tweet_dao.insert_tweet(1, 'pushed tweet')
+
+    # 사용자별 get_timeline 결과와 같아야 함
+    user_ids = [1, 2, new_user_id, 100]
+    for limit, before, since in [(None, None, None), (2, None, None), (1, 3, None), (None, None, 1)]:
+        assert tweet_dao.get_timelines(user_ids, limit, before, since) == {
+            user_id : tweet_dao.get_timeline(user_id, limit, before, since) for user_id in user_ids
+        }
+    assert tweet_dao.get_timelines([]) == {}
+
+def test_follow_graph(tmp_path):
+    follow_graph = FollowGraph(str(tmp_path))
+    follow_graph.load([database])
+    user_dao  = UserDao(database, follow_graph=follow_graph)
+    tweet_dao = TweetDao(database, follow_graph=follow_graph)
+
+    user_dao.insert_follow(1, 2)
+    assert user_dao.get_follow_ids(1) == [2]
+    assert tweet_dao.get_push_follower_ids(2) == [1]
+
+    user_dao.insert_unfollow(1, 2)
+    assert user_dao.get_follow_ids(1) == []
+    assert tweet_dao.get_push_follower_ids(2) == []
+
+# shard 테스트는 test_config['SHARD_DB_URLS']에 같은 schema의 로컬 DB 여러 개가 있을 때만 실행
+@pytest.fixture
+def shards():
+    shards = ShardRouter([
+        create_engine(url, encoding='utf-8', max_overflow=0) for url in config.test_config['SHARD_DB_URLS']
+    ])
+    yield shards
+
+    for engine in shards.engines:
+        engine.execute(text("SET FOREIGN_KEY_CHECKS=0"))
+        for table in ['users', 'tweets', 'users_follow_list', 'timelines']:
+            engine.execute(text(f"TRUNCATE {table}"))
+        engine.execute(text("SET FOREIGN_KEY_CHECKS=1"))
+
+@pytest.mark.skipif(not config.test_config.get('SHARD_DB_URLS'), reason='SHARD_DB_URLS 설정 없음')
+def test_sharded_timeline(shards):
+    user_dao  = UserDao(shards)
+    tweet_dao = TweetDao(shards)
+
+    user_ids = [1, 2, 3]
+    for user_id in user_ids:
+        shards.engine(user_id).execute(text("""
+            INSERT INTO users (id, name, email, profile, hashed_password)
+            VALUES (:id, 'user', :email, 'profile', 'password')
+        """), {
+            'id'    : user_id,
+            'email' : f'user{user_id}@test.com'
+        })
+
+    user_dao.insert_follow(1, 2)
+    user_dao.insert_follow(1, 3)
+
+    # tweet은 작성자의 shard에 (shard 간 id가 겹치지 않도록 직접 지정)
+    # shard마다 auto_increment가 따로 증가하므로 id 5가 가장 먼저 작성된 tweet일 수 있음
+    for tweet_id, user_id, created_at in [
+        (1, 2, '2020-01-01 00:00:01'),
+        (2, 3, '2020-01-01 00:00:02'),
+        (3, 1, '2020-01-01 00:00:03'),
+        (4, 3, '2020-01-01 00:00:03'),
+        (5, 2, '2020-01-01 00:00:00')
+    ]:
+        shards.engine(user_id).execute(text("""
+            INSERT INTO tweets (id, user_id, tweet, created_at) VALUES (:id, :user_id, 'tweet', :created_at)
+        """), {
+            'id'         : tweet_id,
+            'user_id'    : user_id,
+            'created_at' : created_at
+        })
+
+    assert user_dao.get_follow_ids(1) == [2, 3]
+    assert user_dao.get_user_id_and_password('user3@test.com')['id'] == 3
+    assert sorted(tweet_dao.get_push_follower_ids(3)) == [1]
+
+    # 작성 시각 순서, 같은 시각이면 id 순서
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1)] == [4, 3, 2, 1, 5]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, limit=2, before=4)] == [3, 2]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, before=1)] == [5]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1, since=1)] == [4, 3, 2]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(3)] == [4, 2]
+
+    # 여러 사용자는 shard마다 한 번에 조회해도 사용자별 조회와 같은 결과
+    timelines = tweet_dao.get_timelines([1, 2, 3], limit=2, before=4)
+    assert {user_id : [tweet['id'] for tweet in timeline] for user_id, timeline in timelines.items()} == {1 : [3, 2], 2 : [1, 5], 3 : [2]}
+
+    user_dao.insert_unfollow(1, 3)
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1)] == [3, 1, 5]
+
+def test_replica_reads():
+    replica   = create_engine(config.test_config['DB_URL'], encoding='utf-8', max_overflow=0)
+    shards    = ShardRouter([database], [[replica]])
+    user_dao  = UserDao(shards)
+    tweet_dao = TweetDao(shards)
+
+    assert shards.read_engine(1) is replica
+
+    # 쓴 사용자의 읽기는 primary로
+    user_dao.insert_follow(1, 2)
+    tweet_id = tweet_dao.insert_tweet(1, 'tweet')
+    assert shards.read_engine(1) is database
+    assert shards.read_engine(2) is replica
+    assert user_dao.get_follow_ids(1) == [2]
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1)] == [tweet_id, 1]
+    assert user_dao.get_user_id_and_password('test@test.com')['id'] == 1
+
+def test_insert_tweets(user_dao):
+    tweet_dao = TweetDao(database, fanout_threshold=1)
+    user_dao.insert_follow(1, 2)
+
+    # 한 번의 INSERT로 저장해도 id는 입력 순서대로, fan-out은 insert_tweet과 같아야 함
+    assert tweet_dao.insert_tweets([(1, 'first'), (2, 'second'), (1, 'third')]) == [2, 3, 4]
+    assert [tweet['tweet'] for tweet in tweet_dao.get_timeline(1)] == ['third', 'second', 'first', 'user2 test tweet']
+    assert [tweet['id'] for tweet in tweet_dao.get_pushed_timeline(1)] == [4, 3, 2, 1]
+    assert [tweet['id'] for tweet in tweet_dao.get_pushed_timeline(2)] == [3, 1]
+
+def test_insert_tweets_with_keys(tweet_dao):
+    # 같은 spool record(key)는 다시 저장해도 한 번만 저장되고 처음 저장된 id를 반환
+    assert tweet_dao.insert_tweets([(1, 'first'), (2, 'second')], ['key-1', 'key-2']) == [2, 3]
+    assert tweet_dao.insert_tweets([(2, 'second'), (1, 'third')], ['key-2', 'key-3']) == [3, 4]
+    assert tweet_dao.insert_tweets([(1, 'first')], ['key-1']) == [2]
+    assert [tweet['tweet'] for tweet in tweet_dao.get_pushed_timeline(1)] == ['third', 'first']
+
+def test_batched_insert_tweet(user_dao):
+    tweet_dao = TweetDao(database, batch_size=10, batch_delay=0.05)
+    user_dao.insert_follow(1, 2)
+
+    tweet_ids = []
+    threads   = [threading.Thread(target=lambda i=i: tweet_ids.append(tweet_dao.insert_tweet(2, f'tweet {i}'))) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(tweet_ids) == [2, 3, 4, 5, 6]
+    assert [tweet['id'] for tweet in tweet_dao.get_pushed_timeline(1)] == [6, 5, 4, 3, 2, 1]
@@ -0,0 +1,90 @@
+import sys, os, time, threading
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+import pytest
+from service.password_hasher import PasswordHasher, PasswordHasherBusy, calibrate
+
+def test_hash_and_check():
+    hasher = PasswordHasher(workers=2)
+    hashed = hasher.hash('1234').decode('UTF-8')
+
+    assert hasher.check('1234', hashed)
+    assert not hasher.check('4321', hashed)
+
+    stats = hasher.stats()
+    assert stats['completed'] == 3
+    assert stats['rejected']  == 0
+    assert set(stats['run_ms']) == {'p50', 'p90', 'p99'}
+
+def test_busy():
+    hasher  = PasswordHasher(workers=1, queue_size=1)
+    release = threading.Event()
+    threads = [threading.Thread(target=hasher.run, args=(release.wait,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+
+    # 실행 중 1개 + 대기 중 1개가 차 있으면 기다리지 않고 실패
+    try:
+        deadline = time.monotonic() + 5
+        while (hasher.stats()['active'], hasher.stats()['queued']) != (1, 1):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        with pytest.raises(PasswordHasherBusy):
+            hasher.run(release.wait)
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+    assert hasher.stats()['completed'] == 2
+    assert hasher.stats()['rejected']  == 1
+
+def test_limit():
+    # 요청 thread pool보다 작게: 실행 중 + 대기 중을 max_in_flight개 이하로
+    hasher = PasswordHasher(workers=8, queue_size=16)
+    hasher.limit(5)
+    assert (hasher.workers, hasher.queue_size) == (5, 0)
+
+    hasher = PasswordHasher(workers=2, queue_size=16)
+    hasher.limit(5)
+    assert (hasher.workers, hasher.queue_size) == (2, 3)
+    assert hasher.check('1234', PasswordHasher(workers=1, rounds=4).hash('1234').decode('UTF-8'))
+
+def test_rounds():
+    hasher = PasswordHasher(workers=1, rounds=5)
+    hashed = hasher.hash('1234').decode('UTF-8')
+
+    assert hashed.split('$')[2] == '05'
+    assert not hasher.needs_rehash(hashed)
+    assert PasswordHasher(workers=1, rounds=4).needs_rehash(hashed)
+
+def test_hash_in_background():
+    hasher  = PasswordHasher(workers=1, rounds=4)
+    hashed  = []
+    release = threading.Event()
+    thread  = threading.Thread(target=hasher.run, args=(release.wait,))
+    thread.start()
+
+    # 쉬는 worker가 없으면 기다리지 않고 건너뜀
+    try:
+        deadline = time.monotonic() + 5
+        while hasher.stats()['active'] != 1:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert hasher.hash_in_background('1234', hashed.append) is None
+    finally:
+        release.set()
+        thread.join()
+
+    hasher.hash_in_background('1234', hashed.append).result(timeout=5)
+    assert len(hashed) == 1 and hasher.check('1234', hashed[0].decode('UTF-8'))
+    assert hasher.stats()['queued'] == 0
+
+def test_calibrate():
+    results, recommended = calibrate(target_ms=1000, samples=1, max_rounds=6)
+    assert [rounds for rounds, _ in results] == [4, 5, 6]
+    assert recommended == 6
+
+    # target 안에 끝나는 cost가 없으면 최소 cost
+    results, recommended = calibrate(target_ms=0, samples=1, max_rounds=6)
+    assert len(results) == 1
+    assert recommended == 4
@@ -0,0 +1,84 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+from model import RecentTweets, TweetDao, ShardRouter
+
+# ids로 tweets를 조회하는 SELECT만 처리하는 engine
+class FakeEngine:
+    def __init__(self, tweets):
+        self.tweets = tweets
+
+    def execute(self, query, params):
+        rows = [self.tweets[tweet_id] for tweet_id in params['ids'] if tweet_id in self.tweets]
+        return type('Result', (), {'fetchall' : lambda self: rows})()
+
+class FakeFollowGraph:
+    def get_followee_ids(self, user_id):
+        return [2]
+
+def test_ring_buffer():
+    recent_tweets = RecentTweets(capacity=3)
+    recent_tweets.load(1, [])
+
+    for tweet_id in range(1, 6):
+        recent_tweets.append(1, tweet_id, float(tweet_id))
+
+    # 최근 3개만 남고, 그보다 오래된 tweet이 있으므로 더 읽으려 하면 None
+    assert recent_tweets.merge([1], limit=3) == [(5, 1, 5.0), (4, 1, 4.0), (3, 1, 3.0)]
+    assert recent_tweets.merge([1], limit=4) is None
+
+def test_merge():
+    recent_tweets = RecentTweets(capacity=3)
+    # 작성자 1은 tweet이 2개뿐(전부 buffer에 있음), 작성자 2는 buffer가 가득 참
+    recent_tweets.load(1, [(10, 0.0), (5, 0.0)])
+    recent_tweets.load(2, [(12, 0.0), (9, 0.0), (7, 0.0)])
+
+    assert [tweet_id for tweet_id, _, _ in recent_tweets.merge([1, 2], limit=3)] == [12, 10, 9]
+    assert [tweet_id for tweet_id, _, _ in recent_tweets.merge([1, 2], limit=2, before=10)] == [9, 7]
+    assert [tweet_id for tweet_id, _, _ in recent_tweets.merge([1], before=10)] == [5]
+    assert recent_tweets.merge([1, 2], limit=5) is None
+    assert recent_tweets.merge([1, 3], limit=1) is None
+
+def test_missing_and_append():
+    recent_tweets = RecentTweets(capacity=3, max_authors=2)
+    recent_tweets.load(1, [])
+    recent_tweets.load(2, [])
+    recent_tweets.load(3, [])
+
+    # 가장 오래전에 사용된 작성자의 buffer부터 제거
+    assert recent_tweets.missing([1, 2, 3]) == [1]
+
+    # buffer가 없는 작성자에게는 추가하지 않음
+    recent_tweets.append(1, 1, 0.0)
+    assert recent_tweets.missing([1]) == [1]
+
+    # 순서가 바뀐 tweet이 들어오면 buffer를 버림
+    recent_tweets.append(2, 5, 0.0)
+    recent_tweets.append(2, 4, 0.0)
+    assert recent_tweets.missing([2]) == [2]
+
+def test_merge_since():
+    recent_tweets = RecentTweets(capacity=3)
+    recent_tweets.load(1, [(10, 0.0), (5, 0.0)])
+    recent_tweets.load(2, [(12, 0.0), (9, 0.0), (7, 0.0)])
+
+    # since 이후 tweet은 buffer 안에 모두 있으므로 SQL 없이 조립 가능
+    assert [tweet_id for tweet_id, _, _ in recent_tweets.merge([1, 2], since=7)] == [12, 10, 9]
+    assert recent_tweets.merge([1, 2], since=12) == []
+    assert recent_tweets.merge([1, 2], since=3) is None
+
+def test_buffered_timeline_replica_lag():
+    tweets  = {tweet_id : {'id' : tweet_id, 'user_id' : 2, 'tweet' : f'tweet {tweet_id}'} for tweet_id in [1, 2, 3]}
+    primary = FakeEngine(dict(tweets))
+    replica = FakeEngine({tweet_id : tweets[tweet_id] for tweet_id in [1, 2]})
+    recent_tweets = RecentTweets(capacity=3)
+    recent_tweets.load(1, [])
+    recent_tweets.load(2, [(3, 0.0), (2, 0.0), (1, 0.0)])
+    tweet_dao = TweetDao(ShardRouter([primary], [[replica]]), recent_tweets=recent_tweets, follow_graph=FakeFollowGraph())
+
+    # buffer에는 있지만 replica에 아직 없는 tweet은 primary에서 읽음
+    assert [tweet['id'] for tweet in tweet_dao.get_buffered_timeline(1, limit=3)] == [3, 2, 1]
+
+    # primary에도 없으면 짧은 page 대신 None (SQL로 조회)
+    del primary.tweets[3]
+    assert tweet_dao.get_buffered_timeline(1, limit=3) is None
@@ -5,7 +5,10 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 import config
 from model import UserDao, TweetDao
-from service import UserService, TweetService
+from service import UserService, TweetService, BulkImportService, PasswordHasher
+from service.tweet_service import timeline_cache_key
+from service.bulk_import import read_records
+from cache import LRUCache
 from sqlalchemy import create_engine, text
 from unittest import mock
 
@@ -20,7 +23,7 @@ def user_service():
 def tweet_service():
     return TweetService(TweetDao(database))
 
-# test   
+# test 실행 전 
 def setup_function():
     # create test user
     hashed_password = bcrypt.hashpw(
@@ -58,7 +61,7 @@ def setup_function():
         )
     """), new_users)
 
-    # user2  tweet ̸ 
+    # user2에 대한 tweet 미리 생성
     database.execute(text("""
                         INSERT INTO tweets (
                             user_id,
@@ -68,16 +71,26 @@ def setup_function():
                             "user2 test tweet"
                         )"""
                     ))
+    database.execute(text("""
+        INSERT INTO timelines (
+            user_id,
+            tweet_id
+        ) VALUES (
+            2,
+            1
+        )
+    """))
 
-# test   
+# test 실행 후 
 def teardown_function():
     database.execute(text("SET FOREIGN_KEY_CHECKS=0"))
     database.execute(text("TRUNCATE users"))
     database.execute(text("TRUNCATE tweets"))
     database.execute(text("TRUNCATE users_follow_list"))
+    database.execute(text("TRUNCATE timelines"))
     database.execute(text("SET FOREIGN_KEY_CHECKS=1"))
 
-#   Ȯ
+# 사용자 생성 확인
 def get_user(user_id):
     row = database.execute(text("""
         SELECT 
@@ -98,7 +111,7 @@ def get_user(user_id):
         'profile' : row['profile']
     } if row else None
 
-# ȷο Ʈ Ȯ
+# 팔로우 리스트 확인
 def get_follow_list(user_id):
     rows = database.execute(text("""
         SELECT follow_user_id as id
@@ -110,7 +123,7 @@ def get_follow_list(user_id):
 
     return [row['id'] for row in rows]
 
-# ȸ
+# 회원가입
 def test_create_new_user(user_service):
     new_user = {
         'name' : 'new',
@@ -129,20 +142,56 @@ def test_create_new_user(user_service):
         'email' : new_user['email']
     }
 
-# α
+# 로그인
 def test_login(user_service):
-    # ̹ ִ  ׽Ʈ
-    assert user_service.login({
+    # 이미 있는 유저로 테스트
+    principal = user_service.login({
         'email' : 'test@test.com',
         'password' : '1234'
     })
-    # ߸ йȣ ׽Ʈ
+    assert principal['user_id'] == 1
+    payload = jwt.decode(principal['access_token'], config.JWT_SECRET_KEY, 'HS256')
+    assert payload['user_id'] == 1
+    # 잘못된 비밀번호 테스트
     assert not user_service.login({
         'email' : 'test@test.com',
         'password' : 'abcd'
     })
 
-# ū   decode   ̵ Ȯ
+# 없는 email은 login_misses에 기억해서 다시 조회하지 않고, 가입하면 삭제
+def test_login_miss_cache():
+    user_dao     = mock.Mock()
+    user_dao.get_user_id_and_password.return_value = None
+    user_service = UserService(user_dao, config.test_config, mock.Mock(), login_misses=LRUCache())
+    credential   = {'email' : 'New@test.com', 'password' : '1234'}
+
+    assert user_service.login(credential) is None
+    assert user_service.login(credential) is None
+    assert user_dao.get_user_id_and_password.call_count == 1
+
+    user_service.create_new_user({'name' : 'new', 'email' : 'new@test.com', 'profile' : '', 'password' : '1234'})
+    assert user_service.login(credential) is None
+    assert user_dao.get_user_id_and_password.call_count == 2
+
+# 저장된 hash의 cost가 BCRYPT_ROUNDS와 다르면 로그인에 성공할 때 새 cost로 다시 저장
+def test_rehash_on_login():
+    hashed_password = bcrypt.hashpw(b'1234', bcrypt.gensalt(4)).decode('UTF-8')
+    user_dao        = mock.Mock()
+    user_dao.get_user_id_and_password.return_value = {'id' : 1, 'hashed_password' : hashed_password}
+    user_service    = UserService(user_dao, config.test_config, mock.Mock(), password_hasher=PasswordHasher(rounds=5))
+
+    assert not user_service.login({'email' : 'test@test.com', 'password' : 'abcd'})
+    user_dao.update_hashed_password.assert_not_called()
+
+    # 다시 hash 해서 저장하는 것은 background에서 (로그인 응답은 기다리지 않음)
+    assert user_service.login({'email' : 'test@test.com', 'password' : '1234'})
+    user_service.password_hasher.executor.shutdown()
+    user_id, old_hashed_password, new_hashed_password = user_dao.update_hashed_password.call_args[0]
+    assert (user_id, old_hashed_password) == (1, hashed_password)
+    assert new_hashed_password.decode('UTF-8').split('$')[2] == '05'
+    assert bcrypt.checkpw(b'1234', new_hashed_password)
+
+# 토큰 생성 후 decode로 동일한 유저 아이디인지 확인
 def test_generate_access_token(user_service):
     token   = user_service.generate_access_token(1)
     payload = jwt.decode(token, config.JWT_SECRET_KEY, 'HS256')
@@ -171,6 +220,7 @@ def test_tweet(tweet_service):
 
     assert timeline == [
         {
+            'id' : 2,
             'user_id' : 1,
             'tweet' : 'tweet test'
         }
@@ -186,15 +236,124 @@ def test_timeline(user_service, tweet_service):
 
     assert timeline == [
         {
+            'id'      : 3,
             'user_id' : 2,
-            'tweet' : 'user2 test tweet'
+            'tweet'   : 'second tweet test'
         },
         {
+            'id'      : 2,
             'user_id' : 1,
             'tweet'   : 'first tweet test'
         }, 
         {
+            'id'      : 1,
             'user_id' : 2,
-            'tweet'   : 'second tweet test'
+            'tweet' : 'user2 test tweet'
         }        
-    ]
\ No newline at end of file
+    ]
+
+# timeline 캐시 무효화
+def test_timeline_cache():
+    cache         = LRUCache()
+    user_service  = UserService(UserDao(database), config.test_config, mock.Mock(), cache)
+    tweet_service = TweetService(TweetDao(database), cache)
+
+    # 두 번째 조회는 DB를 읽지 않음 (pull 대상 작성자 버전 확인도 캐시에서)
+    with mock.patch.object(tweet_service.tweet_dao, 'get_timeline', wraps=tweet_service.tweet_dao.get_timeline) as get_timeline, \
+         mock.patch.object(tweet_service.tweet_dao, 'get_pull_author_ids_by_user', wraps=tweet_service.tweet_dao.get_pull_author_ids_by_user) as get_pull_author_ids:
+        assert tweet_service.get_timeline(1) == []
+        assert tweet_service.get_timeline(1) == []
+    assert get_timeline.call_count == get_pull_author_ids.call_count == 1
+
+    # follow 하면 팔로우한 사용자의 tweet이 보여야 함
+    user_service.follow(1, 2)
+    assert [tweet['id'] for tweet in tweet_service.get_timeline(1)] == [1]
+
+    # 팔로우한 사용자가 tweet 하면 팔로워의 캐시도 무효화
+    tweet_service.tweet(2, 'new tweet')
+    assert [tweet['id'] for tweet in tweet_service.get_timeline(1)] == [2, 1]
+
+    user_service.unfollow(1, 2)
+    assert tweet_service.get_timeline(1) == []
+
+# pull 대상 작성자의 tweet도 팔로워의 timeline 캐시와 ETag 버전을 무효화
+def test_pulled_timeline_cache():
+    cache         = LRUCache()
+    user_dao      = UserDao(database, fanout_threshold=0)
+    tweet_service = TweetService(TweetDao(database, fanout_threshold=0), cache)
+    user_dao.insert_follow(1, 2)
+
+    assert [tweet['id'] for tweet in tweet_service.get_timeline(1)] == [1]
+    version = tweet_service.get_timeline_version(1)
+    assert tweet_service.get_timeline_version(1) == version
+
+    tweet_service.tweet(2, 'pulled tweet')
+    assert tweet_service.get_timeline_version(1) != version
+    assert [tweet['id'] for tweet in tweet_service.get_timeline(1)] == [2, 1]
+
+def test_timelines_cache_queries():
+    # 여러 사용자의 캐시 확인은 사용자 수와 무관하게 pull 대상 작성자 query 한 번
+    tweet_dao = mock.Mock()
+    tweet_dao.get_pull_author_ids_by_user.side_effect = lambda user_ids: {user_id : [2] for user_id in user_ids}
+    tweet_dao.get_timelines.side_effect = lambda user_ids, *args: {user_id : [{'id' : 1}] for user_id in user_ids}
+    tweet_dao.get_push_follower_ids.return_value = []
+    tweet_service = TweetService(tweet_dao, LRUCache())
+
+    tweet_service.get_timelines(list(range(10, 110)))
+    tweet_service.get_timelines(list(range(10, 110)))
+    assert tweet_dao.get_pull_author_ids_by_user.call_count == 1
+    assert tweet_dao.get_timelines.call_count == 1
+
+    # pull 대상 작성자가 tweet 하면 다시 조회
+    tweet_service.published(2, 2, 'pulled tweet')
+    tweet_service.get_timelines(list(range(10, 110)))
+    assert tweet_dao.get_pull_author_ids_by_user.call_count == 2
+    assert tweet_dao.get_timelines.call_count == 2
+
+def test_timeline_cache_first_page():
+    # before cursor마다 캐시 field가 늘어나지 않도록 첫 page만 캐시
+    tweet_dao = mock.Mock()
+    tweet_dao.get_pull_author_ids_by_user.side_effect = lambda user_ids: {user_id : [] for user_id in user_ids}
+    tweet_dao.get_timeline.return_value = [{'id' : 1}]
+    tweet_service = TweetService(tweet_dao, LRUCache())
+
+    for before in range(100, 110):
+        tweet_service.get_timeline(1, 10, before)
+    assert tweet_dao.get_timeline.call_count == 10
+    assert tweet_service.cache.get(timeline_cache_key(1), 'page:10') is None
+
+    tweet_service.get_timeline(1, 10)
+    tweet_service.get_timeline(1, 10)
+    assert tweet_dao.get_timeline.call_count == 11
+
+def test_bulk_import(tmp_path):
+    user_dao  = UserDao(database)
+    tweet_dao = TweetDao(database)
+    bulk_import_service = BulkImportService(user_dao, tweet_dao)
+
+    users_path = tmp_path / 'users.ndjson'
+    users_path.write_text(
+        '{"name": "third", "email": "third@test.com", "profile": "third profile", "password": "1234"}\n'
+        '\n'
+        '{"id": 10, "name": "tenth", "email": "tenth@test.com", "profile": "tenth profile", "hashed_password": "hash"}\n'
+    )
+    follows_path = tmp_path / 'follows.csv'
+    follows_path.write_text('user_id,follow_user_id\n1,2\n10,2\n1,10\n1,2\n')
+    tweets_path = tmp_path / 'tweets.ndjson'
+    tweets_path.write_text(''.join(f'{{"user_id": 10, "tweet": "tweet {i}"}}\n' for i in range(5)))
+
+    progress = []
+    assert bulk_import_service.import_records('users', read_records(str(users_path)), 1, lambda *args: progress.append(args)) == 2
+    assert [imported for imported, _ in progress] == [1, 2]
+    assert bulk_import_service.import_records('follows', read_records(str(follows_path)), 3) == 4
+    # 이미 있던 tweet은 chunk마다 팔로워 timeline에 backfill
+    assert bulk_import_service.backfilled == 2
+    assert [tweet['id'] for tweet in tweet_dao.get_timeline(1)] == [1]
+    assert bulk_import_service.import_records('tweets', read_records(str(tweets_path)), 2) == 5
+
+    assert user_dao.get_user_id_and_password('tenth@test.com')['id'] == 10
+    assert sorted(user_dao.get_follow_ids(1)) == [2, 10]
+    assert database.execute(text("SELECT follower_count FROM users WHERE id = 2")).scalar() == 2
+
+    # 가져온 tweet은 팔로워 timeline에 push 됨
+    assert [tweet['tweet'] for tweet in tweet_dao.get_timeline(1, limit=2)] == ['tweet 4', 'tweet 3']
@@ -0,0 +1,91 @@
+import sys, os, time
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+from model import ShardRouter
+from cache import LRUCache
+from sqlalchemy import create_engine, text
+
+# SQLite 파일 여러 개를 shard로 사용
+def create_shards(tmp_path, count):
+    engines = [create_engine(f'sqlite:///{tmp_path}/shard{i}.db') for i in range(count)]
+    for engine in engines:
+        engine.execute(text("CREATE TABLE tweets (id INTEGER PRIMARY KEY, user_id INTEGER, tweet TEXT)"))
+    return ShardRouter(engines)
+
+def test_route(tmp_path):
+    shards = create_shards(tmp_path, 3)
+
+    # (user_id - 1) % shard 수
+    assert [shards.engines.index(shards.engine(user_id)) for user_id in range(1, 8)] == [0, 1, 2, 0, 1, 2, 0]
+    assert shards.group([1, 2, 4, 7]) == {
+        shards.engines[0] : [1, 4, 7],
+        shards.engines[1] : [2]
+    }
+
+    # 새 사용자는 shard를 돌아가며 저장
+    assert [shards.engines.index(shards.new_user_engine()) for _ in range(4)] == [0, 1, 2, 0]
+
+def test_map(tmp_path):
+    shards = create_shards(tmp_path, 3)
+    for tweet_id, user_id in enumerate(range(1, 10), 1):
+        shards.engine(user_id).execute(text("INSERT INTO tweets (id, user_id, tweet) VALUES (:id, :user_id, 'tweet')"), {
+            'id'      : tweet_id,
+            'user_id' : user_id
+        })
+
+    # 각 shard에는 자기 사용자의 tweet만 있고, 결과는 shard 순서대로
+    assert shards.map(
+        lambda engine: [row['user_id'] for row in engine.execute(text("SELECT user_id FROM tweets ORDER BY id"))],
+        shards.engines
+    ) == [[1, 4, 7], [2, 5, 8], [3, 6, 9]]
+
+def test_single_shard(tmp_path):
+    shards = create_shards(tmp_path, 1)
+
+    assert len(shards) == 1
+    assert shards.executor is None
+    assert shards.engine(5) is shards.engines[0]
+    assert shards.map(lambda engine: 1, shards.engines) == [1]
+
+def test_read_your_writes(tmp_path):
+    primary  = create_engine(f'sqlite:///{tmp_path}/primary.db')
+    replicas = [create_engine(f'sqlite:///{tmp_path}/replica{i}.db') for i in range(2)]
+    shards   = ShardRouter([primary], [replicas], pin_seconds=0.2)
+
+    # 쓰기는 primary, 읽기는 replica
+    assert shards.engine(1) is primary
+    assert shards.read_engine(1) in replicas
+
+    # 쓰기를 한 사용자의 읽기는 pin_seconds 동안 primary
+    shards.pin(1)
+    assert shards.read_engine(1) is primary
+    assert shards.reader(primary, 2, 1) is primary
+    assert shards.read_engine(2) in replicas
+
+    time.sleep(0.2)
+    assert shards.read_engine(1) in replicas
+
+    # 만료된 pin은 다음 pin 할 때 정리
+    shards.pin(2)
+    assert shards.pinned.keys() == {2}
+
+def test_shared_pins(tmp_path):
+    primary  = create_engine(f'sqlite:///{tmp_path}/primary.db')
+    replicas = [create_engine(f'sqlite:///{tmp_path}/replica.db')]
+    pins     = LRUCache(ttl=0.2)
+
+    # 같은 pins 캐시를 쓰는 다른 노드(router)의 읽기도 primary
+    ShardRouter([primary], [replicas], 0.2, pins).pin(1)
+    other = ShardRouter([primary], [replicas], 0.2, pins)
+    assert other.read_engine(1) is primary
+    assert other.read_engine(2) in replicas
+
+    time.sleep(0.2)
+    assert other.read_engine(1) in replicas
+
+def test_no_replicas(tmp_path):
+    shards = create_shards(tmp_path, 2)
+
+    shards.pin(1)
+    assert shards.pinned == {}
+    assert shards.read_engine(2) is shards.engine(2)
@@ -0,0 +1,71 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+from flask import Flask
+from view.timeline_stream import TimelineBroker, TimelineStreamResource, redacted_log_formatter
+from twisted.web.test.requesthelper import DummyRequest
+
+def test_deliver():
+    broker = TimelineBroker()
+    follower, other = DummyRequest([b'stream']), DummyRequest([b'stream'])
+    broker.subscribe(follower, 1, [2])
+    broker.subscribe(other, 3, [])
+
+    # 팔로우 중인 사용자의 tweet만 전달
+    broker.deliver(2, {'id' : 1, 'user_id' : 2, 'tweet' : 'test tweet'})
+
+    assert follower.written == [b'data: {"id": 1, "user_id": 2, "tweet": "test tweet"}\n\n']
+    assert other.written    == []
+
+def test_follow_and_unfollow():
+    broker  = TimelineBroker()
+    request = DummyRequest([b'stream'])
+    broker.subscribe(request, 1, [])
+
+    broker.update(1, 2, True)
+    broker.deliver(2, {'id' : 1})
+    assert len(request.written) == 1
+
+    broker.update(1, 2, False)
+    broker.deliver(2, {'id' : 2})
+    assert len(request.written) == 1
+
+def test_unsubscribe():
+    broker  = TimelineBroker()
+    request = DummyRequest([b'stream'])
+    broker.subscribe(request, 1, [2])
+    broker.unsubscribe(request)
+
+    assert broker.listeners   == {}
+    assert broker.authors     == {}
+    assert broker.subscribers == {}
+
+def test_cors_headers():
+    resource = TimelineStreamResource(Flask(__name__), None, TimelineBroker())
+    request  = DummyRequest([b'stream'])
+    request.requestHeaders.setRawHeaders(b'Origin', [b'http://example.com'])
+    request.requestHeaders.setRawHeaders(b'Access-Control-Request-Headers', [b'authorization'])
+
+    # Flask 쪽 응답과 같은 CORS header
+    resource.render_OPTIONS(request)
+    assert request.responseHeaders.getRawHeaders(b'Access-Control-Allow-Origin') == [b'http://example.com']
+    assert request.responseHeaders.getRawHeaders(b'Access-Control-Allow-Headers') == [b'authorization']
+
+    # 인증 실패(401) 응답에도 CORS header가 있어야 브라우저가 읽을 수 있음
+    request = DummyRequest([b'stream'])
+    resource.app.config['JWT_SECRET_KEY'] = 'test'
+    resource.render_GET(request)
+    assert request.responseCode == 401
+    assert request.responseHeaders.getRawHeaders(b'Access-Control-Allow-Origin') == [b'*']
+
+def test_access_log_redacts_token():
+    request = DummyRequest([b'timeline', b'stream'])
+    request.uri         = b'/timeline/stream?access_token=secret.jwt.token&x=1'
+    request.clientproto = b'HTTP/1.1'
+    request.code        = 200
+    request.sentLength  = 0
+
+    line = redacted_log_formatter('[timestamp]', request)
+    assert 'secret' not in line
+    assert '/timeline/stream?access_token=[redacted]&x=1' in line
+    assert request.uri == b'/timeline/stream?access_token=secret.jwt.token&x=1'
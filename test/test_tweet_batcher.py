@@ -0,0 +1,122 @@
+import sys, os, time, threading
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+from contextlib import contextmanager
+from model import TweetDao, ShardRouter
+from model.tweet_batcher import TweetBatcher, PartialInsertError
+
+class FakeDao:
+    def __init__(self, delay=0.01):
+        self.delay   = delay
+        self.batches = []
+        self.next_id = 1
+
+    def insert_tweets(self, tweets):
+        time.sleep(self.delay)
+        if any(tweet == 'fail' for _, tweet in tweets):
+            raise ValueError('fail')
+
+        self.batches.append(tweets)
+        tweet_ids     = list(range(self.next_id, self.next_id + len(tweets)))
+        self.next_id += len(tweets)
+        return tweet_ids
+
+def submit_all(batcher, tweets):
+    results = {}
+
+    def submit(i, user_id, tweet):
+        try:
+            results[i] = batcher.submit(user_id, tweet)
+        except ValueError as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(i, *tweet)) for i, tweet in enumerate(tweets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [results[i] for i in range(len(tweets))]
+
+def test_batch():
+    dao     = FakeDao()
+    batcher = TweetBatcher(dao.insert_tweets, batch_size=10, max_delay=0.05)
+
+    # 동시 요청은 batch_size 이하로 묶여서 저장되고, 각 요청은 자기 tweet의 id를 받음
+    tweet_ids = submit_all(batcher, [(i, f'tweet {i}') for i in range(25)])
+    assert sorted(tweet_ids) == list(range(1, 26))
+    assert all(len(batch) <= 10 for batch in dao.batches)
+    assert len(dao.batches) < 25
+
+    saved = [tweet for batch in dao.batches for _, tweet in batch]
+    assert [saved[tweet_id - 1] for tweet_id in tweet_ids] == [f'tweet {i}' for i in range(25)]
+
+def test_deadline():
+    dao     = FakeDao(delay=0)
+    batcher = TweetBatcher(dao.insert_tweets, batch_size=100, max_delay=0.02)
+
+    # batch가 다 차지 않아도 max_delay 후에 저장
+    started = time.monotonic()
+    assert batcher.submit(1, 'tweet') == 1
+    assert 0.015 <= time.monotonic() - started < 1
+    assert dao.batches == [[(1, 'tweet')]]
+
+def test_failure():
+    dao     = FakeDao()
+    batcher = TweetBatcher(dao.insert_tweets, batch_size=10, max_delay=0.05)
+
+    # 실패한 tweet의 요청만 오류를 받고 나머지는 저장됨
+    results = submit_all(batcher, [(1, 'ok'), (2, 'fail'), (3, 'ok')])
+    assert isinstance(results[1], ValueError)
+    assert sorted([results[0], results[2]]) == [1, 2]
+
+class FakeShardedDao(FakeDao):
+    # 홀수 사용자의 shard는 처음 한 번 실패
+    def __init__(self):
+        super().__init__(delay=0)
+        self.failed = False
+
+    def insert_tweets(self, tweets):
+        if self.failed or not any(user_id % 2 for user_id, _ in tweets):
+            return super().insert_tweets(tweets)
+
+        self.failed = True
+        committed   = [(user_id, tweet) for user_id, tweet in tweets if user_id % 2 == 0]
+        ids         = iter(super().insert_tweets(committed))
+        raise PartialInsertError([None if user_id % 2 else next(ids) for user_id, _ in tweets], ValueError('shard down'))
+
+def test_partial_failure():
+    dao     = FakeShardedDao()
+    batcher = TweetBatcher(dao.insert_tweets, batch_size=10, max_delay=0.05)
+
+    # 실패한 shard의 tweet만 다시 저장하므로 commit 된 tweet이 중복 저장되지 않음
+    tweet_ids = submit_all(batcher, [(user_id, f'tweet {user_id}') for user_id in range(1, 5)])
+    saved     = [tweet for batch in dao.batches for tweet in batch]
+    assert sorted(saved) == [(user_id, f'tweet {user_id}') for user_id in range(1, 5)]
+    assert [saved[tweet_id - 1] for tweet_id in tweet_ids] == [(user_id, f'tweet {user_id}') for user_id in range(1, 5)]
+
+# INSERT만 세는 engine
+class FakeEngine:
+    def __init__(self):
+        self.inserted = 0
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, query, params):
+        if 'INSERT INTO tweets' in str(query):
+            self.inserted += 1
+        return type('Result', (), {'lastrowid' : self.inserted})()
+
+class FailingPins:
+    def delete(self, *keys):
+        raise ConnectionError('redis down')
+
+def test_post_commit_failure():
+    # commit 한 뒤 pin(Redis)이 실패해도 batch를 실패로 보고 하나씩 다시 저장하지 않음
+    engine  = FakeEngine()
+    dao     = TweetDao(ShardRouter([engine], [[FakeEngine()]], pins=FailingPins()))
+    batcher = TweetBatcher(dao.insert_tweets, batch_size=10, max_delay=0.05)
+
+    assert sorted(submit_all(batcher, [(1, f'tweet {i}') for i in range(5)])) == [1, 2, 3, 4, 5]
+    assert engine.inserted == 1
@@ -0,0 +1,146 @@
+import sys, os, time, threading
+sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+import pytest
+from model.tweet_spool import TweetSpool, read_records
+
+class FakeDao:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.saved    = []
+        self.keys     = []
+
+    def insert_tweets(self, tweets):
+        if self.failures or any(tweet == 'poison' for _, _, tweet in tweets):
+            self.failures = max(self.failures - 1, 0)
+            self.keys.append([key for key, _, _ in tweets])
+            raise ValueError('fail')
+        self.saved.extend((user_id, tweet) for _, user_id, tweet in tweets)
+        self.keys.append([key for key, _, _ in tweets])
+        return list(range(len(tweets)))
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_drain(tmp_path):
+    spool = TweetSpool(str(tmp_path), segment_size=100, batch_size=3)
+    dao   = FakeDao()
+    spool.start(dao.insert_tweets)
+
+    # segment를 넘어가도 순서대로 저장되고, 처리한 segment는 삭제
+    for i in range(10):
+        spool.append(i, f'tweet {i}')
+    wait_for(lambda: len(dao.saved) == 10)
+    assert dao.saved == [(i, f'tweet {i}') for i in range(10)]
+    wait_for(lambda: spool.pending() == 0)
+    spool.close()
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.log')]) == 1
+
+def test_group_commit(tmp_path):
+    spool = TweetSpool(str(tmp_path))
+    threads = [threading.Thread(target=spool.append, args=(i, 'tweet')) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # append가 반환되면 fsync 된 상태
+    assert spool.synced == spool.appended == 50
+    spool.close()
+
+def test_replay(tmp_path):
+    # 저장하지 못하고 종료된 tweet은 다시 열 때 처리
+    spool = TweetSpool(str(tmp_path), segment_size=100)
+    for i in range(5):
+        spool.append(i, 'before crash')
+    spool.close()
+
+    spool = TweetSpool(str(tmp_path), segment_size=100)
+    assert spool.pending() == 5
+    dao = FakeDao()
+    spool.start(dao.insert_tweets)
+    spool.append(5, 'after restart')
+    wait_for(lambda: len(dao.saved) == 6)
+    wait_for(lambda: spool.pending() == 0)
+    spool.close()
+    assert dao.saved == [(i, 'before crash') for i in range(5)] + [(5, 'after restart')]
+
+    # 이미 저장한 tweet은 다시 처리하지 않음
+    spool = TweetSpool(str(tmp_path), segment_size=100)
+    assert spool.pending() == 0
+    spool.close()
+
+def test_torn_write(tmp_path):
+    spool = TweetSpool(str(tmp_path))
+    spool.append(1, 'complete')
+    spool.append(2, 'torn')
+    spool.close()
+
+    # 쓰는 도중 종료되어 잘린 마지막 record는 무시하고 잘라냄
+    path = os.path.join(tmp_path, 'spool-0000000000.log')
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    spool = TweetSpool(str(tmp_path))
+    assert spool.pending() == 1
+    spool.append(3, 'next')
+    dao = FakeDao()
+    spool.start(dao.insert_tweets)
+    wait_for(lambda: len(dao.saved) == 2)
+    spool.close()
+    assert dao.saved == [(1, 'complete'), (3, 'next')]
+
+def test_retry(tmp_path):
+    spool = TweetSpool(str(tmp_path))
+    dao   = FakeDao(failures=2)
+    spool.start(dao.insert_tweets, retry_delay=0.01)
+
+    # DB 저장이 실패하면 같은 위치부터 같은 key로 다시 시도
+    spool.append(1, 'tweet')
+    wait_for(lambda: dao.saved == [(1, 'tweet')])
+    spool.close()
+    assert len(dao.keys) == 3 and len({key for keys in dao.keys for key in keys}) == 1
+
+def test_dead_letter(tmp_path):
+    spool = TweetSpool(str(tmp_path))
+    dao   = FakeDao()
+    for i, tweet in enumerate(['first', 'poison', 'last']):
+        spool.append(i, tweet)
+    spool.start(dao.insert_tweets, retry_delay=0.001, max_attempts=3)
+
+    # 계속 실패하는 tweet은 max_attempts번 시도한 뒤 dead-letter.log로 옮기고 다음 tweet을 저장
+    wait_for(lambda: dao.saved == [(0, 'first'), (2, 'last')])
+    spool.close()
+    records, _ = read_records(os.path.join(tmp_path, 'dead-letter.log'), 0, None, None)
+    assert [(record['user_id'], record['tweet']) for record in records] == [(1, 'poison')]
+
+def test_corrupt_segment(tmp_path):
+    # segment_size=1: record마다 segment 하나
+    spool = TweetSpool(str(tmp_path), segment_size=1)
+    for i in range(3):
+        spool.append(i, f'tweet {i}')
+    spool.close()
+
+    # 중간 segment의 record가 손상되면 그 segment를 건너뛰고 다음 segment를 처리 (CPU를 쓰며 멈추지 않음)
+    path = os.path.join(tmp_path, 'spool-0000000001.log')
+    with open(path, 'r+b') as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b'xx')
+
+    spool = TweetSpool(str(tmp_path), segment_size=1)
+    dao   = FakeDao()
+    spool.start(dao.insert_tweets)
+    wait_for(lambda: len(dao.saved) == 2)
+    wait_for(lambda: spool.pending() == 0)
+    spool.close()
+    assert dao.saved == [(0, 'tweet 0'), (2, 'tweet 2')]
+    assert os.path.exists(path + '.corrupt')
+
+def test_single_process(tmp_path):
+    spool = TweetSpool(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        TweetSpool(str(tmp_path))
+    spool.close()
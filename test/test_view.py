@@ -5,6 +5,7 @@ sys.path.append(os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
 import config
 
 from app import create_app
+from view.miniter_pb2 import Timeline
 from sqlalchemy import create_engine, text
 from unittest import mock
 
@@ -78,6 +79,15 @@ def setup_function():
                             "user2 test tweet"
                         )"""
                     ))
+    database.execute(text("""
+        INSERT INTO timelines (
+            user_id,
+            tweet_id
+        ) VALUES (
+            2,
+            1
+        )
+    """))
 
 # test 실행 후 
 def teardown_function():
@@ -85,6 +95,7 @@ def teardown_function():
     database.execute(text("TRUNCATE users"))
     database.execute(text("TRUNCATE tweets"))
     database.execute(text("TRUNCATE users_follow_list"))
+    database.execute(text("TRUNCATE timelines"))
     database.execute(text("SET FOREIGN_KEY_CHECKS=1"))
 
 def test_ping(api):
@@ -151,12 +162,45 @@ def test_tweet(api):
         'user_id'  : 1, 
         'timeline' : [
             {
+                'id'      : 2,
                 'user_id' : 1,
                 'tweet'   : "user1 test tweet"
             }
-        ]
+        ],
+        'next_cursor' : None
     }
 
+def test_tweet_idempotency(api):
+    resp = api.post(
+        '/login',
+        data         = json.dumps({'email' : 'test@test.com', 'password' : '1234'}),
+        content_type = 'application/json'
+    )
+    access_token = json.loads(resp.data.decode('utf-8'))['access_token']
+
+    # 같은 Idempotency-Key로 재시도하면 tweet은 한 번만 저장되고 첫 응답을 다시 받음
+    for _ in range(2):
+        resp = api.post(
+            '/tweet',
+            data         = json.dumps({'tweet' : "retried tweet"}),
+            content_type = 'application/json',
+            headers      = {'Authorization' : access_token, 'Idempotency-Key' : 'tweet-1'}
+        )
+        assert resp.status_code == 200
+    assert resp.headers['Idempotent-Replayed'] == 'true'
+
+    resp = api.get('/timeline/1')
+    assert [tweet['tweet'] for tweet in json.loads(resp.data)['timeline']] == ["retried tweet"]
+
+    # 같은 key를 다른 tweet에 쓰면 422
+    resp = api.post(
+        '/tweet',
+        data         = json.dumps({'tweet' : "other tweet"}),
+        content_type = 'application/json',
+        headers      = {'Authorization' : access_token, 'Idempotency-Key' : 'tweet-1'}
+    )
+    assert resp.status_code == 422
+
 def test_follow(api):
     # 로그인
     resp = api.post(
@@ -174,7 +218,8 @@ def test_follow(api):
     assert resp.status_code == 200
     assert tweets           == {
         'user_id'  : 1,
-        'timeline' : [ ]
+        'timeline' : [ ],
+        'next_cursor' : None
     }
 
     # follow 유저 아이디 = 2
@@ -195,10 +240,12 @@ def test_follow(api):
         'user_id' : 1,
         'timeline' : [
             {
+                'id'      : 1,
                 'user_id' : 2,
                 'tweet'   : "test tweet"
             }
-        ]
+        ],
+        'next_cursor' : None
     }
 
 def test_unfollow(api):
@@ -229,10 +276,12 @@ def test_unfollow(api):
         "user_id"  : 1,
         "timeline" : [
             {
+                "id"      : 1,
                 "user_id" : 2,
                 "tweet"   : "test tweet"
             }
-        ]
+        ],
+        "next_cursor" : None
     }
 
     # unfollow 유저 아이디 = 2
@@ -251,9 +300,48 @@ def test_unfollow(api):
     assert resp.status_code == 200
     assert tweets           == {
         "user_id"  : 1,
-        "timeline" : [ ]
+        "timeline" : [ ],
+        "next_cursor" : None
     }
 
+def test_follows(api):
+    # 로그인
+    resp = api.post(
+        '/login',
+        data         = json.dumps({'email' : 'test@test.com', 'password' : '1234'}),
+        content_type = 'application/json'
+    )
+    access_token = json.loads(resp.data.decode('utf-8'))['access_token']
+
+    # 일괄 follow: 이미 팔로우 중인 id는 다시 요청해도 오류 없이 무시
+    for followed in [[2], []]:
+        resp = api.post(
+            '/follows',
+            data         = json.dumps({'follow' : [2, 2]}),
+            content_type = 'application/json',
+            headers      = {'Authorization' : access_token}
+        )
+        assert resp.status_code == 200
+        assert json.loads(resp.data.decode('utf-8')) == {'followed' : followed}
+
+    resp   = api.get('/timeline/1')
+    tweets = json.loads(resp.data.decode('utf-8'))
+    assert [tweet['id'] for tweet in tweets['timeline']] == [1]
+
+    for unfollowed in [[2], []]:
+        resp = api.post(
+            '/unfollows',
+            data         = json.dumps({'unfollow' : [2]}),
+            content_type = 'application/json',
+            headers      = {'Authorization' : access_token}
+        )
+        assert resp.status_code == 200
+        assert json.loads(resp.data.decode('utf-8')) == {'unfollowed' : unfollowed}
+
+    resp   = api.get('/timeline/1')
+    tweets = json.loads(resp.data.decode('utf-8'))
+    assert tweets['timeline'] == []
+
 def test_save_and_get_profile_picture(api):
     # 로그인
     resp = api.post(
@@ -278,4 +366,136 @@ def test_save_and_get_profile_picture(api):
     resp = api.get('/profile-picture/1')
     data = json.loads(resp.data.decode('utf-8'))
 
-    assert data['img_url'] == f"{config.test_config['S3_BUCKET_URL']}profile.png"
\ No newline at end of file
+    assert data['img_url'] == f"{config.test_config['S3_BUCKET_URL']}profile.png"
+
+def test_timeline_pagination(api):
+    for tweet_id in range(2, 5):
+        database.execute(text("""
+            INSERT INTO tweets (id, user_id, tweet) VALUES (:id, 2, 'tweet')
+        """), {'id' : tweet_id})
+        database.execute(text("""
+            INSERT INTO timelines (user_id, tweet_id) VALUES (2, :id)
+        """), {'id' : tweet_id})
+
+    resp = api.get('/timeline/2?limit=2')
+    page = json.loads(resp.data.decode('utf-8'))
+
+    assert resp.status_code == 200
+    assert [tweet['id'] for tweet in page['timeline']] == [4, 3]
+    assert page['next_cursor'] == 3
+
+    resp = api.get(f"/timeline/2?limit=2&before={page['next_cursor']}")
+    page = json.loads(resp.data.decode('utf-8'))
+
+    assert [tweet['id'] for tweet in page['timeline']] == [2, 1]
+    assert page['next_cursor'] == 1
+
+    resp = api.get('/timeline/2?limit=0')
+    assert resp.status_code == 400
+
+def test_timeline_stream(api):
+    # streaming 모드는 limit이 없으면 전체 timeline을 반환
+    resp   = api.get('/timeline/2?stream=1')
+    tweets = json.loads(resp.data.decode('utf-8'))
+
+    assert resp.status_code == 200
+    assert tweets == {
+        'user_id'     : 2,
+        'timeline'    : [
+            {
+                'id'      : 1,
+                'user_id' : 2,
+                'tweet'   : "user2 test tweet"
+            }
+        ],
+        'next_cursor' : None
+    }
+
+    # protobuf를 더 선호해도 JSON을 받을 수 있으면 JSON과 JSON ETag로 응답
+    resp = api.get('/timeline/2?stream=1', headers = {'Accept' : 'application/x-protobuf, application/json;q=0.5'})
+    assert resp.mimetype == 'application/json'
+    assert resp.headers['ETag'] == api.get('/timeline/2?stream=1').headers['ETag']
+
+    # protobuf만 받을 수 있으면 406
+    resp = api.get('/timeline/2?stream=1', headers = {'Accept' : 'application/x-protobuf'})
+    assert resp.status_code == 406
+
+def test_timeline_etag(api):
+    # 로그인
+    resp = api.post(
+        '/login',
+        data         = json.dumps({'email' : 'test@test.com', 'password' : '1234'}),
+        content_type = 'application/json'
+    )
+    access_token = json.loads(resp.data.decode('utf-8'))['access_token']
+
+    resp = api.get('/timeline/1')
+    etag = resp.headers['ETag']
+    assert resp.status_code == 200
+
+    # 바뀐 것이 없으면 304
+    resp = api.get('/timeline/1', headers = {'If-None-Match' : etag})
+    assert resp.status_code == 304
+    assert resp.data        == b''
+
+    # follow 하면 timeline이 바뀌므로 200
+    api.post(
+        '/follow',
+        data         = json.dumps({'follow' : 2}),
+        content_type = 'application/json',
+        headers      = {'Authorization' : access_token}
+    )
+    resp = api.get('/timeline/1', headers = {'If-None-Match' : etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+def test_timeline_since(api):
+    resp   = api.get('/timeline/2?since=1')
+    tweets = json.loads(resp.data.decode('utf-8'))
+
+    assert resp.status_code  == 200
+    assert tweets['timeline'] == []
+
+def test_timelines(api):
+    resp      = api.get('/timelines?user_id=2&user_id=1&limit=1')
+    timelines = json.loads(resp.data.decode('utf-8'))
+
+    assert resp.status_code == 200
+    assert timelines == {
+        'timelines' : [
+            {
+                'user_id'     : 2,
+                'timeline'    : [
+                    {
+                        'id'      : 1,
+                        'user_id' : 2,
+                        'tweet'   : "user2 test tweet"
+                    }
+                ],
+                'next_cursor' : 1
+            }, {
+                'user_id'     : 1,
+                'timeline'    : [],
+                'next_cursor' : None
+            }
+        ]
+    }
+
+def test_timeline_protobuf(api):
+    resp = api.get('/timeline/2', headers={'Accept' : 'application/x-protobuf'})
+
+    assert resp.status_code == 200
+    assert resp.mimetype    == 'application/x-protobuf'
+    assert 'Accept' in resp.headers['Vary']
+
+    timeline = Timeline.FromString(resp.data)
+    assert timeline.user_id == 2
+    assert [(tweet.id, tweet.user_id, tweet.tweet) for tweet in timeline.timeline] == [(1, 2, "user2 test tweet")]
+    assert not timeline.HasField('next_cursor')
+
+    # JSON 응답과 ETag가 달라야 함
+    json_resp = api.get('/timeline/2')
+    assert json_resp.mimetype == 'application/json'
+    assert resp.headers.get('ETag') is not None
+    assert json_resp.headers.get('ETag') is not None
+    assert resp.headers['ETag'] != json_resp.headers['ETag']
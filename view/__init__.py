@@ -1,10 +1,19 @@
 import jwt
+import json
+import time
+import base64
+import hashlib
 
 from flask import request, jsonify, current_app, Response, g, send_file
 from flask.json import JSONEncoder
 from functools import wraps
 from werkzeug.utils import secure_filename
 
+from .miniter_pb2 import Timeline, Timelines, Login, ProfilePicture
+from service import PasswordHasherBusy
+
+PROTOBUF_MIMETYPE = 'application/x-protobuf'
+
 class CustomJSONEncoder(JSONEncoder):
     def default(self, obj):
         if isinstance(obj, set):
@@ -15,34 +24,140 @@ def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         access_token = request.headers.get('Authorization')
-        if access_token is not None:
-            try:
-                payload = jwt.decode(access_token, current_app.config['JWT_SECRET_KEY'], 'HS256')
-            except jwt.InvalidTokenError:
-                payload = None
-            
-            if payload is None: return Response(status=401)
-
-            user_id = payload['user_id']
-            g.user_id = user_id
-        else:
+        if access_token is None:
             return Response(status=401)
+
+        user_id = verify_access_token(access_token)
+        if user_id is None:
+            return Response(status=401)
+
+        g.user_id = user_id
         return f(*args, **kwargs)
     return decorated_function
 
+# 검증한 token의 user_id를 token의 digest로 token_cache(LRUCache)에 저장해 두고
+# 다시 오면 jwt.decode(서명 검증, claim parsing) 없이 exp 전까지 그대로 사용
+def verify_access_token(access_token):
+    token_cache = current_app.services.token_cache
+    if token_cache is not None:
+        key    = hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+        cached = token_cache.get(key, 'user_id')
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+
+    try:
+        payload = jwt.decode(access_token, current_app.config['JWT_SECRET_KEY'], 'HS256')
+    except jwt.InvalidTokenError:
+        return None
+
+    if token_cache is not None and 'exp' in payload:
+        token_cache.set(key, 'user_id', (payload['user_id'], payload['exp']))
+    return payload['user_id']
+
+# Idempotency-Key 헤더가 있는 POST 요청은 첫 응답을 저장해 두었다가 같은 key로 재시도하면 그대로 다시 응답
+# (같은 key를 다른 요청 본문에 쓰면 422, 첫 요청이 아직 처리 중이면 409)
+# login_required 아래에 두어서 key는 사용자/경로별로 구분, 로그인 없는 요청(sign-up)은 요청 본문별로 구분
+# 처리 중 표시는 저장소의 짧은 TTL(IDEMPOTENCY_LOCK_TTL)로 만료되고, 응답을 저장할 때 IDEMPOTENCY_TTL로 연장
+# (처리 중에 종료되어도 짧은 시간만 409) 5xx 응답은 저장하지 않아 재시도 시 다시 처리
+def idempotent(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is None or current_app.services.idempotency_store is None:
+            return f(*args, **kwargs)
+        if len(idempotency_key) > 255:
+            return 'Idempotency-Key가 너무 깁니다.', 400
+
+        store       = current_app.services.idempotency_store
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        scope       = g.get('user_id') or f'anonymous:{fingerprint}'
+        key         = f"{scope}:{request.path}:{idempotency_key}"
+        if not store.add(key, 'fingerprint', fingerprint):
+            if store.get(key, 'fingerprint') != fingerprint:
+                return 'Idempotency-Key가 다른 요청에 사용되었습니다.', 422
+
+            saved = store.get(key, 'response')
+            if saved is None:
+                return Response('이전 요청을 처리 중입니다.', status=409, headers={'Retry-After' : '1'})
+
+            response = Response(base64.b64decode(saved['body']), status=saved['status'], headers=saved['headers'])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            store.delete(key)
+            raise
+
+        if response.status_code >= 500:
+            store.delete(key)
+        else:
+            # 처리하는 동안 처리 중 표시가 만료되었을 수 있으므로 fingerprint도 다시 저장
+            store.set(key, 'fingerprint', fingerprint)
+            store.set(key, 'response', {
+                'status'  : response.status_code,
+                'headers' : [[name, value] for name, value in response.headers if name != 'Content-Length'],
+                'body'    : base64.b64encode(response.get_data()).decode('ascii')
+            })
+            store.expire(key, current_app.config.get('IDEMPOTENCY_TTL', 86400))
+        return response
+    return decorated_function
+
+# 조건부 GET을 위한 ETag (클라이언트가 매번 If-None-Match로 재검증하도록 no-cache)
+def with_etag(response, version):
+    if version is not None:
+        response.set_etag(version)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept')
+    return response
+
+# Accept 헤더가 JSON보다 protobuf를 선호하는지
+def wants_protobuf():
+    return request.accept_mimetypes.best_match(['application/json', PROTOBUF_MIMETYPE]) == PROTOBUF_MIMETYPE
+
+# Accept: application/x-protobuf 이면 message로 직렬화, 아니면 JSON
+def negotiate(message, data):
+    if wants_protobuf():
+        response = Response(message(**data).SerializeToString(), mimetype=PROTOBUF_MIMETYPE)
+    else:
+        response = jsonify(data)
+    response.vary.add('Accept')
+    return response
+
+# 표현(JSON/protobuf)마다 ETag가 달라야 하므로 protobuf 응답의 버전에는 구분자를 붙임
+def representation_version(version):
+    if version is not None and wants_protobuf():
+        return f'{version}-pb'
+    return version
+
 def create_endpoints(app, services):
     app.json_encoder = CustomJSONEncoder
 
     user_service = services.user_service
     tweet_service = services.tweet_service
 
+    # bcrypt thread pool이 가득 찬 경우 (로그인/회원가입 폭주) 기다리지 않고 재시도 요청
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(e):
+        return Response(status=503, headers={'Retry-After' : str(app.config.get('BCRYPT_RETRY_AFTER', 1))})
+
     # ping test
     @app.route("/ping", methods=['GET'])
     def ping():
         return "pong"
 
+    # 캐시 hit/miss/eviction 통계
+    @app.route("/stats", methods=['GET'])
+    def stats():
+        return jsonify({
+            'timeline_cache'  : tweet_service.cache.stats() if tweet_service.cache is not None else None,
+            'password_hasher' : user_service.password_hasher.stats()
+        })
+
     # 회원가입 엔드포인트
     @app.route('/sign-up', methods=['POST'])
+    @idempotent
     def sign_up():
         new_user = request.json
         new_user = user_service.create_new_user(new_user)
@@ -52,28 +167,28 @@ def create_endpoints(app, services):
     @app.route('/login', methods=['POST'])
     def login():
         credential = request.json
-        authorized = user_service.login(credential)
+        principal = user_service.login(credential)
 
-        if authorized:
-            user_credential = user_service.get_user_id_and_password(credential['email'])
-            user_id = user_credential['id']
-            token = user_service.generate_access_token(user_id)
-
-            return jsonify({
-                'user_id' : user_id,
-                'access_token' : token.decode('utf-8')
-            })
-        else:
+        if principal is None:
             return '', 401
+        return negotiate(Login, principal)
     
     # tweet 엔드포인트
     @app.route('/tweet', methods=['POST'])
     @login_required
+    @idempotent
     def tweet():
         user_tweet = request.json
         tweet = user_tweet['tweet']
         user_id = g.user_id
 
+        # spool을 사용하면 spool에 기록(fsync)한 뒤 바로 응답하고 DB 저장은 background에서
+        if tweet_service.spool is not None:
+            result = tweet_service.enqueue_tweet(user_id, tweet)
+            if result is None:
+                return '300자를 초과했습니다.', 400
+            return '', 202
+
         result = tweet_service.tweet(user_id, tweet)
         if result is None:
             return '300자를 초과했습니다.', 400
@@ -82,6 +197,7 @@ def create_endpoints(app, services):
     # follow 엔드포인트
     @app.route('/follow', methods=['POST'])
     @login_required
+    @idempotent
     def follow():
         payload = request.json
         user_id = g.user_id
@@ -93,6 +209,7 @@ def create_endpoints(app, services):
     # unfollow 엔드포인트
     @app.route('/unfollow', methods=['POST'])
     @login_required
+    @idempotent
     def unfollow():
         payload = request.json
         user_id = g.user_id
@@ -100,26 +217,123 @@ def create_endpoints(app, services):
 
         user_service.unfollow(user_id, unfollow_id)
         return '', 200
+
+    # 여러 사용자 일괄 follow 엔드포인트 ({"follow": [id, ...]}), 이미 팔로우 중인 id는 무시
+    @app.route('/follows', methods=['POST'])
+    @login_required
+    @idempotent
+    def follows():
+        follow_ids = request.json['follow']
+        if len(follow_ids) > app.config.get('FOLLOW_BATCH_MAX_USERS', 100):
+            return 'follow가 너무 많습니다.', 400
+
+        followed = user_service.follow_many(g.user_id, follow_ids)
+        return jsonify({'followed' : followed})
+
+    # 여러 사용자 일괄 unfollow 엔드포인트 ({"unfollow": [id, ...]}), 팔로우 중이 아닌 id는 무시
+    @app.route('/unfollows', methods=['POST'])
+    @login_required
+    @idempotent
+    def unfollows():
+        unfollow_ids = request.json['unfollow']
+        if len(unfollow_ids) > app.config.get('FOLLOW_BATCH_MAX_USERS', 100):
+            return 'unfollow가 너무 많습니다.', 400
+
+        unfollowed = user_service.unfollow_many(g.user_id, unfollow_ids)
+        return jsonify({'unfollowed' : unfollowed})
     
+    # timeline 페이지 파라미터 (?limit=&before=<cursor>&since=<tweet_id>)
+    # streaming 모드(?stream=1)는 limit이 없으면 전체를 반환
+    def get_page_args():
+        stream = request.args.get('stream', 0, type=int) == 1
+        limit  = request.args.get('limit', None if stream else app.config.get('TIMELINE_PAGE_SIZE', 50), type=int)
+        before = request.args.get('before', type=int)
+        since  = request.args.get('since', type=int)
+
+        if limit is not None and limit < 1:
+            return None
+        if not stream:
+            limit = min(limit, app.config.get('TIMELINE_MAX_PAGE_SIZE', 200))
+        return stream, limit, before, since
+
+    def timeline_response(user_id, stream, limit, before, since):
+        # streaming 응답은 JSON뿐이므로 JSON을 받을 수 없는 요청은 406, ETag도 JSON 버전
+        if stream and wants_protobuf() and request.accept_mimetypes.best_match(['application/json']) is None:
+            return 'stream=1은 JSON 응답만 지원합니다.', 406
+
+        # 버전이 같으면 timeline 조회 없이 304
+        version = tweet_service.get_timeline_version(user_id)
+        if not stream:
+            version = representation_version(version)
+        if version is not None and request.if_none_match.contains(version):
+            return with_etag(Response(status=304), version)
+
+        if stream:
+            return with_etag(Response(stream_timeline(user_id, limit, before, since), mimetype='application/json'), version)
+
+        timeline = tweet_service.get_timeline(user_id, limit, before, since)
+
+        return with_etag(negotiate(Timeline, {
+            'user_id'     : user_id,
+            'timeline'    : timeline,
+            'next_cursor' : timeline[-1]['id'] if len(timeline) == limit else None
+        }), version)
+
+    # timeline JSON을 tweet 단위로 만들어 내보냄 (응답 크기와 무관하게 메모리 사용량 일정)
+    def stream_timeline(user_id, limit, before, since):
+        timeline = tweet_service.iter_timeline(user_id, limit, before, since)
+        count    = 0
+        last_id  = None
+
+        yield f'{{"user_id": {json.dumps(user_id)}, "timeline": ['
+        for tweet in timeline:
+            yield (', ' if count else '') + json.dumps(tweet, ensure_ascii=False)
+            count  += 1
+            last_id = tweet['id']
+
+        next_cursor = last_id if count == limit else None
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
     # timeline/user_id 엔드포인트
     @app.route('/timeline/<int:user_id>', methods=['GET'])
     def timeline(user_id):
-        timeline = tweet_service.get_timeline(user_id)
+        page = get_page_args()
+        if page is None:
+            return 'limit은 1 이상이어야 합니다.', 400
 
-        return jsonify({
-            'user_id' : user_id,
-            'timeline' : timeline
-        })
+        return timeline_response(user_id, *page)
     
     # timeline 엔드포인트
     @app.route('/timeline', methods=['GET'])
     @login_required
     def user_timeline():
-        timeline = tweet_service.get_timeline(g.user_id)
+        page = get_page_args()
+        if page is None:
+            return 'limit은 1 이상이어야 합니다.', 400
 
-        return jsonify({
-            'user_id' : g.user_id,
-            'timeline' : timeline
+        return timeline_response(g.user_id, *page)
+
+    # 여러 사용자의 timeline 일괄 조회 엔드포인트 (?user_id=1&user_id=2...&limit=&before=&since=)
+    @app.route('/timelines', methods=['GET'])
+    def timelines():
+        page     = get_page_args()
+        user_ids = request.args.getlist('user_id', type=int)
+        if page is None:
+            return 'limit은 1 이상이어야 합니다.', 400
+        if len(user_ids) > app.config.get('TIMELINE_BATCH_MAX_USERS', 100):
+            return 'user_id가 너무 많습니다.', 400
+
+        _, limit, before, since = page
+        if limit is None:
+            limit = app.config.get('TIMELINE_PAGE_SIZE', 50)
+        timelines = tweet_service.get_timelines(user_ids, limit, before, since)
+
+        return negotiate(Timelines, {
+            'timelines' : [{
+                'user_id'     : user_id,
+                'timeline'    : timeline,
+                'next_cursor' : timeline[-1]['id'] if len(timeline) == limit else None
+            } for user_id, timeline in timelines.items()]
         })
 
     # profile-picture 등록 엔드포인트
@@ -143,10 +357,14 @@ def create_endpoints(app, services):
     # profile-picture 조회 엔드포인트
     @app.route('/profile-picture/<int:user_id>', methods=['GET'])
     def get_profile_picture(user_id):
+        version = representation_version(user_service.get_profile_picture_version(user_id))
+        if version is not None and request.if_none_match.contains(version):
+            return with_etag(Response(status=304), version)
+
         profile_picture = user_service.get_profile_picture(user_id)
 
         if profile_picture:
-            return jsonify({'img_url':profile_picture})
+            return with_etag(negotiate(ProfilePicture, {'img_url':profile_picture}), version)
         else:
             return '', 404
         
\ No newline at end of file
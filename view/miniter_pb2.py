@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: miniter.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rminiter.proto\x12\x07miniter\"3\n\x05Tweet\x12\n\n\x02id\x18\x01 \x01(\x03\x12\x0f\n\x07user_id\x18\x02 \x01(\x03\x12\r\n\x05tweet\x18\x03 \x01(\t\"g\n\x08Timeline\x12\x0f\n\x07user_id\x18\x01 \x01(\x03\x12 \n\x08timeline\x18\x02 \x03(\x0b\x32\x0e.miniter.Tweet\x12\x18\n\x0bnext_cursor\x18\x03 \x01(\x03H\x00\x88\x01\x01\x42\x0e\n\x0c_next_cursor\"1\n\tTimelines\x12$\n\ttimelines\x18\x01 \x03(\x0b\x32\x11.miniter.Timeline\".\n\x05Login\x12\x0f\n\x07user_id\x18\x01 \x01(\x03\x12\x14\n\x0c\x61\x63\x63\x65ss_token\x18\x02 \x01(\t\"!\n\x0eProfilePicture\x12\x0f\n\x07img_url\x18\x01 \x01(\tb\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'miniter_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _TWEET._serialized_start=26
+  _TWEET._serialized_end=77
+  _TIMELINE._serialized_start=79
+  _TIMELINE._serialized_end=182
+  _TIMELINES._serialized_start=184
+  _TIMELINES._serialized_end=233
+  _LOGIN._serialized_start=235
+  _LOGIN._serialized_end=281
+  _PROFILEPICTURE._serialized_start=283
+  _PROFILEPICTURE._serialized_end=316
+# @@protoc_insertion_point(module_scope)
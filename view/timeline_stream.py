@@ -0,0 +1,177 @@
+import re
+import jwt
+import json
+
+from zope.interface import provider
+from twisted.internet import reactor, threads
+from twisted.internet.task import LoopingCall
+from twisted.web.http import combinedLogFormatter
+from twisted.web.iweb import IAccessLogFormatter
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.wsgi import WSGIResource
+
+# /timeline/stream 구독자 관리
+# WSGI thread에서 호출되는 publish/follow/unfollow는 reactor thread로 넘겨서 처리하므로
+# 구독자 상태는 reactor thread에서만 바뀐다.
+# 같은 app 노드에서 작성된 tweet만 전달된다.
+class TimelineBroker:
+    def __init__(self):
+        self.listeners   = {} # 작성자 id -> 해당 작성자의 tweet을 받을 request 집합
+        self.authors     = {} # request -> (구독자 id, 구독 중인 작성자 id 집합)
+        self.subscribers = {} # 구독자 id -> 구독자의 request 집합
+
+    def publish(self, author_id, tweet):
+        reactor.callFromThread(self.deliver, author_id, tweet)
+
+    def follow(self, user_id, follow_id):
+        reactor.callFromThread(self.update, user_id, follow_id, True)
+
+    def unfollow(self, user_id, unfollow_id):
+        reactor.callFromThread(self.update, user_id, unfollow_id, False)
+
+    def subscribe(self, request, user_id, follow_ids):
+        author_ids = {user_id, *follow_ids}
+        self.authors[request] = (user_id, author_ids)
+        self.subscribers.setdefault(user_id, set()).add(request)
+        for author_id in author_ids:
+            self.listeners.setdefault(author_id, set()).add(request)
+
+    def unsubscribe(self, request):
+        user_id, author_ids = self.authors.pop(request, (None, ()))
+        for author_id in author_ids:
+            self.remove_listener(author_id, request)
+
+        requests = self.subscribers.get(user_id)
+        if requests is not None:
+            requests.discard(request)
+            if not requests:
+                del self.subscribers[user_id]
+
+    def deliver(self, author_id, tweet):
+        event = f"data: {json.dumps(tweet, ensure_ascii=False)}\n\n".encode('utf-8')
+        for request in list(self.listeners.get(author_id, ())):
+            request.write(event)
+
+    # 팔로우/언팔로우 한 사용자의 연결만 변경
+    def update(self, user_id, author_id, following):
+        if author_id == user_id:
+            return
+        for request in self.subscribers.get(user_id, ()):
+            _, author_ids = self.authors[request]
+            if following:
+                author_ids.add(author_id)
+                self.listeners.setdefault(author_id, set()).add(request)
+            else:
+                author_ids.discard(author_id)
+                self.remove_listener(author_id, request)
+
+    def remove_listener(self, author_id, request):
+        requests = self.listeners.get(author_id)
+        if requests is not None:
+            requests.discard(request)
+            if not requests:
+                del self.listeners[author_id]
+
+# Server-Sent Events: 연결마다 WSGI worker thread를 잡지 않도록 reactor에서 직접 처리
+class TimelineStreamResource(Resource):
+    isLeaf = True
+
+    def __init__(self, app, user_service, broker, keepalive=15):
+        Resource.__init__(self)
+        self.app          = app
+        self.user_service = user_service
+        self.broker       = broker
+        self.keepalive    = keepalive
+
+    # Flask 쪽 CORS(app) 기본 설정과 같은 header (Origin을 그대로 허용)
+    def set_cors_headers(self, request):
+        origin = request.getHeader('Origin')
+        request.setHeader('Access-Control-Allow-Origin', origin or '*')
+        request.setHeader('Vary', 'Origin')
+
+    # Authorization header를 보내는 요청의 preflight
+    def render_OPTIONS(self, request):
+        self.set_cors_headers(request)
+        request.setHeader('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        requested = request.getHeader('Access-Control-Request-Headers')
+        if requested is not None:
+            request.setHeader('Access-Control-Allow-Headers', requested)
+        return b''
+
+    def render_GET(self, request):
+        self.set_cors_headers(request)
+
+        # EventSource는 header를 지정할 수 없으므로 ?access_token= 도 허용
+        access_token = request.getHeader('Authorization')
+        if access_token is None and b'access_token' in request.args:
+            access_token = request.args[b'access_token'][0].decode('utf-8')
+
+        try:
+            payload = jwt.decode(access_token, self.app.config['JWT_SECRET_KEY'], 'HS256')
+        except (jwt.InvalidTokenError, TypeError):
+            request.setResponseCode(401)
+            return b''
+
+        user_id = payload['user_id']
+        request.setHeader('Content-Type', 'text/event-stream; charset=utf-8')
+        request.setHeader('Cache-Control', 'no-cache')
+        request.write(b': connected\n\n')
+
+        subscription = {}
+
+        def subscribe(follow_ids):
+            if 'closed' in subscription:
+                return
+            self.broker.subscribe(request, user_id, follow_ids)
+            subscription['ping'] = LoopingCall(request.write, b': ping\n\n')
+            subscription['ping'].start(self.keepalive, now=False)
+
+        def unsubscribe(_):
+            subscription['closed'] = True
+            if 'ping' in subscription:
+                subscription['ping'].stop()
+                self.broker.unsubscribe(request)
+
+        def fail(failure):
+            if 'closed' not in subscription:
+                request.finish()
+
+        request.notifyFinish().addBoth(unsubscribe)
+
+        # 팔로우 목록 조회(DB)는 thread pool에서
+        deferred = threads.deferToThread(self.user_service.get_follow_ids, user_id)
+        deferred.addCallbacks(subscribe, fail)
+        return NOT_DONE_YET
+
+ACCESS_TOKEN_PARAM = re.compile(rb'(access_token=)[^&]*')
+
+# access log(Site)용: /timeline/stream?access_token= 의 token이 log에 남지 않도록 가린 uri로 기록
+@provider(IAccessLogFormatter)
+def redacted_log_formatter(timestamp, request):
+    return combinedLogFormatter(timestamp, RedactedRequest(request))
+
+class RedactedRequest:
+    def __init__(self, request):
+        self.request = request
+        self.uri     = ACCESS_TOKEN_PARAM.sub(rb'\1[redacted]', request.uri)
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+# Flask-Twisted의 root resource에 b'timeline'으로 등록
+# /timeline/stream 은 SSE로, 나머지 /timeline... 요청은 그대로 Flask(WSGI)로 넘긴다.
+class TimelineResource(Resource):
+    isLeaf = True
+
+    def __init__(self, app, stream_resource):
+        Resource.__init__(self)
+        self.wsgi   = WSGIResource(reactor, reactor.getThreadPool(), app)
+        self.stream = stream_resource
+
+    def render(self, request):
+        if request.postpath == [b'stream']:
+            return self.stream.render(request)
+
+        request.postpath.insert(0, request.prepath.pop())
+        return self.wsgi.render(request)